@@ -0,0 +1,171 @@
+import datetime
+import numpy as np
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from app_code.database import POOL_MAX_CONNECTIONS
+
+# Потоков загрузки: на второй странице аналитики одновременно грузятся три графика
+LOADER_THREADS = 3
+# Сколько ждать завершения запросов при закрытии окна, мс
+SHUTDOWN_TIMEOUT_MS = 3000
+WEEKDAY_LABELS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+class _TaskSignals(QObject):
+    # (ключ запроса, поколение, данные / текст ошибки)
+    finished = pyqtSignal(str, int, object)
+    failed = pyqtSignal(str, int, str)
+
+
+class _LoadTask(QRunnable):
+    def __init__(self, loader, key, generation, func, args):
+        super().__init__()
+        self.loader = loader
+        self.key = key
+        self.generation = generation
+        self.func = func
+        self.args = args
+
+    def run(self):
+        # Запрос, устаревший ещё в очереди, не выполняется вовсе
+        if self.loader.is_stale(self.key, self.generation):
+            return
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            self.loader.signals.failed.emit(self.key, self.generation, str(e))
+            return
+        self.loader.signals.finished.emit(self.key, self.generation, result)
+
+
+class AnalyticsLoader(QObject):
+    """Фоновая загрузка данных для графиков аналитики.
+
+    Запросы выполняются в пуле потоков на соединениях общего пула
+    DatabaseManager, результат приходит в главный поток сигналом loaded.
+    У каждого ключа (вида графика) учитывается поколение: новый запрос по
+    тому же ключу отменяет предыдущий — если тот ещё в очереди, он не
+    запускается, а если уже выполняется, его результат отбрасывается.
+    """
+    loaded = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        # Одно соединение пула остаётся запросам из главного потока
+        self.pool.setMaxThreadCount(min(LOADER_THREADS, POOL_MAX_CONNECTIONS - 1))
+        self._generations = {}
+        self.signals = _TaskSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+
+    def request(self, key, func, *args):
+        """Ставит в очередь func(*args); прежний запрос с тем же ключом отменяется"""
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        self.pool.start(_LoadTask(self, key, generation, func, args))
+
+    def cancel(self, key=None):
+        """Отменяет запрос по ключу или все запросы"""
+        for name in ([key] if key is not None else list(self._generations)):
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def is_stale(self, key, generation):
+        return self._generations.get(key) != generation
+
+    def shutdown(self):
+        """Отменяет все запросы и ждёт уже запущенные"""
+        self.cancel()
+        self.pool.clear()
+        self.pool.waitForDone(SHUTDOWN_TIMEOUT_MS)
+
+    def _on_finished(self, key, generation, result):
+        if not self.is_stale(key, generation):
+            self.loaded.emit(key, result)
+
+    def _on_failed(self, key, generation, message):
+        if not self.is_stale(key, generation):
+            self.failed.emit(key, message)
+
+
+# --- Загрузчики: выполняются в рабочих потоках, возвращают массивы numpy ---
+
+def load_sales_chart(db, date_from, date_to, username=None, by_sellers=False):
+    """Продажи за период по дням; при by_sellers — ещё и матрица дни × продавцы"""
+    rows = db.get_sales_data_for_period(date_from, date_to, None, username)
+    data = {
+        'dates': np.array([row[0] for row in rows], dtype=object),
+        'total_sales': np.array([row[1] for row in rows], dtype=np.int64),
+        'total_amount': np.array([float(row[2]) if row[2] else 0 for row in rows], dtype=float),
+        'total_quantity': np.array([row[3] for row in rows], dtype=np.int64),
+    }
+    if by_sellers:
+        data['sellers'] = db.get_sales_matrix(date_from, date_to)
+    return data
+
+
+def load_weekday_means(db, date_from=None, date_to=None, username=None):
+    """Среднее количество товара в продаже по дням недели (0=Пн, 6=Вс)"""
+    profile = db.get_weekday_profile(date_from, date_to, username)
+    return {'labels': WEEKDAY_LABELS, 'means': np.array(profile['averages'], dtype=float)}
+
+
+def load_top_categories(db, limit=5):
+    """Категории с наибольшим количеством проданного"""
+    with db.transaction() as cur:
+        cur.execute('''
+            SELECT category, SUM(quantity) as total_qty
+            FROM sales_daily_categories
+            GROUP BY category
+            ORDER BY total_qty DESC
+            LIMIT %s
+        ''', (limit,))
+        rows = cur.fetchall()
+    return {
+        'categories': [row[0] for row in rows],
+        'quantities': np.array([row[1] for row in rows], dtype=np.int64),
+    }
+
+
+def load_top_products(db, limit=5):
+    """Товары с наибольшим количеством проданного"""
+    with db.transaction() as cur:
+        cur.execute('''
+            SELECT COALESCE(p.name, d.product_name), SUM(d.quantity) as total_qty
+            FROM sales_daily_products d
+            LEFT JOIN products p ON p.id = d.product_id
+            GROUP BY 1
+            HAVING SUM(d.quantity) > 0
+            ORDER BY total_qty DESC
+            LIMIT %s
+        ''', (limit,))
+        rows = cur.fetchall()
+    return {
+        'products': [row[0] for row in rows],
+        'quantities': np.array([row[1] for row in rows], dtype=np.int64),
+    }
+
+
+def load_growth(db, limit=5):
+    """Товары с наибольшим приростом продаж: текущий месяц против предыдущего"""
+    today = datetime.date.today()
+    first_day_this_month = today.replace(day=1)
+    last_month = (first_day_this_month - datetime.timedelta(days=1)).replace(day=1)
+    with db.transaction() as cur:
+        # Оба месяца одним проходом: до сегодняшнего дня, как и раньше
+        cur.execute('''
+            SELECT COALESCE(p.name, d.product_name),
+                   COALESCE(SUM(d.quantity) FILTER (WHERE d.day >= %s), 0) AS qty_now,
+                   COALESCE(SUM(d.quantity) FILTER (WHERE d.day < %s), 0) AS qty_prev
+            FROM sales_daily_products d
+            LEFT JOIN products p ON p.id = d.product_id
+            WHERE d.day >= %s AND d.day < %s
+            GROUP BY 1
+        ''', (first_day_this_month, first_day_this_month, last_month, today))
+        rows = cur.fetchall()
+    names = np.array([row[0] for row in rows], dtype=object)
+    now = np.array([row[1] for row in rows], dtype=np.int64)
+    prev = np.array([row[2] for row in rows], dtype=np.int64)
+    diff = now - prev
+    top = np.argsort(-diff, kind='stable')[:limit]
+    return {'names': names[top], 'now': now[top], 'prev': prev[top], 'diff': diff[top]}
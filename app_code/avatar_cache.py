@@ -0,0 +1,191 @@
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from PIL import Image, ImageDraw, ImageOps
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter, QPixmap
+
+# Каталог кэша приложения и готовых аватаров (PNG с прозрачным фоном)
+CACHE_ROOT = Path.home() / '.warehouse_cache'
+AVATAR_CACHE_DIR = CACHE_ROOT / 'avatars'
+# Сколько готовых аватаров держать в памяти и на диске
+AVATAR_MEMORY_LIMIT = 512
+AVATAR_DISK_LIMIT = 2000
+# Круг рисуется с увеличением и уменьшается — так край получается сглаженным
+MASK_SUPERSAMPLE = 4
+AVATAR_THREADS = 2
+
+
+def render_avatar(photo_bytes: bytes, size: int) -> bytes:
+    """Круглый аватар size×size из исходного фото, PNG.
+
+    Вызывается в рабочем потоке: только PIL, без QPixmap.
+    """
+    image = Image.open(io.BytesIO(photo_bytes)).convert('RGBA')
+    # Заполнение квадрата с обрезкой по центру
+    image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    mask = Image.new('L', (size * MASK_SUPERSAMPLE, size * MASK_SUPERSAMPLE), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0) + mask.size, fill=255)
+    image.putalpha(mask.resize((size, size), Image.LANCZOS))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def placeholder_avatar(size: int) -> QPixmap:
+    """Круг с надписью «Нет фото» для пользователей без фотографии"""
+    pixmap = QPixmap(size, size)
+    pixmap.fill(Qt.transparent)
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.Antialiasing)
+    pen = painter.pen()
+    pen.setWidth(3)
+    pen.setColor(QColor('#888'))
+    painter.setPen(pen)
+    painter.setBrush(Qt.NoBrush)
+    painter.drawEllipse(0, 0, size - 1, size - 1)
+    painter.setPen(QColor('#aaa'))
+    font = painter.font()
+    font.setPointSize(13)
+    painter.setFont(font)
+    painter.drawText(pixmap.rect(), Qt.AlignCenter, "Нет фото")
+    painter.end()
+    return pixmap
+
+
+class _AvatarSignals(QObject):
+    # (логин, хэш фото, размер, QImage или None)
+    finished = pyqtSignal(str, str, int, object)
+
+
+def file_photo_hash(photo_path: str) -> Optional[str]:
+    """Ключ фото, сохранённого только файлом: путь и время изменения файла.
+
+    None, если файла нет.
+    """
+    try:
+        stat = os.stat(photo_path)
+    except OSError:
+        return None
+    return hashlib.md5(f"{photo_path}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+
+
+class _AvatarTask(QRunnable):
+    def __init__(self, cache, username, photo_hash, size, photo_path=None):
+        super().__init__()
+        self.cache = cache
+        self.username = username
+        self.photo_hash = photo_hash
+        self.size = size
+        self.photo_path = photo_path
+
+    def run(self):
+        image = None
+        try:
+            image = self.cache.load_image(self.username, self.photo_hash, self.size, self.photo_path)
+        except Exception as e:
+            print(f"Ошибка при подготовке аватара {self.username}: {e}")
+        self.cache.signals.finished.emit(self.username, self.photo_hash, self.size, image)
+
+
+class AvatarCache(QObject):
+    """Кэш круглых аватаров пользователей.
+
+    Ключ — (логин, photo_hash, размер): после смены фото меняется хэш, и
+    старая запись просто перестаёт запрашиваться. Готовые PNG хранятся на
+    диске (по хэшу и размеру) и в LRU в памяти. Промах обрабатывается в
+    пуле потоков: чтение с диска либо загрузка фото из БД, декодирование и
+    обрезка по кругу; результат приходит сигналом ready в главном потоке.
+
+    Фото, которые сохранены только файлом (users.photo_path без photo_data),
+    читаются с диска; их ключ — путь и время изменения файла.
+    """
+    ready = pyqtSignal(str, int, QPixmap)
+
+    def __init__(self, db, cache_dir=AVATAR_CACHE_DIR, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.cache_dir = Path(cache_dir)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(AVATAR_THREADS)
+        self.signals = _AvatarSignals()
+        self.signals.finished.connect(self._on_finished)
+        self._memory = OrderedDict()
+        self._pending = set()
+        self._placeholders = {}
+
+    def placeholder(self, size):
+        if size not in self._placeholders:
+            self._placeholders[size] = placeholder_avatar(size)
+        return self._placeholders[size]
+
+    def get(self, username, photo_hash, size, photo_path=None):
+        """Готовый аватар или None; при промахе ставит подготовку в очередь"""
+        if photo_hash:
+            photo_path = None
+        elif photo_path:
+            photo_hash = file_photo_hash(photo_path)
+        if not photo_hash:
+            return self.placeholder(size)
+        key = (username, photo_hash, size)
+        pixmap = self._memory.get(key)
+        if pixmap is not None:
+            self._memory.move_to_end(key)
+            return pixmap
+        if key not in self._pending:
+            self._pending.add(key)
+            self.pool.start(_AvatarTask(self, username, photo_hash, size, photo_path))
+        return None
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def _path(self, photo_hash, size):
+        return self.cache_dir / f"{photo_hash}_{size}.png"
+
+    def load_image(self, username, photo_hash, size, photo_path=None):
+        """Рабочий поток: QImage аватара из кэша на диске, из файла photo_path
+        или из фото в БД"""
+        path = self._path(photo_hash, size)
+        if path.exists():
+            image = QImage(str(path))
+            if not image.isNull():
+                return image
+        if photo_path:
+            photo_bytes = Path(photo_path).read_bytes()
+        else:
+            photo_bytes = self.db.get_user_photo(username)
+        if isinstance(photo_bytes, memoryview):
+            photo_bytes = photo_bytes.tobytes()
+        if not photo_bytes:
+            return None
+        png = render_avatar(photo_bytes, size)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(png)
+            self._prune_disk()
+        except OSError as e:
+            print(f"Ошибка при сохранении аватара в кэш: {e}")
+        return QImage.fromData(png, 'PNG')
+
+    def _prune_disk(self):
+        files = sorted(self.cache_dir.glob('*.png'), key=lambda f: f.stat().st_mtime)
+        for old in files[:max(0, len(files) - AVATAR_DISK_LIMIT)]:
+            old.unlink(missing_ok=True)
+
+    def _on_finished(self, username, photo_hash, size, image):
+        key = (username, photo_hash, size)
+        self._pending.discard(key)
+        if image is None or image.isNull():
+            pixmap = self.placeholder(size)
+        else:
+            pixmap = QPixmap.fromImage(image)
+        self._memory[key] = pixmap
+        self._memory.move_to_end(key)
+        while len(self._memory) > AVATAR_MEMORY_LIMIT:
+            self._memory.popitem(last=False)
+        self.ready.emit(username, size, pixmap)
@@ -0,0 +1,60 @@
+class BarcodeIndex:
+    """Штрихкод -> товар для добавления в корзину сканером.
+
+    Словарь загружается при первом обращении и дальше обновляется точечно по
+    ID из ленты изменений каталога (update) или целиком после переподключения
+    (reload). Штрихкод, которого нет в словаре, проверяется в базе по индексу:
+    товар мог быть добавлен раньше, чем пришло уведомление.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.products = None  # штрихкод -> товар (id, name, price, retail_price, barcode)
+        self.barcodes = {}  # ID товара -> штрихкод
+
+    def reload(self):
+        self.products = {}
+        self.barcodes = {}
+        for product in self.db.get_barcode_products():
+            self._put(product)
+
+    @property
+    def loaded(self):
+        return self.products is not None
+
+    def update(self, product_ids):
+        """Обновление по ID изменённых товаров; удалённые товары пропадают из словаря"""
+        if self.products is None:
+            return
+        self.apply(product_ids, self.db.get_barcode_products(product_ids))
+
+    def apply(self, product_ids, products):
+        """Применяет товары, уже прочитанные get_barcode_products(product_ids), —
+        чтение можно выполнить в фоновом потоке"""
+        if self.products is None:
+            return
+        fresh = {p["id"]: p for p in products}
+        for product_id in product_ids:
+            self._drop(product_id)
+            if product_id in fresh:
+                self._put(fresh[product_id])
+
+    def get(self, barcode):
+        if self.products is None:
+            self.reload()
+        product = self.products.get(barcode)
+        if product is None:
+            product = self.db.get_product_by_barcode(barcode)
+            if product:
+                self._put(product)
+        return product
+
+    def _put(self, product):
+        self._drop(product["id"])
+        self.products[product["barcode"]] = product
+        self.barcodes[product["id"]] = product["barcode"]
+
+    def _drop(self, product_id):
+        barcode = self.barcodes.pop(product_id, None)
+        if barcode is not None and self.products.get(barcode, {}).get("id") == product_id:
+            del self.products[barcode]
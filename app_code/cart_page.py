@@ -6,6 +6,8 @@ from PyQt5.QtCore import Qt, QTimer, QPoint
 from PyQt5.QtGui import QIcon, QFontMetrics
 import datetime
 from PyQt5.QtGui import QDoubleValidator
+from app_code.database import CHECKOUT_NOT_FOUND, CHECKOUT_INSUFFICIENT, CHECKOUT_INVALID_QUANTITY
+from app_code.product_images import ProductImageService, CART_THUMB
 
 class CartProductDetailWidget(QWidget):
     def __init__(self, item, on_apply_discount, parent=None):
@@ -54,13 +56,16 @@ class CartProductDetailWidget(QWidget):
         layout.setSpacing(10)
         # Фото
         if self.item.get('image'):
-            from PyQt5.QtGui import QPixmap
-            pixmap = QPixmap(self.item['image'])
-            if not pixmap.isNull():
-                img_label = QLabel()
-                img_label.setPixmap(pixmap.scaled(120, 90, Qt.KeepAspectRatio, Qt.SmoothTransformation))
-                img_label.setAlignment(Qt.AlignCenter)
-                layout.addWidget(img_label)
+            self.img_label = QLabel()
+            self.img_label.setFixedHeight(CART_THUMB[1])
+            self.img_label.setAlignment(Qt.AlignCenter)
+            layout.addWidget(self.img_label)
+            images = ProductImageService.instance()
+            pixmap = images.get(self.item['image'], CART_THUMB)
+            if pixmap is None:
+                images.ready.connect(self.on_thumbnail_ready)
+            else:
+                self.set_thumbnail(pixmap)
         # Название
         name_label = QLabel(f"<b>{self.item['name']}</b>")
         name_label.setStyleSheet("font-size: 18px; color: #43e97b;")
@@ -92,6 +97,17 @@ class CartProductDetailWidget(QWidget):
         btn_layout.addWidget(apply_btn)
         btn_layout.addWidget(close_btn)
         layout.addLayout(btn_layout)
+    def on_thumbnail_ready(self, path, width, height, pixmap):
+        if path == self.item['image'] and (width, height) == CART_THUMB[:2]:
+            ProductImageService.instance().ready.disconnect(self.on_thumbnail_ready)
+            self.set_thumbnail(pixmap)
+
+    def set_thumbnail(self, pixmap):
+        if pixmap.isNull():
+            self.img_label.hide()
+        else:
+            self.img_label.setPixmap(pixmap)
+
     def apply_discount(self):
         try:
             new_price = float(self.price_edit.text())
@@ -396,36 +412,35 @@ class CartPage(QWidget):
         if not self.cart_items:
             return
         try:
-            # Проверяем наличие всех товаров и их количество
-            for item in self.cart_items:
-                product = self.db.get_product_by_name(item["name"])
-                if not product:
-                    QMessageBox.warning(self, "Ошибка", f"Товар '{item['name']}' не найден в базе данных")
-                    return
-                if int(product["quantity"]) < item["quantity"]:
-                    QMessageBox.warning(self, "Ошибка", 
-                        f"Недостаточно товара '{item['name']}'. Доступно: {product['quantity']}, запрошено: {item['quantity']}")
-                    return
-
-            try:
-                # Записываем продажу и уменьшаем количество для каждого товара через add_sale
-                sale_date = datetime.datetime.now().strftime("%Y-%m-%d")
-                for item in self.cart_items:
-                    product = self.db.get_product_by_name(item["name"])
-                    self.db.add_sale(product["id"], item["quantity"], sale_date, self.username, float(item["price"]))
-                self.db.connection.commit()
-                # Очищаем корзину
-                self.clear_cart()
-                # Вызываем обновление каталога
-                if self.on_order_success:
-                    self.on_order_success()
-                # --- Новое: обновляем историю продаж, если она есть ---
-                if self.sales_history_page:
-                    self.sales_history_page.load_history()
-                QMessageBox.information(self, "Успех", "Заказ успешно оформлен!")
-            except Exception as e:
-                self.db.connection.rollback()
-                raise e
+            # Проверка остатков и запись всего заказа — одна транзакция в checkout
+            sale_date = datetime.datetime.now().astimezone()
+            results = self.db.checkout(self.cart_items, self.username, sale_date)
+            if results is None:
+                raise Exception("ошибка базы данных")
+            problems = []
+            for result in results:
+                if result["status"] == CHECKOUT_NOT_FOUND:
+                    problems.append(f"Товар '{result['name']}' не найден в базе данных")
+                elif result["status"] == CHECKOUT_INSUFFICIENT:
+                    problems.append(
+                        f"Недостаточно товара '{result['name']}'. Доступно: {result['available']}, запрошено: {result['requested']}"
+                    )
+                elif result["status"] == CHECKOUT_INVALID_QUANTITY:
+                    problems.append(
+                        f"Некорректное количество товара '{result['name']}': {result['requested']}"
+                    )
+            if problems:
+                QMessageBox.warning(self, "Ошибка", "\n".join(problems))
+                return
+            # Очищаем корзину
+            self.clear_cart()
+            # Вызываем обновление каталога
+            if self.on_order_success:
+                self.on_order_success()
+            # --- Новое: обновляем историю продаж, если она есть ---
+            if self.sales_history_page:
+                self.sales_history_page.load_history()
+            QMessageBox.information(self, "Успех", "Заказ успешно оформлен!")
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось оформить заказ: {str(e)}")
 
@@ -8,7 +8,11 @@ from PyQt5.QtGui import QPixmap, QPainter, QPainterPath, QIcon, QColor
 from app_code.dialogs import EditItemDialog 
 from app_code.widgets import HoverFrame, ProductCard
 from app_code.dialogs import AddItemDialog, AddCategoryDialog, DeleteCategoryDialog
-from app_code.database import DatabaseManager
+from app_code.database import DatabaseManager, CATALOG_PAGE_SIZE
+from app_code.change_listener import ProductChangeListener
+from app_code.analytics_loader import AnalyticsLoader
+from app_code.barcode_index import BarcodeIndex
+from app_code.product_search import connect_debounced
 from PyQt5.QtWidgets import QDialog
 from app_code.cart_page import CartPage
 
@@ -18,28 +22,58 @@ class StockPage(QWidget):
         self.db = db
         self.role = role
         self.username = username
-        self.products = []
-        self.filtered_products = []
+        # В памяти только текущая страница каталога (и заранее загруженная следующая)
+        self.query = (None, None, None)  # (сортировка, категория, поиск)
+        self.page_products = []
+        self.page_cursors = [None]  # Курсор начала каждой известной страницы
+        self.has_next_page = False
+        self.prefetch_key = None
+        self.prefetched = None  # (запрос, курсор, страница)
+        self.changed_key = None  # (запрос, курсор) страницы, перечитываемой по ленте изменений
+        self.pending_changed_ids = set()  # ID изменённых товаров, ещё не показанных на странице
+        self.pending_barcode_ids = set()  # ID изменённых товаров, ещё не обновлённых в barcode_index
+        self.estimated_total = (0, True)  # (число товаров, точное ли оно)
+        self.quantity_total = 0
         self.categories = []
         self.cart_items = []
         self.current_page = 1
-        self.products_per_page = 18
+        self.products_per_page = CATALOG_PAGE_SIZE
         self.total_pages = 1
         self.pagination_buttons = []
+        self.product_cards = {}  # ID товара -> карточка на текущей странице
+        self.card_pool = []  # Карточки переиспользуются между страницами и фильтрами
+        self.grid_columns = 6
+        self.grid_spacing = 20
+        self.card_width = None
+        self.barcode_index = BarcodeIndex(self.db)
+        # Предзагрузка следующей страницы и подсчёт остатка идут в фоне
+        self.loader = AnalyticsLoader(self)
+        self.loader.loaded.connect(self.on_background_loaded)
         
         self.init_ui()
         self.load_data()
         self.setup_connections()
         self.update_cart()  # Гарантируем корректное состояние кнопки корзины при запуске
         
-        # Добавляем таймер для автоматического обновления
-        self.refresh_timer = QTimer(self)
-        self.refresh_timer.timeout.connect(self.load_data)
-        self.refresh_timer.start(5000)  # Обновление каждые 5 секунд
+        # Вместо периодической перезагрузки слушаем изменения каталога в базе
+        self.change_listener = ProductChangeListener(self.db, self)
+        self.change_listener.products_changed.connect(self.on_products_changed)
+        self.change_listener.categories_changed.connect(self.on_categories_changed)
+        self.change_listener.resync_required.connect(self.load_data)
+        self.change_listener.resync_required.connect(self.barcode_index.reload)
+        self.change_listener.start()
         
     def __del__(self):
-        if hasattr(self, 'refresh_timer'):
-            self.refresh_timer.stop()
+        self.stop_change_listener()
+
+    def stop_change_listener(self):
+        if hasattr(self, 'change_listener') and self.change_listener.isRunning():
+            self.change_listener.stop()
+
+    def shutdown(self):
+        """Остановка фоновой работы при закрытии окна"""
+        self.stop_change_listener()
+        self.loader.shutdown()
         
     def init_ui(self):
         """Инициализация пользовательского интерфейса"""
@@ -326,7 +360,7 @@ class StockPage(QWidget):
         
         self.scroll_widget = QWidget()
         self.products_layout = QGridLayout(self.scroll_widget)
-        self.products_layout.setSpacing(20)
+        self.products_layout.setSpacing(self.grid_spacing)
         self.products_layout.setAlignment(Qt.AlignTop)
         
         scroll_area.setWidget(self.scroll_widget)
@@ -342,7 +376,7 @@ class StockPage(QWidget):
     
     def setup_connections(self):
         """Настройка сигналов и слотов"""
-        self.search_input.textChanged.connect(self.apply_filters)
+        connect_debounced(self.search_input, self.apply_filters)
         self.sort_combo.currentIndexChanged.connect(self.apply_filters)
         
         if self.role == "администратор":
@@ -353,87 +387,203 @@ class StockPage(QWidget):
                 self.add_by_barcode_btn.clicked.connect(self.show_add_by_barcode_dialog)
     
     def load_data(self):
-        """Загрузка данных из базы"""
+        """Загрузка категорий и первой страницы каталога"""
         # Сохраняем текущие значения фильтров
         current_search = self.search_input.text()
         current_category = self.category_combo.currentText()
         current_sort = self.sort_combo.currentText()
         
-        # Загружаем новые данные
-        self.products = self.db.get_all_products()
         self.categories = self.db.get_all_categories()
-        self.filtered_products = self.products.copy()
         self.filtered_categories = self.categories.copy()
         
         # Восстанавливаем фильтры
         self.search_input.setText(current_search)
         self.update_category_combo()
+        self.category_combo.blockSignals(True)
         self.category_combo.setCurrentText(current_category)
+        self.category_combo.blockSignals(False)
         self.sort_combo.setCurrentText(current_sort)
         
         # Применяем сохраненные фильтры
         self.apply_filters()
-    
+
+    def catalog_query(self):
+        """Текущие настройки каталога: (сортировка, категория, поиск)"""
+        category = self.category_combo.currentText()
+        if category == "Все категории":
+            category = None
+        return (self.sort_combo.currentText(), category or None, self.search_input.text() or None)
+
+    def on_products_changed(self, product_ids):
+        """Обновление каталога по ID товаров из ленты изменений.
+
+        Текущая страница перечитывается по своему курсору: изменённый товар
+        мог в неё войти или выйти. Если состав и порядок страницы прежние,
+        заменяются только карточки изменённых товаров. Запросы выполняются в
+        фоне, результат применяет on_background_loaded.
+        """
+        sort, category, search = self.query
+        cursor = self.page_cursors[self.current_page - 1]
+        # Пачки, пришедшие до ответа, объединяются: новый запрос отменяет прежний
+        self.pending_changed_ids |= set(product_ids)
+        self.changed_key = (self.query, cursor)
+        self.loader.request('changed_page', self.read_changed_page, sort, category, search, cursor,
+                            self.products_per_page, frozenset(self.pending_changed_ids))
+        if self.barcode_index.loaded:
+            self.pending_barcode_ids |= set(product_ids)
+            self.loader.request('barcodes', self.read_barcodes, list(self.pending_barcode_ids))
+        self.loader.request('quantity_total', self.db.get_products_quantity_total, category, search)
+
+    def read_changed_page(self, sort, category, search, cursor, limit, changed_ids):
+        """Фоновый поток: страница по курсору и оценка числа товаров"""
+        return {
+            "page": self.db.get_products_page(sort, category, search, after=cursor, limit=limit),
+            "total": self.db.estimate_product_count(category, search),
+            "changed_ids": changed_ids,
+        }
+
+    def read_barcodes(self, product_ids):
+        """Фоновый поток: штрихкоды изменённых товаров для barcode_index"""
+        return product_ids, self.db.get_barcode_products(product_ids)
+
+    def on_categories_changed(self):
+        current_category = self.category_combo.currentText()
+        self.categories = self.db.get_all_categories()
+        self.filtered_categories = self.categories.copy()
+        self.update_category_combo()
+        self.category_combo.setCurrentText(current_category)
+
     def apply_filters(self):
-        """Применение фильтров и сортировки"""
-        search_text = self.search_input.text().lower()
-        selected_category = self.category_combo.currentText()
-        # Фильтрация
-        if search_text:
-            self.filtered_products = [
-                p for p in self.products 
-                if search_text in p["name"].lower()
-            ]
+        """Применение фильтров и сортировки: каталог читается заново с первой страницы"""
+        self.query = self.catalog_query()
+        _, category, search = self.query
+        # Обновление штрихкодов не зависит от фильтров и не отменяется
+        for key in ('next_page', 'changed_page', 'quantity_total'):
+            self.loader.cancel(key)
+        self.pending_changed_ids = set()
+        self.prefetched = None
+        self.page_cursors = [None]
+        self.current_page = 1
+        self.estimated_total = self.db.estimate_product_count(category, search)
+        self.load_page()
+        self.loader.request('quantity_total', self.db.get_products_quantity_total, category, search)
+
+    def load_page(self):
+        """Загрузка текущей страницы по её курсору (из предзагрузки, если она готова)"""
+        cursor = self.page_cursors[self.current_page - 1]
+        if self.prefetched and self.prefetched[:2] == (self.query, cursor):
+            page = self.prefetched[2]
         else:
-            self.filtered_products = self.products.copy()
-        # Фильтрация по категории
-        if selected_category and selected_category != "Все категории":
-            self.filtered_products = [p for p in self.filtered_products if p["category"] == selected_category]
-        # Сортировка
-        sort_option = self.sort_combo.currentText()
-        if sort_option == "По имени":
-            self.filtered_products.sort(key=lambda x: x["name"].lower())
-        elif sort_option == "По цене":
-            self.filtered_products.sort(key=lambda x: float(x["price"]))
-        elif sort_option == "По количеству":
-            self.filtered_products.sort(key=lambda x: int(x["quantity"]))
-        # По умолчанию — без сортировки
-        self.update_products_grid()
-        self.update_total_count_label()
+            sort, category, search = self.query
+            page = self.db.get_products_page(sort, category, search, after=cursor,
+                                             limit=self.products_per_page)
+        self.prefetched = None
+        self.show_page(page)
+
+    def show_page(self, page, changed_ids=None):
+        """Показ загруженной страницы и обновление курсора следующей"""
+        page = page or {"products": [], "cursor": None, "has_more": False}
+        if not page["products"] and self.current_page > 1:
+            # Товары страницы удалены или отфильтрованы — возвращаемся на предыдущую
+            del self.page_cursors[self.current_page - 1:]
+            self.current_page -= 1
+            self.load_page()
+            return
+        old_page_ids = [p["id"] for p in self.page_products]
+        self.page_products = page["products"]
+        self.has_next_page = page["has_more"]
+        next_cursor = page["cursor"] if page["has_more"] else None
+        if self.page_cursors[self.current_page:self.current_page + 1] != [next_cursor]:
+            # Граница следующей страницы сдвинулась — курсоры дальних страниц устарели
+            del self.page_cursors[self.current_page:]
+            if next_cursor is not None:
+                self.page_cursors.append(next_cursor)
+        if changed_ids is not None and [p["id"] for p in self.page_products] == old_page_ids:
+            # Та же страница — заменяем только карточки изменённых товаров
+            for i, product in enumerate(self.page_products):
+                if product["id"] in changed_ids:
+                    self.replace_card(i, product)
+            self.update_pagination()
+        else:
+            self.update_products_grid()
+        self.prefetch_next_page()
+
+    def prefetch_next_page(self):
+        """Следующая страница загружается в фоне, пока открыта текущая"""
+        if not self.has_next_page:
+            return
+        cursor = self.page_cursors[self.current_page]
+        sort, category, search = self.query
+        self.prefetch_key = (self.query, cursor)
+        self.loader.request('next_page', self.db.get_products_page,
+                            sort, category, search, cursor, self.products_per_page)
+
+    def on_background_loaded(self, key, result):
+        if key == 'next_page':
+            if result is not None:
+                self.prefetched = self.prefetch_key + (result,)
+        elif key == 'quantity_total':
+            self.quantity_total = result
+            self.update_total_count_label()
+        elif key == 'barcodes':
+            ids, products = result
+            self.pending_barcode_ids.difference_update(ids)
+            self.barcode_index.apply(ids, products)
+        elif key == 'changed_page':
+            self.pending_changed_ids -= result["changed_ids"]
+            current = (self.query, self.page_cursors[self.current_page - 1])
+            # Пока шёл запрос, пользователь мог сменить страницу или фильтры — тогда она уже свежая
+            if result["page"] is None or self.changed_key != current:
+                return
+            self.prefetched = None
+            self.estimated_total = result["total"]
+            self.show_page(result["page"], changed_ids=result["changed_ids"])
     
     def update_products_grid(self):
-        """Обновление сетки товаров (без анимации)"""
-        # Очистка текущих виджетов
-        for i in reversed(range(self.products_layout.count())):
-            widget = self.products_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.setParent(None)
-                widget.deleteLater()
-        # Пагинация
-        total_products = len(self.filtered_products)
-        self.total_pages = max(1, (total_products + self.products_per_page - 1) // self.products_per_page)
-        self.current_page = min(self.current_page, self.total_pages)
-        start_idx = (self.current_page - 1) * self.products_per_page
-        end_idx = start_idx + self.products_per_page
-        page_products = self.filtered_products[start_idx:end_idx]
-        # Динамический расчет ширины карточки
-        columns = 6
-        spacing = 20
-        total_spacing = spacing * (columns - 1)
+        """Обновление сетки товаров: карточки из пула перепривязываются к товарам страницы"""
+        page_products = self.page_products
+        self.update_card_width()
+        self.product_cards = {}
+        # Карточки создаются только до заполнения первой полной страницы
+        while len(self.card_pool) < len(page_products):
+            self.card_pool.append(self.create_card(len(self.card_pool)))
+        for i, card in enumerate(self.card_pool):
+            if i < len(page_products):
+                card.set_product(page_products[i])
+                self.product_cards[page_products[i]["id"]] = card
+                card.show()
+            else:
+                card.hide()
+        self.update_pagination()
+
+    def create_card(self, index):
+        card = ProductCard(role=self.role)
+        if self.card_width:
+            card.setFixedWidth(self.card_width)
+        if self.role == "администратор":
+            card.edit_requested.connect(self.edit_product)
+            card.delete_requested.connect(self.delete_product)
+        elif self.role == "пользователь":
+            card.add_to_cart_requested.connect(self.add_to_cart)
+        self.products_layout.addWidget(card, index // self.grid_columns, index % self.grid_columns)
+        return card
+
+    def replace_card(self, index, product):
+        """Перепривязывает карточку на позиции index к новым данным товара"""
+        card = self.card_pool[index]
+        card.set_product(product)
+        self.product_cards[product["id"]] = card
+
+    def update_card_width(self):
+        """Ширина карточек по ширине области: 6 колонок с отступами"""
+        total_spacing = self.grid_spacing * (self.grid_columns - 1)
         available_width = (self.parent().width() if self.parent() else self.width()) - 40
-        card_width = (available_width - total_spacing) // columns
-        for i, product in enumerate(page_products):
-            row = i // columns
-            col = i % columns
-            card = ProductCard(product, self.role)
+        card_width = (available_width - total_spacing) // self.grid_columns
+        if card_width == self.card_width:
+            return
+        self.card_width = card_width
+        for card in self.card_pool:
             card.setFixedWidth(card_width)
-            if self.role == "администратор":
-                card.edit_requested.connect(self.edit_product)
-                card.delete_requested.connect(self.delete_product)
-            elif self.role == "пользователь":
-                card.add_to_cart_requested.connect(self.add_to_cart)
-            self.products_layout.addWidget(card, row, col)
-        self.update_pagination()
     
     def show_add_product_dialog(self):
         """Показать диалог добавления товара"""
@@ -444,7 +594,7 @@ class StockPage(QWidget):
                 QMessageBox.warning(self, "Ошибка", "Заполните все обязательные поля")
                 return
             # Проверка уникальности имени
-            if any(p["name"].lower() == name.lower() for p in self.products):
+            if self.db.product_name_exists(name):
                 QMessageBox.warning(self, "Ошибка", "Товар с таким названием уже существует")
                 return
             # Добавление в базу
@@ -459,17 +609,8 @@ class StockPage(QWidget):
                 # Для совместимости с устаревшим полем price:
                 "price": retail_price
             }
-            if self.db.add_product(product_data):
-                # Получаем id только что добавленного товара по имени
-                products = self.db.get_all_products()
-                new_product = next((p for p in products if p["name"] == name), None)
-                if new_product:
-                    self.db.log_initial_product_movement(
-                        product_id=new_product["id"],
-                        quantity=int(quantity),
-                        username=self.username,
-                        comment='Первоначальное поступление товара'
-                    )
+            # Товар и запись о первоначальном поступлении добавляются одной транзакцией
+            if self.db.add_product(product_data, self.username):
                 self.load_data()  # Перезагружаем данные
             else:
                 QMessageBox.warning(self, "Ошибка", "Не удалось добавить товар")
@@ -483,13 +624,12 @@ class StockPage(QWidget):
                 QMessageBox.warning(self, "Ошибка", "Название товара не может быть пустым")
                 return
             # Проверка уникальности имени
-            if (updated_data["name"] != product["name"] and 
-                any(p["name"].lower() == updated_data["name"].lower() 
-                    for p in self.products)):
+            if (updated_data["name"] != product["name"] and
+                    self.db.product_name_exists(updated_data["name"], exclude_id=product["id"])):
                 QMessageBox.warning(self, "Ошибка", "Товар с таким названием уже существует")
                 return
             updated_data["price"] = updated_data.get("retail_price", updated_data.get("price", ""))
-            old_quantity = int(product["quantity"])
+            old_quantity = product["quantity"]
             try:
                 new_quantity = int(updated_data["quantity"])
             except Exception:
@@ -574,7 +714,7 @@ class StockPage(QWidget):
     def resizeEvent(self, event):
         """Обработчик изменения размера окна"""
         super().resizeEvent(event)
-        self.update_products_grid()
+        self.update_card_width()
 
     def setup_user_button(self):
         add_btn = QPushButton("Добавить в корзину")
@@ -717,10 +857,14 @@ class StockPage(QWidget):
         prev_btn.clicked.connect(self.prev_page)
         prev_btn.setEnabled(self.current_page > 1)
         self.pagination_layout.addWidget(prev_btn)
-        # Кнопки с номерами страниц (максимум 5)
+        # Кнопки с номерами страниц (максимум 5): перейти можно только на страницы
+        # с известным курсором — открытые ранее и следующую
+        known_pages = len(self.page_cursors)
+        estimate, exact = self.estimated_total
+        self.total_pages = max(known_pages, -(-estimate // self.products_per_page))
         max_buttons = 5
         start_page = max(1, self.current_page - 2)
-        end_page = min(self.total_pages, start_page + max_buttons - 1)
+        end_page = min(known_pages, start_page + max_buttons - 1)
         if end_page - start_page < max_buttons - 1:
             start_page = max(1, end_page - max_buttons + 1)
         for page in range(start_page, end_page + 1):
@@ -734,8 +878,12 @@ class StockPage(QWidget):
         next_btn.setFixedSize(38, 38)
         next_btn.setStyleSheet(self.pagination_button_style(active=False))
         next_btn.clicked.connect(self.next_page)
-        next_btn.setEnabled(self.current_page < self.total_pages)
+        next_btn.setEnabled(self.has_next_page)
         self.pagination_layout.addWidget(next_btn)
+        # Число страниц по оценке количества товаров
+        pages_label = QLabel(f"из {'' if exact else '~'}{self.total_pages}")
+        pages_label.setStyleSheet("color: #aaa; font-size: 15px; margin-left: 8px;")
+        self.pagination_layout.addWidget(pages_label)
 
     def pagination_button_style(self, active=False):
         if active:
@@ -770,17 +918,17 @@ class StockPage(QWidget):
     def prev_page(self):
         if self.current_page > 1:
             self.current_page -= 1
-            self.update_products_grid()
+            self.load_page()
 
     def next_page(self):
-        if self.current_page < self.total_pages:
+        if self.has_next_page:
             self.current_page += 1
-            self.update_products_grid()
+            self.load_page()
 
     def goto_page(self, page):
-        if 1 <= page <= self.total_pages:
+        if 1 <= page <= len(self.page_cursors):
             self.current_page = page
-            self.update_products_grid()
+            self.load_page()
 
     def update_category_combo(self):
         self.category_combo.blockSignals(True)
@@ -791,15 +939,21 @@ class StockPage(QWidget):
         self.category_combo.blockSignals(False)
 
     def update_total_count_label(self):
-        total = sum(int(p["quantity"]) for p in self.filtered_products)
-        self.total_count_label.setText(f"Общее количество товаров: <b>{total}</b>")
+        self.total_count_label.setText(f"Общее количество товаров: <b>{self.quantity_total}</b>")
 
     def show_add_by_barcode_dialog(self):
-        """Диалог для добавления товара в корзину по штрихкоду для пользователя"""
-        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QLabel, QMessageBox
+        """Диалог для добавления товара в корзину по штрихкоду для пользователя.
+
+        Сканы ставятся в очередь и разбираются после возврата в цикл событий,
+        поле ввода очищается сразу — следующий штрихкод можно сканировать, не
+        дожидаясь обработки предыдущего. В режиме сканера ошибки не открывают
+        окно, а выводятся строкой в самом диалоге.
+        """
+        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QLabel, QMessageBox, QCheckBox
+        from collections import deque
         dialog = QDialog(self)
         dialog.setWindowTitle("Добавить в корзину по штрихкоду")
-        dialog.setFixedSize(340, 140)
+        dialog.setFixedSize(340, 210)
         layout = QVBoxLayout(dialog)
         label = QLabel("Отсканируйте или введите штрихкод товара:")
         layout.addWidget(label)
@@ -811,49 +965,65 @@ class StockPage(QWidget):
         qty_input.setPlaceholderText("Количество (по умолчанию 1)")
         qty_input.setStyleSheet("font-size: 16px; padding: 10px; border-radius: 8px;")
         layout.addWidget(qty_input)
+        scanner_mode = QCheckBox("Режим сканера: не останавливаться на ошибках")
+        layout.addWidget(scanner_mode)
+        status_label = QLabel()
+        status_label.setStyleSheet("color: #ff6b6b; font-size: 13px;")
+        layout.addWidget(status_label)
         barcode_input.setFocus()
-        busy = {"flag": False}
+        pending = deque()  # (штрихкод, количество)
+        drain_timer = QTimer(dialog)
+        drain_timer.setSingleShot(True)
+        drain_timer.setInterval(0)
         def try_add():
-            if busy["flag"]:
-                return
             barcode = barcode_input.text().strip()
             qty = qty_input.text().strip()
             qty = int(qty) if qty.isdigit() and int(qty) > 0 else 1
             if len(barcode) != 13 or not barcode.isdigit():
                 return  # Ждём 13 цифр
-            busy["flag"] = True
-            product = next((p for p in self.products if p.get("barcode") == barcode), None)
-            if not product:
-                QMessageBox.warning(dialog, "Ошибка", "Товар с таким штрихкодом не найден!")
-                barcode_input.clear()
-                barcode_input.setFocus()
-                busy["flag"] = False
-                return
-            price = product.get('price') or product.get('retail_price')
-            try:
-                price = float(price)
-            except (TypeError, ValueError):
-                QMessageBox.warning(dialog, "Ошибка", "У товара не указана цена!")
-                barcode_input.clear()
-                barcode_input.setFocus()
-                busy["flag"] = False
-                return
-            for item in self.cart_items:
-                if item.get('id') == product['id']:
-                    item['quantity'] += qty
-                    break
-            else:
-                self.cart_items.append({
-                    'id': product['id'],
-                    'name': product['name'],
-                    'price': price,
-                    'quantity': qty
-                })
-            self.update_cart()
+            pending.append((barcode, qty))
             barcode_input.clear()
             qty_input.clear()
+            drain_timer.start()
+        def drain():
+            errors = []
+            added = 0
+            while pending:
+                barcode, qty = pending.popleft()
+                product = self.barcode_index.get(barcode)
+                if not product:
+                    errors.append(f"Товар с таким штрихкодом не найден: {barcode}")
+                    continue
+                price = product.get('price') or product.get('retail_price')
+                try:
+                    price = float(price)
+                except (TypeError, ValueError):
+                    errors.append(f"У товара не указана цена: {product['name']}")
+                    continue
+                for item in self.cart_items:
+                    if item.get('id') == product['id']:
+                        item['quantity'] += qty
+                        break
+                else:
+                    self.cart_items.append({
+                        'id': product['id'],
+                        'name': product['name'],
+                        'price': price,
+                        'quantity': qty
+                    })
+                added += 1
+            # Корзина перерисовывается один раз на пачку сканов
+            if added:
+                self.update_cart()
+            if errors and scanner_mode.isChecked():
+                status_label.setText(errors[-1])
+            elif errors:
+                status_label.clear()
+                QMessageBox.warning(dialog, "Ошибка", "\n".join(errors))
+            else:
+                status_label.clear()
             barcode_input.setFocus()
-            busy["flag"] = False
+        drain_timer.timeout.connect(drain)
         barcode_input.textChanged.connect(try_add)
         qty_input.returnPressed.connect(try_add)
-        dialog.exec_()
\ No newline at end of file
+        dialog.exec_()
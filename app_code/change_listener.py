@@ -0,0 +1,100 @@
+import select
+import time
+import psycopg2
+from PyQt5.QtCore import QThread, pyqtSignal
+from app_code.database import PRODUCTS_CHANNEL, CATEGORIES_CHANNEL
+
+# Сколько ждать уведомления за один проход цикла, сек
+POLL_TIMEOUT = 1.0
+# Окно, в течение которого уведомления собираются в одну пачку, сек
+BATCH_DELAY = 0.3
+# Пауза перед повторным подключением после ошибки, мс
+RECONNECT_DELAY_MS = 3000
+
+
+class ProductChangeListener(QThread):
+    """Лента изменений каталога на основе LISTEN/NOTIFY.
+
+    Работает в отдельном потоке на собственном соединении и отдаёт
+    в главный поток ID изменённых товаров пачками.
+    """
+    products_changed = pyqtSignal(list)
+    categories_changed = pyqtSignal()
+    # Соединение восстановлено: уведомления могли быть потеряны, нужна полная перезагрузка
+    resync_required = pyqtSignal()
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._running = False
+
+    def start(self, *args, **kwargs):
+        self._running = True
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        self._running = False
+        self.wait(int(POLL_TIMEOUT * 1000) + 1000)
+
+    def run(self):
+        connection = None
+        connected_before = False
+        while self._running:
+            try:
+                if connection is None or connection.closed:
+                    connection = self.db.create_listen_connection()
+                    with connection.cursor() as cur:
+                        cur.execute(f"LISTEN {PRODUCTS_CHANNEL}")
+                        cur.execute(f"LISTEN {CATEGORIES_CHANNEL}")
+                    if connected_before:
+                        self.resync_required.emit()
+                    connected_before = True
+
+                if not self._wait(connection, POLL_TIMEOUT):
+                    continue
+
+                product_ids = set()
+                categories_changed = False
+                deadline = time.monotonic() + BATCH_DELAY
+                while True:
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        if notify.channel == PRODUCTS_CHANNEL:
+                            try:
+                                product_ids.add(int(notify.payload))
+                            except ValueError:
+                                continue
+                        elif notify.channel == CATEGORIES_CHANNEL:
+                            categories_changed = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._wait(connection, remaining):
+                        break
+
+                if categories_changed:
+                    self.categories_changed.emit()
+                if product_ids:
+                    self.products_changed.emit(sorted(product_ids))
+            except (psycopg2.Error, OSError) as e:
+                print(f"Ошибка слушателя изменений каталога: {e}")
+                self._close(connection)
+                connection = None
+                for _ in range(RECONNECT_DELAY_MS // 100):
+                    if not self._running:
+                        break
+                    self.msleep(100)
+        self._close(connection)
+
+    @staticmethod
+    def _wait(connection, timeout):
+        """Ожидает данных на сокете соединения не дольше timeout секунд"""
+        readable, _, _ = select.select([connection], [], [], timeout)
+        return bool(readable)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            if connection is not None and not connection.closed:
+                connection.close()
+        except Exception:
+            pass
@@ -1,464 +1,837 @@
+import atexit
+import csv
+import io
+import numpy as np
 import psycopg2
 from psycopg2 import pool
-from typing import List, Dict, Optional, Union
+from psycopg2.extensions import ISOLATION_LEVEL_READ_COMMITTED, ISOLATION_LEVEL_SERIALIZABLE
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+from itertools import takewhile
+from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import re
 import threading
-import time
+
+# Параметры подключения к базе данных
+DB_CONFIG = {
+    'dbname': 'warehouse',
+    'user': 'm4ssya',
+    'password': 'Vthty123',
+    'host': 'localhost',
+    'port': '5432',
+    'client_encoding': 'UTF8'
+}
+
+# Размер общего пула соединений
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 10
+
+# Размер пачки при онлайн-заполнении новых колонок
+MIGRATION_BATCH_SIZE = 5000
+
+# История продаж разбита на месячные секции: сколько полных месяцев хранить
+# и на сколько месяцев вперёд заранее создавать секции
+SALES_RETENTION_MONTHS = 12
+SALES_PARTITIONS_AHEAD = 2
+SALES_DEFAULT_PARTITION = 'sales_history_default'
+SALES_PARTITION_PATTERN = re.compile(r'^sales_history_(\d{4})_(\d{2})$')
+
+# Версионированные миграции схемы: (версия, описание, метод DatabaseManager).
+# Применяются по порядку один раз; шаги идемпотентны, поэтому база, созданная
+# до появления журнала schema_migrations, просто проходит их все.
+SCHEMA_MIGRATIONS = [
+    (1, "Базовые таблицы", "create_tables"),
+    (2, "Колонки закупочной и розничной цены", "ensure_price_fields"),
+    (3, "Журнал изменений товаров", "create_changes_log_trigger"),
+    (4, "sales_history.sale_date в timestamptz", "migrate_sale_date"),
+    (5, "Секционирование sales_history по месяцам", "partition_sales_history"),
+    (6, "Уведомления об изменениях каталога", "create_change_notifications"),
+    (7, "Позиции заказов поставщикам", "create_pending_order_items"),
+    (8, "Дневные агрегаты продаж для аналитики", "create_sales_rollups"),
+    (9, "Хэш фото пользователя для кэша аватаров", "add_user_photo_hash"),
+    (10, "Триграммные индексы для поиска товаров", "create_product_search_indexes"),
+    (11, "Индекс сортировки каталога по названию", "create_catalog_sort_index"),
+    (12, "Уникальный индекс штрихкодов товаров", "create_barcode_index"),
+    (13, "Числовые колонки количества и цен товаров", "convert_product_numbers"),
+    (14, "Продажи ссылаются на товар по id", "link_sales_to_products"),
+    (15, "Набор товаров с низким остатком под триггерами", "maintain_low_stock"),
+    (16, "Ключи дневных агрегатов хранятся в продаже", "store_sale_rollup_keys"),
+]
+# Статус заказа поставщику после приёмки товара
+ORDER_RECEIVED_STATUS = 'Поступил'
+# Категория для позиций прайс-листа без категории
+DEFAULT_CATEGORY = 'Без категории'
+
+# Дневные агрегаты продаж: таблица -> колонки ключа помимо дня. В sales_daily_products
+# ключ — product_id, а у продаж без товара (удалён или не найден по названию) — product_name
+SALES_ROLLUPS = {
+    'sales_daily_products': ('product_id', 'username'),
+    'sales_daily_sellers': ('username',),
+    'sales_daily_categories': ('category',),
+}
+# Агрегаты в том виде, в каком их создаёт миграция 8: sales_history.product_id
+# появляется только в миграции 14, до неё товар определяется по названию
+SALES_ROLLUPS_BY_NAME = {
+    'sales_daily_products': ('product_name', 'username'),
+    'sales_daily_sellers': ('username',),
+    'sales_daily_categories': ('category',),
+}
+# Группировка графиков продаж: режим -> (шаг DATE_TRUNC, формат подписи TO_CHAR)
+SALES_PERIOD_GROUPS = {
+    'По дням': ('day', 'DD.MM.YYYY'),
+    'По неделям': ('week', 'IYYY-IW'),  # Год-неделя
+    'По месяцам': ('month', 'MM.YYYY'),
+}
+# Роли пользователей, продажи которых показываются по продавцам
+SELLER_ROLES = ('user', 'пользователь')
+# Каталог: товаров на странице и ключи сортировки keyset-пагинации (режим -> выражение SQL)
+CATALOG_PAGE_SIZE = 18
+CATALOG_SORT_KEYS = {
+    'По имени': "LOWER(name)",
+    'По цене': "price",
+    'По количеству': "quantity",
+}
+# Типы числовых колонок products и число, которое миграция 13 распознаёт в тексте
+PRODUCT_NUMBER_COLUMNS = {
+    'quantity': 'integer',
+    'price': 'numeric(12,2)',
+    'purchase_price': 'numeric(12,2)',
+    'retail_price': 'numeric(12,2)',
+}
+PRODUCT_NUMBER_PATTERN = r'^-?\d{1,9}(\.\d+)?$'
+PRICE_STEP = Decimal('0.01')
+# До скольки строк отфильтрованный каталог считается точно
+CATALOG_EXACT_COUNT_LIMIT = 10000
+# Настройка сеанса: при 'on' удаление продаж не вычитается из агрегатов (очистка по сроку хранения)
+KEEP_ROLLUPS_SETTING = 'warehouse.keep_sales_rollups'
+
+# Ключ pg_advisory_lock, под которым выполняются миграции
+SCHEMA_LOCK_KEY = 7_301_001
+# Ключ pg_try_advisory_xact_lock: обслуживание секций продаж выполняет одна копия приложения
+SALES_MAINTENANCE_LOCK_KEY = 7_301_002
+
+# Каналы LISTEN/NOTIFY для ленты изменений каталога
+PRODUCTS_CHANNEL = 'products_changed'
+CATEGORIES_CHANNEL = 'categories_changed'
+
+# Результат строки заказа в DatabaseManager.checkout
+CHECKOUT_OK = 'ok'
+CHECKOUT_NOT_FOUND = 'not_found'
+CHECKOUT_INSUFFICIENT = 'insufficient'
+CHECKOUT_INVALID_QUANTITY = 'invalid_quantity'
+
+
+def _add_months(day: date, months: int) -> date:
+    """Первое число месяца, отстоящего от day на months месяцев"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _sales_rollup_targets(by_name: bool = False, stored_keys: bool = True) -> List[Dict]:
+    """Куда пишутся продажи: таблица агрегата, колонки и выражения ключа,
+    дополнительные колонки, отбор продаж и условие уникального индекса ключа.
+
+    by_name — агрегаты миграции 8 (SALES_ROLLUPS_BY_NAME), без sales_history.product_id;
+    stored_keys=False — как в миграции 14, до sales_history.category: категория
+    берётся у товара. Иначе все ключи читаются из самой продажи, и вычитание
+    всегда попадает в те же строки, что и прибавление.
+    """
+    if by_name:
+        category = f"COALESCE((SELECT category FROM products p WHERE p.name = s.product_name LIMIT 1), '{DEFAULT_CATEGORY}')"
+        return [
+            {'table': 'sales_daily_products', 'keys': {'product_name': 's.product_name', 'username': 's.username'}},
+            {'table': 'sales_daily_sellers', 'keys': {'username': 's.username'}},
+            {'table': 'sales_daily_categories', 'keys': {'category': category}},
+        ]
+    if stored_keys:
+        # Категория товара запоминается в продаже при оформлении заказа
+        category = f"COALESCE(s.category, '{DEFAULT_CATEGORY}')"
+    else:
+        category = f"COALESCE((SELECT category FROM products p WHERE p.id = s.product_id), '{DEFAULT_CATEGORY}')"
+    return [
+        {'table': 'sales_daily_products', 'keys': {'product_id': 's.product_id', 'username': 's.username'},
+         'extra': {'product_name': 'MAX(s.product_name)'},
+         'where': 's.product_id IS NOT NULL', 'unique': 'product_id IS NOT NULL'},
+        # Продажи удалённых и не найденных по названию товаров остаются в агрегате под названием
+        {'table': 'sales_daily_products', 'keys': {'product_name': 's.product_name', 'username': 's.username'},
+         'where': 's.product_id IS NULL', 'unique': 'product_id IS NULL'},
+        {'table': 'sales_daily_sellers', 'keys': {'username': 's.username'}},
+        {'table': 'sales_daily_categories', 'keys': {'category': category}},
+    ]
+
+
+def _sales_rollup_sql(source: str, sign: int = 1, by_name: bool = False, stored_keys: bool = True) -> str:
+    """Добавляет (sign=1) или вычитает (sign=-1) продажи из source во все дневные агрегаты.
+
+    После вычитания удаляются обнулившиеся строки — только по ключам из source,
+    через уникальные индексы, без просмотра агрегатов целиком.
+    """
+    statements = []
+    for target in _sales_rollup_targets(by_name, stored_keys):
+        table, keys, extra = target['table'], target['keys'], target.get('extra', {})
+        columns = ', '.join(keys)
+        values = ', '.join(list(keys.values()) + list(extra.values()))
+        where = f" WHERE {target['where']}" if 'where' in target else ""
+        unique = f" WHERE {target['unique']}" if 'unique' in target else ""
+        group = ', '.join(str(i) for i in range(1, len(keys) + 2))
+        statements.append(f"""
+            INSERT INTO {table} AS t (day, {', '.join(list(keys) + list(extra))}, sales_count, quantity, amount)
+            SELECT s.sale_date::date, {values},
+                   {sign} * COUNT(*), {sign} * SUM(s.quantity), {sign} * SUM(s.quantity * s.sale_price)::numeric
+            FROM {source} s{where}
+            GROUP BY {group}
+            ON CONFLICT (day, {columns}){unique} DO UPDATE
+            SET sales_count = t.sales_count + EXCLUDED.sales_count,
+                quantity = t.quantity + EXCLUDED.quantity,
+                amount = t.amount + EXCLUDED.amount;""")
+        if sign < 0:
+            touched = ', '.join(f"{value} AS {key}" for key, value in keys.items())
+            match = ' AND '.join(f"t.{key} = k.{key}" for key in keys)
+            if 'unique' in target:
+                match += f" AND t.{target['unique']}"
+            statements.append(f"""
+            DELETE FROM {table} t
+            USING (SELECT DISTINCT s.sale_date::date AS day, {touched} FROM {source} s{where}) k
+            WHERE t.day = k.day AND {match} AND t.sales_count <= 0;""")
+    return '\n'.join(statements)
+
+
+def parse_price(value) -> Optional[Decimal]:
+    """Цена из поля ввода: '12,5' -> Decimal('12.50'), пустое значение -> None.
+
+    Некорректная или отрицательная цена — ValueError.
+    """
+    if value is None or isinstance(value, Decimal):
+        return value
+    text = str(value).strip().replace(' ', '').replace(',', '.')
+    if not text:
+        return None
+    try:
+        price = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Некорректная цена: {value}")
+    if not price.is_finite() or price < 0:
+        raise ValueError(f"Некорректная цена: {value}")
+    return price.quantize(PRICE_STEP)
+
+
+def parse_quantity(value) -> int:
+    """Количество из поля ввода; некорректное или отрицательное — ValueError"""
+    quantity = int(str(value).strip())
+    if quantity < 0:
+        raise ValueError(f"Количество не может быть отрицательным: {value}")
+    return quantity
+
+
+def format_price(value) -> str:
+    """Цена для поля ввода или ячейки таблицы; нет цены — пустая строка"""
+    return "" if value is None else f"{value:.2f}"
+
+
+def _sales_partition_name(month: date) -> str:
+    return f"sales_history_{month:%Y_%m}"
+
 
 class DatabaseManager:
+    """Доступ к базе данных через общий для всего процесса пул соединений.
+
+    Экземпляры дешёвые: каждое окно может создать свой DatabaseManager,
+    соединение берётся из пула только на время одной операции.
+    """
+
+    _pool = None
+    _pool_lock = threading.Lock()
+    _schema_ready = False
+    _local = threading.local()
+    _category_min_quantities = None  # Кэш: категория -> минимальное количество
+
     def __init__(self):
-        self.connection = None
-        self.cursor = None
         self.get_connection()
 
+    @staticmethod
+    def _connection_params():
+        """Параметры подключения, очищенные от некорректных символов"""
+        return {
+            key: value.encode('ascii', 'ignore').decode('ascii') if isinstance(value, str) else value
+            for key, value in DB_CONFIG.items()
+        }
+
+    @classmethod
+    def _get_pool(cls):
+        """Возвращает общий пул соединений, создавая его при первом обращении"""
+        if cls._pool is None or cls._pool.closed:
+            with cls._pool_lock:
+                if cls._pool is None or cls._pool.closed:
+                    print("Попытка подключения к базе данных...")
+                    cls._pool = pool.ThreadedConnectionPool(
+                        POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, **cls._connection_params()
+                    )
+                    print("Пул соединений создан успешно")
+        return cls._pool
+
+    @classmethod
+    def close_pool(cls):
+        """Закрывает все соединения общего пула"""
+        with cls._pool_lock:
+            try:
+                if cls._pool is not None and not cls._pool.closed:
+                    cls._pool.closeall()
+            except Exception as e:
+                print(f"Ошибка при закрытии пула соединений: {e}")
+            finally:
+                cls._pool = None
+
     def get_connection(self):
-        """Получение соединения с базой данных"""
+        """Подготовка пула соединений и схемы базы данных (один раз на процесс)"""
         try:
-            if self.connection is None or self.connection.closed:
-                print("Попытка подключения к базе данных...")
-                
-                # Явно кодируем все параметры подключения
-                connection_params = {
-                    'dbname': 'warehouse',
-                    'user': 'm4ssya',
-                    'password': 'Vthty123',
-                    'host': 'localhost',
-                    'port': '5432'
-                }
-                
-                # Преобразуем все строковые параметры в байты и обратно для очистки от некорректных символов
-                for key, value in connection_params.items():
-                    if isinstance(value, str):
-                        connection_params[key] = value.encode('ascii', 'ignore').decode('ascii')
-                
-                self.connection = psycopg2.connect(**connection_params)
-                print("Соединение установлено успешно")
-                
-                # Устанавливаем кодировку после подключения
-                self.connection.set_client_encoding('UTF8')
-                print("Кодировка установлена: UTF8")
-                
-                self.cursor = self.connection.cursor()
-                print("Курсор создан успешно")
-                
-                # Проверяем кодировку
-                self.cursor.execute("SHOW client_encoding")
-                encoding = self.cursor.fetchone()[0]
-                print(f"Текущая кодировка клиента: {encoding}")
-                
-                # Создаем таблицы, если они не существуют
-                self.create_tables()
-                
+            self._get_pool()
+            if not DatabaseManager._schema_ready:
+                with DatabaseManager._pool_lock:
+                    if not DatabaseManager._schema_ready:
+                        self.migrate_schema()
+                        DatabaseManager._schema_ready = True
             return True
         except Exception as e:
             print(f"Ошибка при подключении к базе данных: {str(e)}")
             print(f"Тип ошибки: {type(e)}")
             import traceback
             print(f"Traceback: {traceback.format_exc()}")
-            self.connection = None
-            self.cursor = None
             return False
 
-    def close(self):
-        """Закрытие соединения с базой данных"""
+    def migrate_schema(self) -> int:
+        """Применяет недостающие миграции из SCHEMA_MIGRATIONS и возвращает версию схемы.
+
+        Каждая версия применяется и записывается в schema_migrations в одной
+        транзакции: транзакции самой миграции становятся вложенными (SAVEPOINT),
+        и версия не может оказаться применённой, но не записанной. На время
+        работы берётся advisory-блокировка, чтобы несколько запущенных копий
+        приложения не мигрировали базу одновременно. Ошибка миграции
+        откатывает её целиком и пробрасывается дальше: get_connection вернёт
+        False, и приложение не запустится на схеме, применённой наполовину.
+        """
+        db_pool = self._get_pool()
+        lock_connection = db_pool.getconn()
         try:
-            if self.cursor:
-                self.cursor.close()
-            if self.connection:
-                self.connection.close()
-        except Exception as e:
-            print(f"Ошибка при закрытии соединения: {e}")
+            lock_connection.autocommit = True
+            with lock_connection.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_KEY,))
+            try:
+                with self.transaction() as cur:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT NOT NULL,
+                            applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+                    current_version = cur.fetchone()[0]
+                for version, description, method_name in SCHEMA_MIGRATIONS:
+                    if version <= current_version:
+                        continue
+                    print(f"Миграция схемы {version}: {description}")
+                    try:
+                        with self.transaction() as cur:
+                            getattr(self, method_name)()
+                            cur.execute(
+                                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                                (version, description)
+                            )
+                    except Exception as e:
+                        print(f"Ошибка миграции схемы {version} ({description}): {e}")
+                        raise
+                    current_version = version
+                return current_version
+            finally:
+                with lock_connection.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_KEY,))
         finally:
-            self.cursor = None
-            self.connection = None
-
-    def __del__(self):
-        self.close()
-
-    def _execute_with_retry(self, query, params=None, max_retries=3):
-        """Выполнение запроса с повторными попытками при ошибках"""
-        last_error = None
-        for attempt in range(max_retries):
+            if not lock_connection.closed:
+                lock_connection.autocommit = False
+            db_pool.putconn(lock_connection, close=bool(lock_connection.closed))
+
+    @contextmanager
+    def transaction(self, isolation_level=None):
+        """Транзакция на соединении из пула.
+
+        Выдаёт отдельный курсор, фиксирует изменения при успешном выходе из блока
+        и откатывает их при исключении. Вложенный вызов в том же потоке
+        работает внутри внешней транзакции под SAVEPOINT: исключение во
+        вложенном блоке откатывает только его изменения, и внешняя транзакция
+        остаётся рабочей, даже если метод перехватил ошибку и вернул False.
+        """
+        outer = getattr(DatabaseManager._local, 'connection', None)
+        if outer is not None:
+            depth = getattr(DatabaseManager._local, 'depth', 0) + 1
+            savepoint = f"nested_{depth}"
+            DatabaseManager._local.depth = depth
+            cursor = outer.cursor()
             try:
-                if not self.get_connection():
-                    raise Exception("Не удалось установить соединение с базой данных")
-                
-                # Подготавливаем параметры
-                if params:
-                    if isinstance(params, (list, tuple)):
-                        params = [str(p).encode('ascii', 'ignore').decode('ascii') 
-                                if p is not None else None for p in params]
-                    elif isinstance(params, dict):
-                        params = {k: str(v).encode('ascii', 'ignore').decode('ascii') 
-                                if v is not None else None for k, v in params.items()}
-                
-                # Выполняем запрос
-                if params:
-                    self.cursor.execute(query, params)
-                else:
-                    self.cursor.execute(query)
-                return True
-                
-            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-                last_error = e
-                print(f"Попытка {attempt + 1} из {max_retries} не удалась: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(0.1 * (attempt + 1))
-                    self.close()
-                else:
-                    raise last_error
-            except Exception as e:
-                print(f"Непредвиденная ошибка при выполнении запроса: {str(e)}")
-                print(f"Тип ошибки: {type(e)}")
-                import traceback
-                print(f"Traceback: {traceback.format_exc()}")
+                cursor.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    yield cursor
+                except BaseException:
+                    cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+                    raise
+                cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+            finally:
+                DatabaseManager._local.depth = depth - 1
+                cursor.close()
+            return
+
+        db_pool = self._get_pool()
+        connection = db_pool.getconn()
+        broken = False
+        DatabaseManager._local.connection = connection
+        try:
+            if isolation_level is not None:
+                connection.set_isolation_level(isolation_level)
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                connection.commit()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    broken = True
                 raise
-        return False
+            finally:
+                cursor.close()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            DatabaseManager._local.connection = None
+            if not broken and not connection.closed and isolation_level is not None:
+                try:
+                    connection.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
+                except psycopg2.Error:
+                    broken = True
+            db_pool.putconn(connection, close=broken or bool(connection.closed))
+
+    def close(self):
+        """Экземпляр не владеет соединениями: общий пул закрывается при выходе из приложения"""
+        pass
+
+    def create_listen_connection(self):
+        """Отдельное соединение вне пула для LISTEN (работает в режиме autocommit)"""
+        connection = psycopg2.connect(**self._connection_params())
+        connection.autocommit = True
+        return connection
+
 
     def _initialize_database(self):
         """Создает таблицы, если они не существуют"""
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT DEFAULT 'user',
-                name TEXT,
-                photo_path TEXT,
-                photo_data BYTEA,
-                email TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id SERIAL PRIMARY KEY,
-                name TEXT UNIQUE NOT NULL,
-                price TEXT NOT NULL,
-                quantity TEXT NOT NULL,
-                barcode TEXT,
-                image TEXT,
-                category TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id SERIAL PRIMARY KEY,
-                name TEXT UNIQUE NOT NULL
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sales_history (
-                id SERIAL PRIMARY KEY,
-                product_name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                sale_date TEXT NOT NULL,
-                username TEXT NOT NULL,
-                sale_price FLOAT NOT NULL
-            )
-        """)
-        
-        # Создаем таблицу для минимальных количеств по категориям
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS category_min_quantities (
-                id SERIAL PRIMARY KEY,
-                category TEXT UNIQUE NOT NULL,
-                min_quantity INTEGER NOT NULL
-            )
-        """)
-        
-        self.cursor.execute("SELECT COUNT(*) FROM categories")
-        if self.cursor.fetchone()[0] == 0:
-            self.cursor.execute("INSERT INTO categories (name) VALUES (%s)", ("Без категории",))
-            
-        # Создаем функцию для очистки старых записей
-        self.cursor.execute("""
-            CREATE OR REPLACE FUNCTION clean_old_sales_history()
-            RETURNS trigger AS $$
-            BEGIN
-                DELETE FROM sales_history 
-                WHERE sale_date::date < CURRENT_DATE - INTERVAL '1 year';
-                RETURN NEW;
-            END;
-            $$ LANGUAGE plpgsql;
-        """)
-        
-        # Создаем триггер для автоматической очистки
-        self.cursor.execute("""
-            DROP TRIGGER IF EXISTS clean_sales_history_trigger ON sales_history;
-            CREATE TRIGGER clean_sales_history_trigger
-            AFTER INSERT ON sales_history
-            FOR EACH ROW
-            EXECUTE FUNCTION clean_old_sales_history();
-        """)
-        
-        # Создаем таблицу движения товаров
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS product_movement (
-                id SERIAL PRIMARY KEY,
-                product_id INTEGER REFERENCES products(id),
-                movement_type VARCHAR(50) NOT NULL,
-                quantity INTEGER NOT NULL,
-                previous_quantity INTEGER NOT NULL,
-                new_quantity INTEGER NOT NULL,
-                movement_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                username TEXT NOT NULL,
-                reference_id INTEGER,
-                reference_type VARCHAR(50),
-                comment TEXT
-            )
-        """)
-        
-        self.connection.commit()
+        with self.transaction() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id SERIAL PRIMARY KEY,
+                    username TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    role TEXT DEFAULT 'user',
+                    name TEXT,
+                    photo_path TEXT,
+                    photo_data BYTEA,
+                    email TEXT
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id SERIAL PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL,
+                    price TEXT NOT NULL,
+                    quantity TEXT NOT NULL,
+                    barcode TEXT,
+                    image TEXT,
+                    category TEXT
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS categories (
+                    id SERIAL PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS sales_history (
+                    id SERIAL PRIMARY KEY,
+                    product_name TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    sale_date TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    username TEXT NOT NULL,
+                    sale_price FLOAT NOT NULL
+                )
+            """)
+
+            # Создаем таблицу для минимальных количеств по категориям
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS category_min_quantities (
+                    id SERIAL PRIMARY KEY,
+                    category TEXT UNIQUE NOT NULL,
+                    min_quantity INTEGER NOT NULL
+                )
+            """)
+
+            cur.execute("SELECT COUNT(*) FROM categories")
+            if cur.fetchone()[0] == 0:
+                cur.execute("INSERT INTO categories (name) VALUES (%s)", ("Без категории",))
+
+            # Создаем таблицу движения товаров
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS product_movement (
+                    id SERIAL PRIMARY KEY,
+                    product_id INTEGER REFERENCES products(id),
+                    movement_type VARCHAR(50) NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    previous_quantity INTEGER NOT NULL,
+                    new_quantity INTEGER NOT NULL,
+                    movement_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    username TEXT NOT NULL,
+                    reference_id INTEGER,
+                    reference_type VARCHAR(50),
+                    comment TEXT
+                )
+            """)
 
     def ensure_price_fields(self):
-        self.get_connection()
-        try:
-            self.cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name='products'")
-            columns = [row[0] for row in self.cursor.fetchall()]
-            if 'purchase_price' not in columns:
-                self.cursor.execute("ALTER TABLE products ADD COLUMN purchase_price TEXT")
-            if 'retail_price' not in columns:
-                self.cursor.execute("ALTER TABLE products ADD COLUMN retail_price TEXT")
-            self.connection.commit()
-        except Exception as e:
-            print(f"Ошибка при добавлении полей цен: {e}")
-            self.connection.rollback()
+        """Колонки закупочной и розничной цены в products"""
+        with self.transaction() as cur:
+            cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS purchase_price TEXT")
+            cur.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS retail_price TEXT")
+
+    def create_changes_log_trigger(self):
+        """Журнал изменений товаров: колонки changes_log и триггер products_log_trigger"""
+        with self.transaction() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS changes_log (
+                    id SERIAL PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    record_id INTEGER NOT NULL,
+                    change_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    username TEXT
+                )
+            """)
+            cur.execute("""
+                ALTER TABLE changes_log ADD COLUMN IF NOT EXISTS action TEXT NOT NULL DEFAULT 'INSERT';
+                ALTER TABLE changes_log ADD COLUMN IF NOT EXISTS table_name TEXT NOT NULL DEFAULT 'products';
+                ALTER TABLE changes_log ADD COLUMN IF NOT EXISTS record_id INTEGER NOT NULL DEFAULT 0;
+            """)
+            # При удалении NEW пуст, поэтому id берётся из OLD
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION log_change()
+                RETURNS TRIGGER AS $$
+                BEGIN
+                    INSERT INTO changes_log (table_name, action, record_id)
+                    VALUES (TG_TABLE_NAME, TG_OP, CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS products_log_trigger ON products;
+                CREATE TRIGGER products_log_trigger
+                AFTER INSERT OR UPDATE OR DELETE ON products
+                FOR EACH ROW
+                EXECUTE FUNCTION log_change();
+            """)
 
-    def add_product(self, product_data: Dict[str, Union[str, None]]) -> bool:
-        self.ensure_price_fields()
+    def add_product(self, product_data: Dict[str, Union[str, None]], username: str,
+                    comment: str = 'Первоначальное поступление товара') -> bool:
+        """Добавляет товар и запись о первоначальном поступлении (схема готовится миграциями)"""
         try:
-            # Проверяем существование таблицы changes_log
-            self.cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'changes_log'
-                );
-            """)
-            
-            if not self.cursor.fetchone()[0]:
-                # Создаем таблицу changes_log если её нет
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS changes_log (
-                        id SERIAL PRIMARY KEY,
-                        table_name TEXT NOT NULL,
-                        action TEXT NOT NULL,
-                        record_id INTEGER NOT NULL,
-                        change_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        username TEXT
+            with self.transaction(ISOLATION_LEVEL_SERIALIZABLE) as cur:
+                # Проверяем существование товара
+                cur.execute("SELECT id FROM products WHERE name = %s FOR UPDATE", (product_data['name'],))
+                if cur.fetchone():
+                    return False
+
+                quantity = parse_quantity(product_data['quantity'])
+                retail_price = parse_price(product_data.get('retail_price'))
+                price = parse_price(product_data.get('price'))
+                if price is None:
+                    price = retail_price if retail_price is not None else Decimal(0)
+                cur.execute(
+                    """INSERT INTO products (name, price, quantity, barcode, image, category, purchase_price, retail_price)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+                    (
+                        product_data['name'],
+                        price,
+                        quantity,
+                        product_data.get('barcode'),
+                        product_data.get('image'),
+                        product_data['category'] if product_data['category'] else None,
+                        parse_price(product_data.get('purchase_price')),
+                        retail_price
                     )
-                """)
-            else:
-                # Проверяем наличие колонки action
-                self.cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.columns 
-                        WHERE table_name = 'changes_log' AND column_name = 'action'
-                    );
-                """)
-                if not self.cursor.fetchone()[0]:
-                    # Добавляем колонку action если её нет
-                    self.cursor.execute("""
-                        ALTER TABLE changes_log 
-                        ADD COLUMN action TEXT NOT NULL DEFAULT 'INSERT';
-                    """)
-                
-                # Проверяем наличие колонки table_name
-                self.cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.columns 
-                        WHERE table_name = 'changes_log' AND column_name = 'table_name'
-                    );
-                """)
-                if not self.cursor.fetchone()[0]:
-                    # Добавляем колонку table_name если её нет
-                    self.cursor.execute("""
-                        ALTER TABLE changes_log 
-                        ADD COLUMN table_name TEXT NOT NULL DEFAULT 'products';
-                    """)
-                
-                # Проверяем наличие колонки record_id
-                self.cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.columns 
-                        WHERE table_name = 'changes_log' AND column_name = 'record_id'
-                    );
-                """)
-                if not self.cursor.fetchone()[0]:
-                    # Добавляем колонку record_id если её нет
-                    self.cursor.execute("""
-                        ALTER TABLE changes_log 
-                        ADD COLUMN record_id INTEGER NOT NULL DEFAULT 0;
-                    """)
-                
-                self.connection.commit()
-                
-                # Создаем или обновляем функцию для логирования изменений
-                self.cursor.execute("""
-                    CREATE OR REPLACE FUNCTION log_change()
-                    RETURNS TRIGGER AS $$
-                    BEGIN
-                        INSERT INTO changes_log (table_name, action, record_id)
-                        VALUES (TG_TABLE_NAME, TG_OP, NEW.id);
-                        RETURN NEW;
-                    END;
-                    $$ LANGUAGE plpgsql;
-                """)
-                
-                # Создаем или обновляем триггер
-                self.cursor.execute("""
-                    DROP TRIGGER IF EXISTS products_log_trigger ON products;
-                    CREATE TRIGGER products_log_trigger
-                    AFTER INSERT OR UPDATE OR DELETE ON products
-                    FOR EACH ROW
-                    EXECUTE FUNCTION log_change();
-                """)
-                
-                self.connection.commit()
-
-            # Начинаем транзакцию
-            self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
-            
-            # Проверяем существование товара
-            self.cursor.execute("SELECT id FROM products WHERE name = %s FOR UPDATE", (product_data['name'],))
-            if self.cursor.fetchone():
-                self.connection.rollback()
-                return False
-
-            self.cursor.execute(
-                """INSERT INTO products (name, price, quantity, barcode, image, category, purchase_price, retail_price) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-                (
-                    product_data['name'],
-                    product_data['price'],
-                    product_data['quantity'],
-                    product_data.get('barcode'),
-                    product_data['image'],
-                    product_data['category'] if product_data['category'] else None,
-                    product_data.get('purchase_price'),
-                    product_data.get('retail_price')
                 )
-            )
-            self.connection.commit()
+                product_id = cur.fetchone()[0]
+                cur.execute(
+                    "INSERT INTO product_movement (product_id, movement_type, quantity, previous_quantity, new_quantity, username, reference_type, comment) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                    (product_id, 'IN', quantity, 0, quantity, username, 'Первичное добавление', comment)
+                )
             return True
-        except psycopg2.Error as e:
+        except (psycopg2.Error, ValueError) as e:
             print(f"Ошибка при добавлении товара: {e}")
-            self.connection.rollback()
             return False
-        finally:
-            self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
 
     def update_product(self, product_name: str, update_data: Dict[str, str]) -> bool:
         try:
-            self.cursor.execute(
-                "SELECT id, quantity FROM products WHERE name = %s",
-                (product_name,)
-            )
-            current = self.cursor.fetchone()
-            if not current:
-                return False
-
-            product_id, current_quantity = current
-
-            # Если категория пустая или None, подставляем 'Без категории'
-            if 'category' in update_data and (not update_data['category'] or update_data['category'].strip() == ''):
-                update_data['category'] = "Без категории"
-
-            update_fields = []
-            update_values = []
-            if 'retail_price' in update_data:
-                update_fields.append("retail_price = %s")
-                update_values.append(update_data['retail_price'])
-                update_fields.append("price = %s")
-                update_values.append(update_data['retail_price'])
-            if 'purchase_price' in update_data:
-                update_fields.append("purchase_price = %s")
-                update_values.append(update_data['purchase_price'])
-            if 'quantity' in update_data:
-                update_fields.append("quantity = %s")
-                update_values.append(update_data['quantity'])
-            if 'category' in update_data:
-                update_fields.append("category = %s")
-                update_values.append(update_data['category'])
-            if 'barcode' in update_data:
-                update_fields.append("barcode = %s")
-                update_values.append(update_data['barcode'])
-            if 'image' in update_data:
-                update_fields.append("image = %s")
-                update_values.append(update_data['image'])
-
-            if update_fields:
-                query = f"UPDATE products SET {', '.join(update_fields)} WHERE name = %s"
-                update_values.append(product_name)
-                self.cursor.execute(query, update_values)
-
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute(
+                    "SELECT id, quantity FROM products WHERE name = %s",
+                    (product_name,)
+                )
+                current = cur.fetchone()
+                if not current:
+                    return False
+
+                product_id, current_quantity = current
+
+                # Если категория пустая или None, подставляем 'Без категории'
+                if 'category' in update_data and (not update_data['category'] or update_data['category'].strip() == ''):
+                    update_data['category'] = "Без категории"
+
+                update_fields = []
+                update_values = []
+                if 'retail_price' in update_data:
+                    retail_price = parse_price(update_data['retail_price'])
+                    update_fields.append("retail_price = %s")
+                    update_values.append(retail_price)
+                    update_fields.append("price = %s")
+                    update_values.append(retail_price if retail_price is not None else Decimal(0))
+                if 'purchase_price' in update_data:
+                    update_fields.append("purchase_price = %s")
+                    update_values.append(parse_price(update_data['purchase_price']))
+                if 'quantity' in update_data:
+                    update_fields.append("quantity = %s")
+                    update_values.append(parse_quantity(update_data['quantity']))
+                if 'category' in update_data:
+                    update_fields.append("category = %s")
+                    update_values.append(update_data['category'])
+                if 'barcode' in update_data:
+                    update_fields.append("barcode = %s")
+                    update_values.append(update_data['barcode'])
+                if 'image' in update_data:
+                    update_fields.append("image = %s")
+                    update_values.append(update_data['image'])
+
+                if update_fields:
+                    query = f"UPDATE products SET {', '.join(update_fields)} WHERE name = %s"
+                    update_values.append(product_name)
+                    cur.execute(query, update_values)
             return True
         except Exception as e:
             print(f"Ошибка при обновлении товара: {e}")
-            self.connection.rollback()
             return False
 
-    def update_low_stock_quantity(self, product_name, new_quantity):
-        self.cursor.execute(
-            "UPDATE low_stock_products SET quantity = %s WHERE product_name = %s",
-            (new_quantity, product_name)
-        )
-        self.connection.commit()
-
     def delete_product(self, product_id: int) -> bool:
         """Удаление товара по ID с проверкой зависимостей"""
         try:
-            # Начинаем транзакцию
-            self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
-            # Проверяем наличие продаж (убрал FOR UPDATE)
-            self.cursor.execute("SELECT COUNT(*) FROM sales_history WHERE product_id = %s", (product_id,))
-            if self.cursor.fetchone()[0] > 0:
-                self.connection.rollback()
-                return False
-            # Удаляем товар
-            self.cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
-            self.connection.commit()
+            with self.transaction(ISOLATION_LEVEL_SERIALIZABLE) as cur:
+                # Проверяем наличие продаж (убрал FOR UPDATE)
+                cur.execute("SELECT COUNT(*) FROM sales_history WHERE product_id = %s", (product_id,))
+                if cur.fetchone()[0] > 0:
+                    return False
+                # Удаляем товар
+                cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при удалении товара: {e}")
-            self.connection.rollback()
             return False
-        finally:
-            self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+
+    @staticmethod
+    def _product_from_row(row) -> Dict[str, Union[str, None]]:
+        return {
+            "id": row[0],
+            "name": row[1],
+            "price": row[2],
+            "quantity": row[3],
+            "barcode": row[4],
+            "image": row[5],
+            "category": row[6] if row[6] else "Без категории",
+            "purchase_price": row[7],
+            "retail_price": row[8]
+        }
 
     def get_all_products(self) -> List[Dict[str, Union[str, None]]]:
-        self.ensure_price_fields()
         try:
-            if not self.cursor or self.cursor.closed:
-                self.get_connection()
-            self.cursor.execute("SELECT id, name, price, quantity, barcode, image, category, purchase_price, retail_price FROM products")
+            with self.transaction() as cur:
+                cur.execute("SELECT id, name, price, quantity, barcode, image, category, purchase_price, retail_price FROM products")
+                rows = cur.fetchall()
+            return [self._product_from_row(row) for row in rows]
+        except Exception as e:
+            print(f"Ошибка при получении списка товаров: {e}")
+            return []
+
+    def get_products_by_ids(self, product_ids) -> List[Dict[str, Union[str, None]]]:
+        """Получение товаров по списку ID (для точечного обновления каталога)"""
+        if not product_ids:
+            return []
+        try:
+            with self.transaction() as cur:
+                cur.execute(
+                    "SELECT id, name, price, quantity, barcode, image, category, purchase_price, retail_price FROM products WHERE id = ANY(%s)",
+                    (list(product_ids),)
+                )
+                rows = cur.fetchall()
+            return [self._product_from_row(row) for row in rows]
+        except Exception as e:
+            print(f"Ошибка при получении товаров по ID: {e}")
+            return []
+
+    @staticmethod
+    def _catalog_filter(category=None, search=None):
+        """Условие WHERE и параметры для фильтров каталога по категории и названию"""
+        conditions, params = [], []
+        if category == DEFAULT_CATEGORY:
+            # Пустая категория показывается как «Без категории» (см. _product_from_row)
+            conditions.append("(category IS NULL OR category IN ('', %s))")
+            params.append(category)
+        elif category:
+            conditions.append("category = %s")
+            params.append(category)
+        if search:
+            # ILIKE '%...%' обслуживается триграммным индексом idx_products_name_trgm
+            conditions.append("name ILIKE %s")
+            params.append("%" + re.sub(r'([%_\\])', r'\\\1', search) + "%")
+        return " AND ".join(conditions) or "TRUE", params
+
+    def get_products_page(self, sort: str = None, category: str = None, search: str = None,
+                          after: Optional[tuple] = None,
+                          limit: int = CATALOG_PAGE_SIZE) -> Optional[Dict[str, object]]:
+        """Страница каталога с keyset-пагинацией.
+
+        Товары упорядочены по (ключ сортировки, id); after — курсор 'cursor'
+        предыдущей страницы, страница начинается сразу за ним. Запрашивается
+        limit + 1 строка: лишняя говорит о том, что есть следующая страница.
+        """
+        sort_key = CATALOG_SORT_KEYS.get(sort, "id")
+        where, params = self._catalog_filter(category, search)
+        if after is not None:
+            where += f" AND ({sort_key}, id) > (%s, %s)"
+            params.extend(after)
+        try:
+            with self.transaction() as cur:
+                cur.execute(f"""
+                    SELECT id, name, price, quantity, barcode, image, category,
+                           purchase_price, retail_price, {sort_key}
+                    FROM products
+                    WHERE {where}
+                    ORDER BY {sort_key}, id
+                    LIMIT %s
+                """, params + [limit + 1])
+                rows = cur.fetchall()
+            page = rows[:limit]
+            return {
+                "products": [self._product_from_row(row) for row in page],
+                "cursor": (page[-1][9], page[-1][0]) if page else after,
+                "has_more": len(rows) > limit,
+            }
+        except Exception as e:
+            print(f"Ошибка при загрузке страницы каталога: {e}")
+            return None
+
+    def estimate_product_count(self, category: str = None, search: str = None) -> Tuple[int, bool]:
+        """Число товаров под фильтром: (количество, точное ли оно).
+
+        Без фильтров берётся оценка планировщика из pg_class.reltuples, с
+        фильтром строки пересчитываются, но не дальше CATALOG_EXACT_COUNT_LIMIT.
+        """
+        where, params = self._catalog_filter(category, search)
+        try:
+            with self.transaction() as cur:
+                if not params:
+                    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'products'::regclass")
+                    estimate = cur.fetchone()[0]
+                    if estimate > 0:  # -1 — таблица ещё не анализировалась
+                        return estimate, False
+                cur.execute(f"""
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM products WHERE {where} LIMIT %s
+                    ) AS sample
+                """, params + [CATALOG_EXACT_COUNT_LIMIT + 1])
+                count = cur.fetchone()[0]
+            return min(count, CATALOG_EXACT_COUNT_LIMIT), count <= CATALOG_EXACT_COUNT_LIMIT
+        except Exception as e:
+            print(f"Ошибка при оценке числа товаров: {e}")
+            return 0, False
+
+    def get_products_quantity_total(self, category: str = None, search: str = None) -> int:
+        """Суммарный остаток товаров под фильтром каталога"""
+        where, params = self._catalog_filter(category, search)
+        try:
+            with self.transaction() as cur:
+                cur.execute(f"SELECT COALESCE(SUM(quantity), 0) FROM products WHERE {where}", params)
+                return cur.fetchone()[0]
+        except Exception as e:
+            print(f"Ошибка при подсчёте остатка товаров: {e}")
+            return 0
+
+    def product_name_exists(self, name: str, exclude_id: int = None) -> bool:
+        """Есть ли товар с таким названием без учёта регистра (кроме exclude_id)"""
+        with self.transaction() as cur:
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM products WHERE LOWER(name) = LOWER(%s) AND id IS DISTINCT FROM %s)",
+                (name, exclude_id)
+            )
+            return cur.fetchone()[0]
+
+    def get_product_by_barcode(self, barcode: str) -> Optional[Dict[str, Union[str, None]]]:
+        """Товар по штрихкоду — точечный поиск по индексу idx_products_barcode"""
+        if not barcode:
+            return None
+        try:
+            with self.transaction() as cur:
+                cur.execute(
+                    "SELECT id, name, price, quantity, barcode, image, category, purchase_price, retail_price FROM products WHERE barcode = %s AND barcode <> '' LIMIT 1",
+                    (barcode,)
+                )
+                row = cur.fetchone()
+            return self._product_from_row(row) if row else None
+        except psycopg2.Error as e:
+            print(f"Ошибка при поиске товара по штрихкоду: {e}")
+            return None
+
+    def get_barcode_products(self, product_ids=None) -> List[Dict[str, Union[str, None]]]:
+        """Товары со штрихкодом (все или из product_ids) — только поля, нужные кассе"""
+        try:
+            with self.transaction() as cur:
+                if product_ids is None:
+                    cur.execute("SELECT id, name, price, retail_price, barcode FROM products WHERE barcode <> ''")
+                else:
+                    cur.execute(
+                        "SELECT id, name, price, retail_price, barcode FROM products WHERE barcode <> '' AND id = ANY(%s)",
+                        (list(product_ids),)
+                    )
+                rows = cur.fetchall()
             return [{
                 "id": row[0],
                 "name": row[1],
                 "price": row[2],
-                "quantity": row[3],
-                "barcode": row[4],
-                "image": row[5],
-                "category": row[6] if row[6] else "Без категории",
-                "purchase_price": row[7],
-                "retail_price": row[8]
-            } for row in self.cursor.fetchall()]
+                "retail_price": row[3],
+                "barcode": row[4]
+            } for row in rows]
         except Exception as e:
-            print(f"Ошибка при получении списка товаров: {e}")
-            self.get_connection()
+            print(f"Ошибка при загрузке штрихкодов товаров: {e}")
             return []
 
     def get_products_by_category(self, category: str) -> List[Dict[str, Union[str, None]]]:
         """Получение товаров по категории с обработкой ошибок"""
         try:
-            if not self.cursor or self.cursor.closed:
-                self.get_connection()
-                
-            if category == "Без категории":
-                self.cursor.execute("SELECT name, price, quantity, barcode, image, category FROM products WHERE category IS NULL")
-            else:
-                self.cursor.execute("SELECT name, price, quantity, barcode, image, category FROM products WHERE category = %s", (category,))
-                
+            with self.transaction() as cur:
+                if category == "Без категории":
+                    cur.execute("SELECT name, price, quantity, barcode, image, category FROM products WHERE category IS NULL")
+                else:
+                    cur.execute("SELECT name, price, quantity, barcode, image, category FROM products WHERE category = %s", (category,))
+                rows = cur.fetchall()
+
             return [{
                 "name": row[0],
                 "price": row[1],
@@ -466,74 +839,89 @@ class DatabaseManager:
                 "barcode": row[3],
                 "image": row[4],
                 "category": row[5] if row[5] else "Без категории"
-            } for row in self.cursor.fetchall()]
+            } for row in rows]
         except Exception as e:
             print(f"Ошибка при получении товаров по категории: {e}")
-            self.get_connection()
             return []
 
     def add_category(self, category_name: str) -> bool:
         try:
-            self.cursor.execute("INSERT INTO categories (name) VALUES (%s)", (category_name,))
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute("INSERT INTO categories (name) VALUES (%s)", (category_name,))
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при добавлении категории: {e}")
-            self.connection.rollback()
             return False
 
     def delete_category(self, category_name: str) -> bool:
         try:
-            self.cursor.execute("DELETE FROM categories WHERE name = %s", (category_name,))
-            self.cursor.execute("UPDATE products SET category = NULL WHERE category = %s", (category_name,))
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute("DELETE FROM categories WHERE name = %s", (category_name,))
+                cur.execute("UPDATE products SET category = NULL WHERE category = %s", (category_name,))
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при удалении категории: {e}")
-            self.connection.rollback()
             return False
+        finally:
+            self.invalidate_category_min_quantities()
 
     def get_all_categories(self) -> List[str]:
-        self.cursor.execute("SELECT name FROM categories")
-        return [row[0] for row in self.cursor.fetchall()]
+        with self.transaction() as cur:
+            cur.execute("SELECT name FROM categories")
+            return [row[0] for row in cur.fetchall()]
 
     def search_products(self, search_term: str) -> List[Dict[str, Union[str, None]]]:
-        """Поиск товаров с обработкой ошибок"""
+        """Поиск товаров по названию и категории, лучшие совпадения первыми.
+
+        ILIKE '%...%' обслуживается триграммными GIN-индексами (миграция 10).
+        Порядок тот же, что у ProductSearchIndex: полное совпадение названия,
+        совпадение с начала, более раннее вхождение, более короткое название.
+        """
         try:
-            if not self.cursor or self.cursor.closed:
-                self.get_connection()
-                
-            search_term = f"%{search_term}%"
-            self.cursor.execute(
-                "SELECT name, price, quantity, image, category FROM products WHERE name ILIKE %s OR category ILIKE %s",
-                (search_term, search_term)
-            )
+            pattern = "%" + re.sub(r'([%_\\])', r'\\\1', search_term) + "%"
+            with self.transaction() as cur:
+                cur.execute("""
+                    SELECT name, price, quantity, image, category
+                    FROM products
+                    WHERE name ILIKE %(pattern)s OR category ILIKE %(pattern)s
+                    ORDER BY LOWER(name) = LOWER(%(term)s) DESC,
+                             NULLIF(STRPOS(LOWER(name), LOWER(%(term)s)), 0) NULLS LAST,
+                             LENGTH(name),
+                             name
+                """, {'pattern': pattern, 'term': search_term})
+                rows = cur.fetchall()
             return [{
                 "name": row[0],
                 "price": row[1],
                 "quantity": row[2],
                 "image": row[3],
                 "category": row[4] if row[4] else "Без категории"
-            } for row in self.cursor.fetchall()]
+            } for row in rows]
         except Exception as e:
             print(f"Ошибка при поиске товаров: {e}")
-            self.get_connection()
             return []
 
     def get_all_users(self):
-        self.cursor.execute("SELECT username, role, name, photo_data, email FROM users")
+        """Список пользователей без фото: вместо BYTEA отдаётся photo_hash,
+        само фото загружается отдельно через get_user_photo. Для фото, сохранённых
+        только файлом, отдаётся photo_path"""
+        with self.transaction() as cur:
+            cur.execute("SELECT username, role, name, photo_hash, email, photo_path FROM users")
+            rows = cur.fetchall()
         return [{
             "username": row[0],
             "role": row[1],
             "name": row[2] if row[2] else row[0],
-            "photo_data": row[3],
-            "email": row[4]
-        } for row in self.cursor.fetchall()]
+            "photo_hash": row[3],
+            "email": row[4],
+            "photo_path": row[5]
+        } for row in rows]
 
     def get_product_by_name(self, name: str) -> Optional[Dict[str, Union[str, None]]]:
         try:
-            self.cursor.execute("SELECT id, name, price, quantity, barcode, image, category FROM products WHERE name = %s", (name,))
-            row = self.cursor.fetchone()
+            with self.transaction() as cur:
+                cur.execute("SELECT id, name, price, quantity, barcode, image, category FROM products WHERE name = %s", (name,))
+                row = cur.fetchone()
             if row:
                 return {
                     "id": row[0],
@@ -551,279 +939,317 @@ class DatabaseManager:
 
     def delete_user(self, username):
         try:
-            # Удаляем все продажи пользователя
-            self.cursor.execute("DELETE FROM sales_history WHERE username = %s", (username,))
-            # Здесь можно добавить удаление других связанных данных, если появятся
-            # Удаляем самого пользователя
-            self.cursor.execute("DELETE FROM users WHERE username = %s", (username,))
-            self.connection.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction() as cur:
+                # Удаляем все продажи пользователя
+                cur.execute("DELETE FROM sales_history WHERE username = %s", (username,))
+                # Здесь можно добавить удаление других связанных данных, если появятся
+                # Удаляем самого пользователя
+                cur.execute("DELETE FROM users WHERE username = %s", (username,))
+                return cur.rowcount > 0
         except Exception as e:
             print(f"Ошибка при удалении пользователя: {e}")
-            self.connection.rollback()
             return False
 
-    def add_sale(self, product_id: int, quantity: int, sale_date: str, username: str, sale_price: float) -> bool:
+    def add_sale(self, product_id: int, quantity: int, sale_date: Optional[datetime], username: str, sale_price: float) -> bool:
+        """Продажа одного товара; sale_date — момент продажи (None — текущее время сервера)"""
+        results = self.checkout(
+            [{"id": product_id, "quantity": quantity, "price": sale_price}], username, sale_date
+        )
+        return bool(results) and results[0]["status"] == CHECKOUT_OK
+
+    def checkout(self, cart: List[Dict], username: str, sale_date: Optional[datetime] = None) -> Optional[List[Dict]]:
+        """Оформляет заказ целиком в одной транзакции.
+
+        cart — строки корзины с ключами id, quantity, price (name — для сообщений).
+        Все товары блокируются одним SELECT ... FOR UPDATE, продажи и движения
+        записываются многострочными вставками (низкие остатки ведёт триггер). Если хотя бы
+        одной строки не хватает, ничего не записывается.
+
+        Возвращает по словарю на строку корзины: id, name, requested, available,
+        status (CHECKOUT_OK / CHECKOUT_NOT_FOUND / CHECKOUT_INSUFFICIENT);
+        None — если заказ не удалось записать из-за ошибки базы данных.
+        Если в корзине есть строки с нечисловым количеством или количеством
+        меньше единицы, товары не блокируются и возвращаются только эти строки
+        со статусом CHECKOUT_INVALID_QUANTITY (available — None).
+        """
+        quantities = []
+        for item in cart:
+            try:
+                quantities.append(int(item["quantity"]))
+            except (TypeError, ValueError):
+                quantities.append(None)
+        rejected = [{
+            "id": item.get("id"),
+            "name": item.get("name"),
+            "requested": item.get("quantity"),
+            "available": None,
+            "status": CHECKOUT_INVALID_QUANTITY,
+        } for item, quantity in zip(cart, quantities) if quantity is None or quantity <= 0]
+        if rejected:
+            return rejected
+        requested = {}
+        for item, quantity in zip(cart, quantities):
+            product_id = int(item["id"])
+            requested[product_id] = requested.get(product_id, 0) + quantity
         try:
-            # Начинаем транзакцию
-            self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
-            # Получаем товар по id
-            self.cursor.execute(
-                "SELECT name, quantity FROM products WHERE id = %s FOR UPDATE",
-                (product_id,)
-            )
-            result = self.cursor.fetchone()
-            if not result:
-                self.connection.rollback()
-                return False
-            product_name, current_quantity = result
-            current_quantity = int(current_quantity)
-            if current_quantity < quantity:
-                self.connection.rollback()
-                return False
-            # Обновляем количество товара
-            new_quantity = current_quantity - quantity
-            self.cursor.execute(
-                "UPDATE products SET quantity = %s WHERE id = %s",
-                (str(new_quantity), product_id)
-            )
-            # Добавляем запись о продаже
-            self.cursor.execute(
-                """INSERT INTO sales_history 
-                   (product_id, product_name, quantity, sale_date, username, sale_price) 
-                   VALUES (%s, %s, %s, %s, %s, %s) RETURNING id""",
-                (product_id, product_name, quantity, sale_date, username, sale_price)
-            )
-            sale_id = self.cursor.fetchone()[0]
-            # Записываем движение товара
-            self.cursor.execute("""
-                INSERT INTO product_movement 
-                (product_id, movement_type, quantity, previous_quantity, new_quantity, 
-                 username, reference_id, reference_type, comment)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                product_id, 'OUT', quantity, current_quantity, new_quantity,
-                username, sale_id, 'Продажа', f'Продажа по цене {sale_price}'
-            ))
-            # Проверяем, не нужно ли добавить товар в low_stock_products
-            self.cursor.execute(
-                "SELECT min_quantity FROM category_min_quantities WHERE category = (SELECT category FROM products WHERE id = %s)",
-                (product_id,)
-            )
-            min_quantity_result = self.cursor.fetchone()
-            if min_quantity_result and new_quantity <= min_quantity_result[0]:
-                self.cursor.execute(
-                    """INSERT INTO low_stock_products (product_name, category, quantity, min_quantity)
-                       SELECT name, category, quantity, %s
-                       FROM products
-                       WHERE id = %s
-                       ON CONFLICT (product_name) DO UPDATE
-                       SET quantity = EXCLUDED.quantity""",
-                    (min_quantity_result[0], product_id)
-                )
-            self.connection.commit()
-            return True
+            with self.transaction() as cur:
+                # Порядок по id исключает взаимные блокировки между параллельными заказами
+                cur.execute("""
+                    SELECT p.id, p.name, p.quantity, p.purchase_price, p.category
+                    FROM products p
+                    WHERE p.id = ANY(%s)
+                    ORDER BY p.id
+                    FOR UPDATE OF p
+                """, (list(requested),))
+                products = {row[0]: row for row in cur.fetchall()}
+
+                results = []
+                for item, quantity in zip(cart, quantities):
+                    product_id = int(item["id"])
+                    product = products.get(product_id)
+                    available = product[2] if product else 0
+                    if product is None:
+                        status = CHECKOUT_NOT_FOUND
+                    elif available < requested[product_id]:
+                        status = CHECKOUT_INSUFFICIENT
+                    else:
+                        status = CHECKOUT_OK
+                    results.append({
+                        "id": product_id,
+                        "name": product[1] if product else item.get("name"),
+                        "requested": quantity,
+                        "available": available,
+                        "status": status,
+                    })
+                if any(result["status"] != CHECKOUT_OK for result in results):
+                    return results
+
+                new_quantities = {
+                    product_id: products[product_id][2] - quantity
+                    for product_id, quantity in requested.items()
+                }
+                execute_values(cur, """
+                    UPDATE products SET quantity = v.quantity
+                    FROM (VALUES %s) AS v(id, quantity)
+                    WHERE products.id = v.id
+                """, list(new_quantities.items()))
+
+                # Закупочная цена запоминается на момент продажи — прибыль не меняется задним числом;
+                # категория — ключ дневного агрегата, по ней же продажа потом и вычитается
+                sale_rows = [
+                    (int(item["id"]), products[int(item["id"])][1], quantity,
+                     sale_date, username, float(item["price"]), products[int(item["id"])][3],
+                     products[int(item["id"])][4])
+                    for item, quantity in zip(cart, quantities)
+                ]
+                sale_ids = execute_values(cur, """
+                    INSERT INTO sales_history
+                        (product_id, product_name, quantity, sale_date, username, sale_price, purchase_price, category)
+                    VALUES %s
+                    RETURNING id
+                """, sale_rows, template="(%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s, %s, %s, %s)", fetch=True)
+
+                # Остаток до продажи считается последовательно, если товар повторяется в корзине
+                running = {product_id: products[product_id][2] for product_id in requested}
+                movement_rows = []
+                for (product_id, _, quantity, _, _, sale_price, _, _), (sale_id,) in zip(sale_rows, sale_ids):
+                    previous = running[product_id]
+                    running[product_id] = previous - quantity
+                    movement_rows.append((
+                        product_id, 'OUT', quantity, previous, running[product_id],
+                        username, sale_id, 'Продажа', f'Продажа по цене {sale_price}'
+                    ))
+                execute_values(cur, """
+                    INSERT INTO product_movement
+                        (product_id, movement_type, quantity, previous_quantity, new_quantity,
+                         username, reference_id, reference_type, comment)
+                    VALUES %s
+                """, movement_rows)
+            # Набор low_stock_products обновляет триггер на products.quantity
+            return results
         except Exception as e:
-            print(f"[add_sale] Ошибка при добавлении продажи: {e}")
-            self.connection.rollback()
-            return False
-        finally:
-            self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+            print(f"[checkout] Ошибка при оформлении заказа: {e}")
+            return None
 
     def get_sales_history(self, username: str) -> List[Dict[str, str]]:
-        self.cursor.execute(
-            "SELECT product_name, SUM(quantity) as total_qty, sale_date, sale_price FROM sales_history WHERE username = %s GROUP BY product_name, sale_date, sale_price ORDER BY sale_date DESC",
-            (username,)
-        )
+        with self.transaction() as cur:
+            cur.execute(
+                "SELECT product_name, SUM(quantity) as total_qty, sale_date::date as day, sale_price FROM sales_history WHERE username = %s GROUP BY product_name, day, sale_price ORDER BY day DESC",
+                (username,)
+            )
+            rows = cur.fetchall()
         return [
             {"product_name": row[0], "quantity": row[1], "sale_date": row[2], "sale_price": row[3]}
-            for row in self.cursor.fetchall()
+            for row in rows
         ]
 
     def clear_sales_history(self):
         """Удаляет всю историю продаж"""
         try:
-            self.cursor.execute("DELETE FROM sales_history")
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute("DELETE FROM sales_history")
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при очистке истории продаж: {e}")
-            self.connection.rollback()
             return False
 
     def get_sales_history_by_period(self, username: str, period: str = "week") -> list:
         if period == "week":
-            self.cursor.execute(
-                """
-                SELECT product_name, SUM(quantity) as total_qty, 
-                       EXTRACT(YEAR FROM sale_date::date) as year, EXTRACT(WEEK FROM sale_date::date) as week,
-                       MIN(sale_date) as week_start, MAX(sale_date) as week_end
-                FROM sales_history 
-                WHERE username = %s
-                GROUP BY product_name, year, week
-                ORDER BY year DESC, week DESC
-                """,
-                (username,)
-            )
-            result = []
-            for row in self.cursor.fetchall():
-                try:
-                    start = datetime.strptime(row[4], "%Y-%m-%d").strftime("%d.%m.%Y")
-                    end = datetime.strptime(row[5], "%Y-%m-%d").strftime("%d.%m.%Y")
-                    period_str = f"{start} — {end}"
-                except Exception:
-                    period_str = f"Неделя {row[3]}, {row[2]}"
-                result.append({
+            with self.transaction() as cur:
+                cur.execute(
+                    """
+                    SELECT product_name, SUM(quantity) as total_qty,
+                           DATE_TRUNC('week', sale_date) as week,
+                           MIN(sale_date) as week_start, MAX(sale_date) as week_end
+                    FROM sales_history 
+                    WHERE username = %s
+                    GROUP BY product_name, week
+                    ORDER BY week DESC
+                    """,
+                    (username,)
+                )
+                rows = cur.fetchall()
+            return [
+                {
                     "product_name": row[0],
                     "quantity": row[1],
-                    "period": period_str
-                })
-            return result
+                    "period": f"{row[3]:%d.%m.%Y} — {row[4]:%d.%m.%Y}"
+                }
+                for row in rows
+            ]
         elif period == "month":
-            self.cursor.execute(
-                """
-                SELECT product_name, SUM(quantity) as total_qty, 
-                       EXTRACT(YEAR FROM sale_date::date) as year, EXTRACT(MONTH FROM sale_date::date) as month,
-                       MIN(sale_date) as month_start
-                FROM sales_history 
-                WHERE username = %s
-                GROUP BY product_name, year, month
-                ORDER BY year DESC, month DESC
-                """,
-                (username,)
-            )
-            result = []
-            for row in self.cursor.fetchall():
-                try:
-                    month_name = datetime.strptime(row[4], "%Y-%m-%d").strftime("%B %Y")
-                except Exception:
-                    month_name = f"{row[3]}.{row[2]}"
-                result.append({
-                    "product_name": row[0],
-                    "quantity": row[1],
-                    "period": month_name
-                })
-            return result
+            with self.transaction() as cur:
+                cur.execute(
+                    """
+                    SELECT product_name, SUM(quantity) as total_qty,
+                           DATE_TRUNC('month', sale_date) as month
+                    FROM sales_history 
+                    WHERE username = %s
+                    GROUP BY product_name, month
+                    ORDER BY month DESC
+                    """,
+                    (username,)
+                )
+                rows = cur.fetchall()
+            return [
+                {"product_name": row[0], "quantity": row[1], "period": row[2].strftime("%B %Y")}
+                for row in rows
+            ]
         else:
             return self.get_sales_history(username)
 
     def get_sales_history_for_period(self, username: str = None, period: str = "day") -> list:
         try:
-            today = datetime.now()
+            today = datetime.now().date()
             if period == "day":
-                date_str = today.strftime("%Y-%m-%d")
-                query = "SELECT product_name, SUM(quantity), sale_date, sale_price, username FROM sales_history WHERE sale_date = %s"
-                params = [date_str]
+                start, end = today, today + timedelta(days=1)
             elif period == "week":
-                start_of_week = (today - timedelta(days=today.weekday())).strftime("%Y-%m-%d")
-                end_of_week = (today + timedelta(days=6-today.weekday())).strftime("%Y-%m-%d")
-                query = "SELECT product_name, SUM(quantity), sale_date, sale_price, username FROM sales_history WHERE sale_date BETWEEN %s AND %s"
-                params = [start_of_week, end_of_week]
+                start = today - timedelta(days=today.weekday())
+                end = start + timedelta(days=7)
             elif period == "month":
-                start_of_month = today.replace(day=1).strftime("%Y-%m-%d")
+                start = today.replace(day=1)
                 if today.month == 12:
-                    next_month = today.replace(year=today.year+1, month=1, day=1)
+                    end = start.replace(year=today.year+1, month=1)
                 else:
-                    next_month = today.replace(month=today.month+1, day=1)
-                end_of_month = (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
-                query = "SELECT product_name, SUM(quantity), sale_date, sale_price, username FROM sales_history WHERE sale_date BETWEEN %s AND %s"
-                params = [start_of_month, end_of_month]
+                    end = start.replace(month=today.month+1)
             else:
                 return []
 
+            # Полуоткрытый диапазон [start, end) использует индекс по sale_date.
+            # Название — текущее у товара (по id), у удалённых товаров — из продажи
+            query = """
+                SELECT COALESCE(p.name, s.product_name) AS product_name, SUM(s.quantity), s.sale_date::date as day,
+                       s.sale_price, s.username,
+                       SUM(s.quantity * s.purchase_price), BOOL_OR(s.purchase_price IS NULL)
+                FROM sales_history s
+                LEFT JOIN products p ON p.id = s.product_id
+                WHERE s.sale_date >= %s AND s.sale_date < %s
+            """
+            params = [start, end]
+
             # Добавляем фильтр по пользователю, если он указан
             if username:
-                query += " AND username = %s"
+                query += " AND s.username = %s"
                 params.append(username)
 
-            query += " GROUP BY product_name, sale_date, sale_price, username ORDER BY sale_date DESC"
-            self.cursor.execute(query, params)
+            query += " GROUP BY 1, day, s.sale_price, s.username ORDER BY day DESC"
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                rows = cur.fetchall()
 
-            result = [
-                {"product_name": row[0], "quantity": row[1], "sale_date": row[2], "sale_price": row[3], "username": row[4]} 
-                for row in self.cursor.fetchall()
+            return [
+                {"product_name": row[0], "quantity": row[1], "sale_date": row[2], "sale_price": row[3],
+                 "username": row[4], "purchase_total": row[5], "purchase_missing": row[6]}
+                for row in rows
             ]
-            self.connection.commit()
-            return result
 
         except Exception as e:
             print(f"Ошибка при получении истории продаж: {e}")
-            self.connection.rollback()
             return []
 
     def get_sales_data(self, period='day', username=None):
         try:
             if period == 'day':
                 interval = '1 day'
-                group_by = "sale_date"
-                date_format = "DD.MM.YYYY"
             elif period == 'week':
                 interval = '7 days'
-                group_by = "sale_date"
-                date_format = "DD.MM.YYYY"
             elif period == 'month':
                 interval = '30 days'
-                group_by = "sale_date"
-                date_format = "DD.MM.YYYY"
             else:  # year
                 interval = '365 days'
-                group_by = "sale_date"
-                date_format = "DD.MM.YYYY"
+            date_format = "DD.MM.YYYY"
 
             query = f'''
                 SELECT 
-                    TO_CHAR({group_by}, '{date_format}') as date,
-                    COUNT(*) as total_sales,
+                    TO_CHAR(day, '{date_format}') as date,
+                    SUM(sales_count) as total_sales,
                     SUM(quantity) as total_amount,
                     SUM(quantity) as total_quantity
-                FROM sales_history
-                WHERE sale_date >= CURRENT_DATE - INTERVAL '{interval}'
+                FROM sales_daily_sellers
+                WHERE day >= CURRENT_DATE - INTERVAL '{interval}'
             '''
             params = []
             if username:
                 query += " AND username = %s"
                 params.append(username)
-            query += f" GROUP BY {group_by} ORDER BY {group_by}"
+            query += " GROUP BY day ORDER BY day"
 
-            self.cursor.execute(query, params)
-            result = self.cursor.fetchall()
-            self.connection.commit()
-            return result
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                return cur.fetchall()
 
         except Exception as e:
             print(f"Ошибка при получении данных о продажах: {e}")
-            self.connection.rollback()
             return []
 
     def update_user_profile(self, username: str, name: str = None, photo_path: str = None, email: str = None) -> bool:
         try:
-            self.cursor.execute(
-                "UPDATE users SET name = %s, photo_path = %s, email = %s WHERE username = %s",
-                (name, photo_path, email, username)
-            )
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute(
+                    "UPDATE users SET name = %s, photo_path = %s, email = %s WHERE username = %s",
+                    (name, photo_path, email, username)
+                )
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при обновлении профиля: {e}")
-            self.connection.rollback()
             return False
 
     def update_user_password(self, username: str, new_password: str) -> bool:
         try:
-            self.cursor.execute(
-                "UPDATE users SET password = %s WHERE username = %s",
-                (new_password, username)
-            )
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute(
+                    "UPDATE users SET password = %s WHERE username = %s",
+                    (new_password, username)
+                )
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при обновлении пароля: {e}")
-            self.connection.rollback()
             return False
 
     def get_user_profile(self, username: str) -> dict:
-        self.cursor.execute("SELECT username, name, role, photo_path, photo_data, email FROM users WHERE username = %s", (username,))
-        row = self.cursor.fetchone()
+        with self.transaction() as cur:
+            cur.execute("SELECT username, name, role, photo_path, photo_data, email FROM users WHERE username = %s", (username,))
+            row = cur.fetchone()
         if row:
             return {
                 "username": row[0],
@@ -837,11 +1263,12 @@ class DatabaseManager:
 
     def authenticate_user(self, login_or_email: str, password: str):
         try:
-            self.cursor.execute(
-                "SELECT username, role FROM users WHERE (username = %s OR email = %s) AND password = %s",
-                (login_or_email, login_or_email, password)
-            )
-            user = self.cursor.fetchone()
+            with self.transaction() as cur:
+                cur.execute(
+                    "SELECT username, role FROM users WHERE (username = %s OR email = %s) AND password = %s",
+                    (login_or_email, login_or_email, password)
+                )
+                user = cur.fetchone()
             if user:
                 return user  # (username, role)
             return None
@@ -850,42 +1277,44 @@ class DatabaseManager:
             return None
 
     def add_test_products(self, count=1000):
-        for i in range(1, count+1):
-            name = str(i)
-            price = '100'
-            quantity = '100'
-            image = None
-            category = 'Тест'
-            try:
-                self.cursor.execute(
-                    "INSERT INTO products (name, price, quantity, image, category) VALUES (%s, %s, %s, %s, %s)",
-                    (name, price, quantity, image, category)
-                )
-            except Exception as e:
-                print(f"Ошибка при добавлении товара {name}: {e}")
-                self.connection.rollback()
-        self.connection.commit()
+        with self.transaction() as cur:
+            for i in range(1, count+1):
+                name = str(i)
+                price = '100'
+                quantity = '100'
+                image = None
+                category = 'Тест'
+                try:
+                    cur.execute("SAVEPOINT test_product")
+                    cur.execute(
+                        "INSERT INTO products (name, price, quantity, image, category) VALUES (%s, %s, %s, %s, %s)",
+                        (name, price, quantity, image, category)
+                    )
+                    cur.execute("RELEASE SAVEPOINT test_product")
+                except Exception as e:
+                    print(f"Ошибка при добавлении товара {name}: {e}")
+                    cur.execute("ROLLBACK TO SAVEPOINT test_product")
 
     def update_user_photo(self, username: str, image_bytes: bytes) -> bool:
         try:
-            self.cursor.execute(
-                "UPDATE users SET photo_data = %s WHERE username = %s",
-                (psycopg2.Binary(image_bytes), username)
-            )
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute(
+                    "UPDATE users SET photo_data = %s WHERE username = %s",
+                    (psycopg2.Binary(image_bytes), username)
+                )
             return True
         except Exception as e:
             print(f"Ошибка при сохранении фото пользователя: {e}")
-            self.connection.rollback()
             return False
 
     def get_user_photo(self, username: str) -> Optional[bytes]:
         try:
-            self.cursor.execute(
-                "SELECT photo_data FROM users WHERE username = %s",
-                (username,)
-            )
-            row = self.cursor.fetchone()
+            with self.transaction() as cur:
+                cur.execute(
+                    "SELECT photo_data FROM users WHERE username = %s",
+                    (username,)
+                )
+                row = cur.fetchone()
             return row[0] if row and row[0] else None
         except Exception as e:
             print(f"Ошибка при получении фото пользователя: {e}")
@@ -904,149 +1333,190 @@ class DatabaseManager:
         else:
             interval = '1 day'
         query = '''
-            SELECT product_name, SUM(quantity) as total_qty
-            FROM sales_history
-            WHERE sale_date >= CURRENT_DATE - INTERVAL '%s'
+            SELECT COALESCE(p.name, d.product_name), SUM(d.quantity) as total_qty
+            FROM sales_daily_products d
+            LEFT JOIN products p ON p.id = d.product_id
+            WHERE d.day >= CURRENT_DATE - INTERVAL '%s'
         ''' % interval
         params = []
         if username:
-            query += ' AND username = %s'
+            query += ' AND d.username = %s'
             params.append(username)
-        query += ' GROUP BY product_name ORDER BY total_qty DESC LIMIT 5'
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
+        query += ' GROUP BY 1 ORDER BY total_qty DESC LIMIT 5'
+        with self.transaction() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
 
     def get_sales_data_for_period(self, date_from, date_to, group_by='По дням', username=None):
         try:
-            if group_by == 'По дням':
-                group_sql = "sale_date::date"
-                date_format = "DD.MM.YYYY"
-            elif group_by == 'По неделям':
-                group_sql = "DATE_TRUNC('week', sale_date::date)"
-                date_format = "IYYY-IW"  # Год-неделя
-            elif group_by == 'По месяцам':
-                group_sql = "DATE_TRUNC('month', sale_date::date)"
-                date_format = "MM.YYYY"
-            else:
-                group_sql = "sale_date::date"
-                date_format = "DD.MM.YYYY"
+            step, date_format = SALES_PERIOD_GROUPS.get(group_by, SALES_PERIOD_GROUPS['По дням'])
+            group_sql = f"DATE_TRUNC('{step}', day)"
 
+            # Читается из дневных агрегатов: объём не зависит от числа продаж
             query = f'''
                 SELECT 
                     TO_CHAR({group_sql}, '{date_format}') as date,
-                    COUNT(*) as total_sales,
+                    SUM(sales_count) as total_sales,
                     SUM(quantity) as total_amount,
                     SUM(quantity) as total_quantity
-                FROM sales_history
-                WHERE sale_date BETWEEN %s AND %s
+                FROM sales_daily_sellers
+                WHERE day BETWEEN %s::date AND %s::date
             '''
             params = [date_from, date_to]
             if username:
                 query += " AND username = %s"
                 params.append(username)
             query += f" GROUP BY {group_sql} ORDER BY {group_sql}"
-            self.cursor.execute(query, params)
-            result = self.cursor.fetchall()
-            self.connection.commit()
-            return result
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                return cur.fetchall()
         except Exception as e:
             print(f"Ошибка при получении данных о продажах: {e}")
-            self.connection.rollback()
             return []
 
     def get_top_products_for_period(self, date_from, date_to, group_by='По дням', username=None):
         try:
             query = '''
-                SELECT product_name, SUM(quantity) as total_qty
-                FROM sales_history
-                WHERE sale_date BETWEEN %s AND %s
+                SELECT COALESCE(p.name, d.product_name), SUM(d.quantity) as total_qty
+                FROM sales_daily_products d
+                LEFT JOIN products p ON p.id = d.product_id
+                WHERE d.day BETWEEN %s::date AND %s::date
             '''
             params = [date_from, date_to]
             if username:
-                query += ' AND username = %s'
+                query += ' AND d.username = %s'
                 params.append(username)
-            query += ' GROUP BY product_name ORDER BY total_qty DESC LIMIT 5'
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            query += ' GROUP BY 1 ORDER BY total_qty DESC LIMIT 5'
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                return cur.fetchall()
         except Exception as e:
             print(f"Ошибка при получении топ-5 товаров: {e}")
             return []
 
+    def get_sales_matrix(self, date_from, date_to, group_by='По дням') -> Optional[Dict[str, object]]:
+        """Продажи по продавцам за период в виде плотной матрицы.
+
+        Возвращает {'labels': подписи периодов, 'usernames': логины,
+        'names': отображаемые имена, 'matrix': np.ndarray (периоды × продавцы)}.
+        Периоды без продаж заполняются нулями через generate_series.
+        """
+        step, date_format = SALES_PERIOD_GROUPS.get(group_by, SALES_PERIOD_GROUPS['По дням'])
+        try:
+            with self.transaction() as cur:
+                # Сетка периодов × продавцов, продажи подставляются LEFT JOIN-ом
+                cur.execute(f"""
+                    WITH periods AS (
+                        SELECT generate_series(DATE_TRUNC('{step}', %(date_from)s::date),
+                                               %(date_to)s::date, INTERVAL '1 {step}')::date AS period
+                    ),
+                    sellers AS (
+                        SELECT username, COALESCE(NULLIF(name, ''), username) AS name
+                        FROM users
+                        WHERE role = ANY(%(roles)s)
+                    ),
+                    sales AS (
+                        SELECT DATE_TRUNC('{step}', day)::date AS period, username, SUM(quantity) AS quantity
+                        FROM sales_daily_sellers
+                        WHERE day BETWEEN %(date_from)s::date AND %(date_to)s::date
+                        GROUP BY 1, username
+                    )
+                    SELECT TO_CHAR(p.period, '{date_format}'), s.username, s.name,
+                           COALESCE(sales.quantity, 0)
+                    FROM periods p
+                    LEFT JOIN sellers s ON TRUE
+                    LEFT JOIN sales ON sales.period = p.period AND sales.username = s.username
+                    ORDER BY p.period, s.username
+                """, {'date_from': date_from, 'date_to': date_to, 'roles': list(SELLER_ROLES)})
+                rows = cur.fetchall()
+            # Строки идут по периодам, внутри периода — по продавцам;
+            # без продавцов на период приходится одна строка с NULL
+            first_period = list(takewhile(lambda row: row[0] == rows[0][0], rows))
+            sellers = [(row[1], row[2]) for row in first_period if row[1] is not None]
+            width = max(len(sellers), 1)
+            values = np.fromiter((row[3] for row in rows), dtype=np.int64, count=len(rows))
+            return {
+                'labels': [row[0] for row in rows[::width]],
+                'usernames': [username for username, _ in sellers],
+                'names': [name for _, name in sellers],
+                'matrix': values.reshape(-1, width)[:, :len(sellers)],
+            }
+        except Exception as e:
+            print(f"Ошибка при получении продаж по продавцам: {e}")
+            return None
+
+    def get_weekday_profile(self, date_from=None, date_to=None, username=None) -> Dict[str, List[float]]:
+        """Продажи по дням недели за период (индекс 0=Пн, 6=Вс).
+
+        Агрегирует дневную сводку sales_daily_sellers на сервере и возвращает
+        {'sums': количество товара, 'counts': число продаж,
+         'averages': среднее количество товара в одной продаже}.
+        """
+        sums = [0] * 7
+        counts = [0] * 7
+        try:
+            query = """
+                SELECT EXTRACT(ISODOW FROM day)::int - 1 AS weekday,
+                       SUM(quantity), SUM(sales_count)
+                FROM sales_daily_sellers
+                WHERE TRUE
+            """
+            params = []
+            if date_from:
+                query += " AND day >= %s::date"
+                params.append(date_from)
+            if date_to:
+                query += " AND day <= %s::date"
+                params.append(date_to)
+            if username:
+                query += " AND username = %s"
+                params.append(username)
+            query += " GROUP BY weekday"
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                for weekday, total, count in cur.fetchall():
+                    sums[weekday] = int(total or 0)
+                    counts[weekday] = int(count or 0)
+        except Exception as e:
+            print(f"Ошибка при получении продаж по дням недели: {e}")
+        averages = [total / count if count else 0.0 for total, count in zip(sums, counts)]
+        return {'sums': sums, 'counts': counts, 'averages': averages}
+
     def get_first_sale_date(self, username=None):
-        """Получить дату первой продажи"""
+        """Получить дату первой продажи (datetime.date или None)"""
         try:
-            query = "SELECT MIN(sale_date) FROM sales_history"
+            query = "SELECT MIN(day) FROM sales_daily_sellers"
             params = []
             if username:
                 query += " WHERE username = %s"
                 params.append(username)
-            self.cursor.execute(query, params)
-            result = self.cursor.fetchone()
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                result = cur.fetchone()
             return result[0] if result and result[0] else None
         except Exception as e:
             print(f"Ошибка при получении даты первой продажи: {e}")
-            self.connection.rollback()
             return None
 
-    def add_low_stock_product(self, product_name, category, quantity, min_quantity):
-        try:
-            print(f"\nПопытка добавления товара в low_stock_products:")
-            print(f"product_name: {product_name}")
-            print(f"category: {category}")
-            print(f"quantity: {quantity}")
-            print(f"min_quantity: {min_quantity}")
-            
-            # Сначала проверяем, существует ли товар в таблице products
-            self.cursor.execute("SELECT name FROM products WHERE name = %s", (product_name,))
-            if not self.cursor.fetchone():
-                print(f"Ошибка: Товар '{product_name}' не существует в таблице products")
-                return False
-
-            # Проверяем, существует ли уже запись для этого товара
-            self.cursor.execute("SELECT id FROM low_stock_products WHERE product_name = %s", (product_name,))
-            existing = self.cursor.fetchone()
-            
-            if existing:
-                # Обновляем существующую запись
-                print(f"Обновление существующей записи для товара {product_name}")
-                self.cursor.execute("""
-                    UPDATE low_stock_products 
-                    SET category = %s, quantity = %s, min_quantity = %s, notified = FALSE
-                    WHERE product_name = %s
-                """, (category, quantity, min_quantity, product_name))
-            else:
-                # Создаем новую запись
-                print(f"Создание новой записи для товара {product_name}")
-                self.cursor.execute("""
-                    INSERT INTO low_stock_products (product_name, category, quantity, min_quantity, notified)
-                    VALUES (%s, %s, %s, %s, FALSE)
-                """, (product_name, category, quantity, min_quantity))
-            
-            self.connection.commit()
-            print(f"Успешно сохранено для товара: {product_name}")
-            return True
-            
-        except Exception as e:
-            print(f"Ошибка при добавлении товара с низким запасом: {e}")
-            self.connection.rollback()
-            return False
-
     def get_low_stock_products(self):
-        """Получает список товаров с количеством ниже минимального для их категории"""
+        """Получает список товаров с количеством ниже минимального для их категории.
+
+        Читается готовый набор low_stock_products, который ведут триггеры, —
+        время запроса зависит от числа таких товаров, а не от размера каталога.
+        """
         try:
             query = """
-                SELECT p.name, p.quantity, p.category, cmq.min_quantity
-                FROM products p
-                JOIN category_min_quantities cmq ON p.category = cmq.category
-                WHERE CAST(p.quantity AS INTEGER) < cmq.min_quantity
+                SELECT p.name, p.quantity, p.category, l.min_quantity
+                FROM low_stock_products l
+                JOIN products p ON p.id = l.product_id
                 ORDER BY p.category, p.name
             """
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
+            with self.transaction() as cur:
+                cur.execute(query)
+                results = cur.fetchall()
             return [{
                 'name': row[0],
-                'quantity': int(row[1]),
+                'quantity': row[1],
                 'category': row[2],
                 'min_quantity': row[3]
             } for row in results]
@@ -1054,65 +1524,116 @@ class DatabaseManager:
             print(f"Ошибка при получении товаров с низким остатком: {str(e)}")
             return []
 
+    def take_low_stock_notifications(self) -> List[Dict]:
+        """Товары, попавшие в набор с низким остатком после прошлой проверки.
+
+        Возвращённые записи помечаются notified и повторно не выдаются, пока
+        товар не выйдет из набора и не попадёт в него снова.
+        """
+        try:
+            with self.transaction() as cur:
+                cur.execute("""
+                    UPDATE low_stock_products l SET notified = TRUE
+                    FROM products p
+                    WHERE p.id = l.product_id AND NOT l.notified
+                    RETURNING p.name, p.quantity, l.min_quantity
+                """)
+                rows = cur.fetchall()
+            return [{'name': row[0], 'quantity': row[1], 'min_quantity': row[2]} for row in rows]
+        except Exception as e:
+            print(f"Ошибка при проверке товаров с низким остатком: {e}")
+            return []
+
     def delete_all_products(self):
         """Удаляет все товары из таблицы products"""
         try:
-            self.cursor.execute("DELETE FROM products")
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute("DELETE FROM products")
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при удалении всех товаров: {e}")
-            self.connection.rollback()
             return False
 
-    def clean_old_sales_history(self):
-        """Очищает записи продаж старше 1 года"""
+    def clean_old_sales_history(self, months: int = SALES_RETENTION_MONTHS) -> bool:
+        """Удаляет продажи старше months полных месяцев.
+
+        Устаревшие месячные секции удаляются целиком, без построчного DELETE;
+        построчно чистится только секция по умолчанию.
+        """
+        cutoff = _add_months(date.today(), -months)
         try:
-            self.cursor.execute("SELECT clean_old_sales_history()")
-            self.connection.commit()
+            with self.transaction() as cur:
+                if not self._sales_history_partitioned(cur):
+                    # Агрегаты сохраняют историю после удаления старых продаж
+                    cur.execute(f"SET LOCAL {KEEP_ROLLUPS_SETTING} = 'on'")
+                    cur.execute("DELETE FROM sales_history WHERE sale_date < %s", (cutoff,))
+                    return True
+                cur.execute("""
+                    SELECT c.relname FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'sales_history'::regclass
+                """)
+                for (name,) in cur.fetchall():
+                    match = SALES_PARTITION_PATTERN.match(name)
+                    if match is None:
+                        continue
+                    month = date(int(match.group(1)), int(match.group(2)), 1)
+                    if _add_months(month, 1) <= cutoff:
+                        cur.execute(f"DROP TABLE {name}")
+                cur.execute(f"DELETE FROM {SALES_DEFAULT_PARTITION} WHERE sale_date < %s", (cutoff,))
             return True
         except psycopg2.Error as e:
             print(f"Ошибка при очистке старых записей продаж: {e}")
-            self.connection.rollback()
             return False
 
     def set_category_min_quantity(self, category: str, min_quantity: int) -> bool:
         """Устанавливает минимальное количество для категории"""
         try:
-            self.cursor.execute("""
-                INSERT INTO category_min_quantities (category, min_quantity)
-                VALUES (%s, %s)
-                ON CONFLICT (category) 
-                DO UPDATE SET min_quantity = EXCLUDED.min_quantity
-            """, (category, min_quantity))
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute("""
+                    INSERT INTO category_min_quantities (category, min_quantity)
+                    VALUES (%s, %s)
+                    ON CONFLICT (category) 
+                    DO UPDATE SET min_quantity = EXCLUDED.min_quantity
+                """, (category, min_quantity))
             return True
         except Exception as e:
             print(f"Ошибка при установке минимального количества для категории: {e}")
-            self.connection.rollback()
             return False
+        finally:
+            self.invalidate_category_min_quantities()
+
+    def get_category_min_quantities(self) -> Dict[str, int]:
+        """Минимальные количества всех категорий; загружаются одним запросом и кэшируются"""
+        cache = DatabaseManager._category_min_quantities
+        if cache is None:
+            with self.transaction() as cur:
+                cur.execute("SELECT category, min_quantity FROM category_min_quantities")
+                cache = {row[0]: row[1] for row in cur.fetchall()}
+            DatabaseManager._category_min_quantities = cache
+        return cache
+
+    @classmethod
+    def invalidate_category_min_quantities(cls):
+        cls._category_min_quantities = None
 
     def get_category_min_quantity(self, category: str) -> int:
         """Получает минимальное количество для категории"""
-        self.cursor.execute("""
-            SELECT min_quantity FROM category_min_quantities WHERE category = %s
-        """, (category,))
-        result = self.cursor.fetchone()
-        return result[0] if result else 0
+        return self.get_category_min_quantities().get(category, 0)
 
     def update_user_role(self, username: str, new_role: str) -> bool:
         try:
-            self.cursor.execute("UPDATE users SET role = %s WHERE username = %s", (new_role, username))
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute("UPDATE users SET role = %s WHERE username = %s", (new_role, username))
             return True
         except Exception as e:
             print(f"Ошибка при обновлении роли пользователя '{username}': {e}")
             return False
 
     def create_tables(self):
-        try:
+        with self.transaction() as cur:
             # Создаем таблицу пользователей
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     id SERIAL PRIMARY KEY,
                     username VARCHAR(50) UNIQUE NOT NULL,
@@ -1126,7 +1647,7 @@ class DatabaseManager:
             """)
 
             # Создаем таблицу категорий
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS categories (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR(50) UNIQUE NOT NULL
@@ -1134,7 +1655,7 @@ class DatabaseManager:
             """)
 
             # Создаем таблицу товаров
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS products (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR(100) NOT NULL,
@@ -1147,20 +1668,22 @@ class DatabaseManager:
                 )
             """)
 
-            # Создаем таблицу истории продаж
-            self.cursor.execute("""
+            # Создаем таблицу истории продаж, разбитую на секции по месяцам
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS sales_history (
-                    id SERIAL PRIMARY KEY,
+                    id SERIAL,
+                    product_id INTEGER,
                     product_name TEXT NOT NULL,
                     quantity INTEGER NOT NULL,
-                    sale_date TEXT NOT NULL,
+                    sale_date TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     username TEXT NOT NULL,
-                    sale_price FLOAT NOT NULL
-                )
+                    sale_price FLOAT NOT NULL,
+                    PRIMARY KEY (id, sale_date)
+                ) PARTITION BY RANGE (sale_date)
             """)
 
             # Создаем таблицу минимальных количеств для категорий
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS category_min_quantities (
                     category VARCHAR(50) PRIMARY KEY REFERENCES categories(name),
                     min_quantity INTEGER NOT NULL
@@ -1168,7 +1691,7 @@ class DatabaseManager:
             """)
 
             # Создаем таблицу логов изменений
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS changes_log (
                     id SERIAL PRIMARY KEY,
                     action VARCHAR(50) NOT NULL,
@@ -1178,7 +1701,7 @@ class DatabaseManager:
             """)
 
             # Создаем таблицу ожидающих заказов
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS pending_orders (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR(100) NOT NULL,
@@ -1193,7 +1716,7 @@ class DatabaseManager:
             """)
 
             # Создаем таблицу поставщиков
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS suppliers (
                     id SERIAL PRIMARY KEY,
                     name VARCHAR(100) NOT NULL,
@@ -1204,7 +1727,7 @@ class DatabaseManager:
             """)
 
             # Создаем таблицу движения товаров
-            self.cursor.execute("""
+            cur.execute("""
                 CREATE TABLE IF NOT EXISTS product_movement (
                     id SERIAL PRIMARY KEY,
                     product_id INTEGER REFERENCES products(id),
@@ -1220,55 +1743,931 @@ class DatabaseManager:
                 )
             """)
 
-            self.connection.commit()
-            print("Таблицы успешно созданы")
+        print("Таблицы успешно созданы")
+
+    def migrate_sale_date(self):
+        """Переводит sales_history.sale_date из TEXT в timestamptz.
+
+        Новая колонка заполняется пачками (каждая — под своим SAVEPOINT внутри
+        транзакции миграции), вставки во время заполнения дописывает триггер,
+        исключительная блокировка берётся только на подмену колонок. Продажи с
+        нераспознанной датой переносятся в sales_history_unparsed: там они не
+        попадают ни под очистку по сроку хранения, ни в аналитику.
+        """
+        if self._column_type('sales_history', 'sale_date') not in (None, 'timestamp with time zone'):
+            self._convert_sale_date()
+
+    def _column_type(self, table, column):
+        with self.transaction() as cur:
+            cur.execute("""
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = %s AND column_name = %s
+            """, (table, column))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def _convert_sale_date(self):
+        with self.transaction() as cur:
+            # Даты писались как ГГГГ-ММ-ДД, в старых данных встречается ДД.ММ.ГГГГ
+            cur.execute(r"""
+                CREATE OR REPLACE FUNCTION parse_sale_date(value TEXT)
+                RETURNS timestamptz AS $$
+                BEGIN
+                    IF value ~ '^\d{2}\.\d{2}\.\d{4}$' THEN
+                        RETURN to_date(value, 'DD.MM.YYYY')::timestamptz;
+                    ELSIF value ~ '^\d{2}\.\d{2}\.\d{4} ' THEN
+                        RETURN to_timestamp(value, 'DD.MM.YYYY HH24:MI:SS');
+                    END IF;
+                    RETURN value::timestamptz;
+                EXCEPTION WHEN others THEN
+                    -- Такие продажи миграция переносит в sales_history_unparsed
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql STABLE;
+            """)
+            cur.execute("ALTER TABLE sales_history ADD COLUMN IF NOT EXISTS sale_at TIMESTAMPTZ")
+            # Вставки и правки, пришедшие во время заполнения, переносит триггер
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION sync_sale_at()
+                RETURNS trigger AS $$
+                BEGIN
+                    NEW.sale_at := parse_sale_date(NEW.sale_date::text);
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS sync_sale_at_trigger ON sales_history;
+                CREATE TRIGGER sync_sale_at_trigger
+                BEFORE INSERT OR UPDATE OF sale_date ON sales_history
+                FOR EACH ROW
+                EXECUTE FUNCTION sync_sale_at();
+            """)
+            cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM sales_history")
+            first_id, last_id = cur.fetchone()
+
+        # Заполняем пачками по диапазонам id, каждая пачка — свой SAVEPOINT
+        for start in range(first_id, last_id + 1, MIGRATION_BATCH_SIZE):
+            with self.transaction() as cur:
+                cur.execute("""
+                    UPDATE sales_history SET sale_at = parse_sale_date(sale_date::text)
+                    WHERE id >= %s AND id < %s AND sale_at IS NULL
+                """, (start, start + MIGRATION_BATCH_SIZE))
+
+        # NOT NULL через проверенное ограничение: проверка идёт без блокировки записи,
+        # а SET NOT NULL потом не сканирует таблицу
+        with self.transaction() as cur:
+            # Вставки ждут, пока продажи с нераспознанной датой переносятся и ставится ограничение
+            cur.execute("SET LOCAL lock_timeout = '5s'")
+            cur.execute("LOCK TABLE sales_history IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute("CREATE TABLE IF NOT EXISTS sales_history_unparsed (LIKE sales_history)")
+            cur.execute("""
+                WITH moved AS (
+                    DELETE FROM sales_history WHERE sale_at IS NULL RETURNING *
+                )
+                INSERT INTO sales_history_unparsed SELECT * FROM moved RETURNING id, sale_date
+            """)
+            unparsed = cur.fetchall()
+            if unparsed:
+                print(f"Продажи с нераспознанной датой перенесены в sales_history_unparsed ({len(unparsed)}): "
+                      + ", ".join(f"id {sale_id} ({sale_date!r})" for sale_id, sale_date in unparsed))
+            cur.execute("""
+                ALTER TABLE sales_history DROP CONSTRAINT IF EXISTS sales_history_sale_at_not_null;
+                ALTER TABLE sales_history
+                    ADD CONSTRAINT sales_history_sale_at_not_null CHECK (sale_at IS NOT NULL) NOT VALID;
+            """)
+        with self.transaction() as cur:
+            cur.execute("ALTER TABLE sales_history VALIDATE CONSTRAINT sales_history_sale_at_not_null")
+
+        with self.transaction() as cur:
+            cur.execute("SET LOCAL lock_timeout = '5s'")
+            cur.execute("LOCK TABLE sales_history IN ACCESS EXCLUSIVE MODE")
+            cur.execute("""
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'sales_history' AND column_name = 'sale_date'
+            """)
+            if cur.fetchone()[0] == 'timestamp with time zone':
+                return  # Колонку уже подменил другой экземпляр приложения
+            cur.execute("""
+                ALTER TABLE sales_history ALTER COLUMN sale_at SET NOT NULL;
+                ALTER TABLE sales_history DROP CONSTRAINT sales_history_sale_at_not_null;
+                DROP TRIGGER IF EXISTS sync_sale_at_trigger ON sales_history;
+                ALTER TABLE sales_history DROP COLUMN sale_date;
+                ALTER TABLE sales_history RENAME COLUMN sale_at TO sale_date;
+                ALTER TABLE sales_history ALTER COLUMN sale_date SET DEFAULT CURRENT_TIMESTAMP;
+                DROP FUNCTION IF EXISTS sync_sale_at();
+            """)
+        print("Колонка sales_history.sale_date переведена в timestamptz")
+
+    def partition_sales_history(self):
+        """Переводит sales_history на секционирование по месяцам и создаёт индексы по дате.
+
+        Старая таблица копируется в секционированную в одной транзакции,
+        чтение на время копирования не блокируется. Построчный триггер
+        очистки при этом удаляется: старые месяцы убирает maintain_sales_partitions.
+        """
+        with self.transaction() as cur:
+            if not self._sales_history_partitioned(cur):
+                self._convert_to_partitioned(cur)
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {SALES_DEFAULT_PARTITION} PARTITION OF sales_history DEFAULT"
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_history_sale_date ON sales_history (sale_date)")
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sales_history_username_sale_date
+                ON sales_history (username, sale_date)
+            """)
+
+    @staticmethod
+    def _sales_history_partitioned(cur) -> bool:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('sales_history')")
+        row = cur.fetchone()
+        return bool(row) and row[0] == 'p'
+
+    def _convert_to_partitioned(self, cur):
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        cur.execute("LOCK TABLE sales_history IN EXCLUSIVE MODE")
+        cur.execute("DROP TRIGGER IF EXISTS clean_sales_history_trigger ON sales_history")
+        cur.execute("DROP FUNCTION IF EXISTS clean_old_sales_history()")
+        # Имена индексов должны освободиться для новой таблицы
+        cur.execute("""
+            ALTER TABLE sales_history RENAME TO sales_history_unpartitioned;
+            ALTER INDEX IF EXISTS sales_history_pkey RENAME TO sales_history_unpartitioned_pkey;
+            DROP INDEX IF EXISTS idx_sales_history_sale_date;
+            DROP INDEX IF EXISTS idx_sales_history_username_sale_date;
+        """)
+        cur.execute("""
+            CREATE TABLE sales_history
+                (LIKE sales_history_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (sale_date)
+        """)
+        cur.execute("ALTER TABLE sales_history ADD PRIMARY KEY (id, sale_date)")
+        # Счётчик id переходит к новой таблице, иначе удалится вместе со старой
+        cur.execute("SELECT pg_get_serial_sequence('sales_history_unpartitioned', 'id')")
+        sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY sales_history.id")
+        cur.execute(f"CREATE TABLE {SALES_DEFAULT_PARTITION} PARTITION OF sales_history DEFAULT")
+        cur.execute("SELECT MIN(sale_date)::date, MAX(sale_date)::date FROM sales_history_unpartitioned")
+        first_day, last_day = cur.fetchone()
+        if first_day is not None:
+            month = _add_months(first_day, 0)
+            while month <= last_day:
+                self._ensure_sales_partition(cur, month)
+                month = _add_months(month, 1)
+        cur.execute("INSERT INTO sales_history SELECT * FROM sales_history_unpartitioned")
+        cur.execute("DROP TABLE sales_history_unpartitioned")
+        print("Таблица sales_history разбита на секции по месяцам")
+
+    @staticmethod
+    def _ensure_sales_partition(cur, month: date):
+        """Создаёт секцию месяца; попавшие в секцию по умолчанию строки переносятся в неё"""
+        name = _sales_partition_name(month)
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is not None:
+            return
+        start, end = month.isoformat(), _add_months(month, 1).isoformat()
+        cur.execute(f"CREATE TABLE {name} (LIKE sales_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {SALES_DEFAULT_PARTITION}
+                WHERE sale_date >= %s AND sale_date < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, (start, end))
+        cur.execute(f"ALTER TABLE sales_history ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+
+    def maintain_sales_partitions(self) -> bool:
+        """Периодическое обслуживание: секции на ближайшие месяцы и удаление устаревших.
+
+        Вызывается из фонового потока. Работу выполняет одна копия приложения:
+        advisory-блокировка берётся без ожидания, и если её держит другой
+        клиент, обслуживание пропускается (False). Блокировки таблиц ждутся не
+        дольше lock_timeout — по истечении проход откатывается до следующего раза.
+        """
+        try:
+            with self.transaction() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (SALES_MAINTENANCE_LOCK_KEY,))
+                if not cur.fetchone()[0]:
+                    return False
+                if not self._sales_history_partitioned(cur):
+                    return False
+                cur.execute("SET LOCAL lock_timeout = '5s'")
+                this_month = _add_months(date.today(), 0)
+                for shift in range(SALES_PARTITIONS_AHEAD + 1):
+                    self._ensure_sales_partition(cur, _add_months(this_month, shift))
+                # Вложенная транзакция: ошибка очистки не откатывает созданные секции
+                return self.clean_old_sales_history()
         except Exception as e:
-            print(f"Ошибка при создании таблиц: {e}")
-            self.connection.rollback()
+            print(f"Ошибка при создании секций истории продаж: {e}")
+            return False
+
+    def create_change_notifications(self):
+        """Триггеры NOTIFY: сообщают клиентам ID изменённых товаров и об изменении категорий"""
+        with self.transaction() as cur:
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION notify_products_changed()
+                RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        PERFORM pg_notify('{PRODUCTS_CHANNEL}', OLD.id::text);
+                    ELSE
+                        PERFORM pg_notify('{PRODUCTS_CHANNEL}', NEW.id::text);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS products_notify_trigger ON products;
+                CREATE TRIGGER products_notify_trigger
+                AFTER INSERT OR UPDATE OR DELETE ON products
+                FOR EACH ROW
+                EXECUTE FUNCTION notify_products_changed();
+            """)
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION notify_categories_changed()
+                RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('{CATEGORIES_CHANNEL}', '');
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS categories_notify_trigger ON categories;
+                CREATE TRIGGER categories_notify_trigger
+                AFTER INSERT OR UPDATE OR DELETE ON categories
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION notify_categories_changed();
+            """)
+
+    def create_pending_order_items(self):
+        """Таблица позиций заказов поставщикам (раньше создавалась вручную)"""
+        with self.transaction() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS pending_order_items (
+                    id SERIAL PRIMARY KEY,
+                    order_id INTEGER NOT NULL REFERENCES pending_orders(id) ON DELETE CASCADE,
+                    name TEXT NOT NULL,
+                    price NUMERIC(12,2) NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    category TEXT
+                )
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pending_order_items_order_id
+                ON pending_order_items (order_id)
+            """)
+
+    @staticmethod
+    def _copy_rows(cur, table: str, columns: List[str], rows) -> int:
+        """Загружает строки в таблицу одной командой COPY и возвращает их число"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        for row in rows:
+            # None записывается пустым полем и становится NULL
+            writer.writerow(row)
+            count += 1
+        buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        return count
+
+    def create_pending_order(self, rows, supplier_id, supplier_name: str = None,
+                             status: str = 'В процессе') -> Optional[Dict]:
+        """Создаёт заказ поставщику из строк прайс-листа.
+
+        rows — кортежи (название, цена, количество, категория) в любом виде,
+        как они пришли из файла. Строки загружаются во временную таблицу через
+        COPY, разбираются и проверяются в SQL, шапка заказа с итогами и позиции
+        вставляются одним запросом. Пустое количество считается равным 1,
+        строки без названия, категории, с неположительной ценой или количеством
+        отбрасываются.
+
+        Возвращает словарь order_id, inserted, rejected (order_id = None, если
+        подходящих строк нет); None — при ошибке базы данных.
+        """
+        try:
+            with self.transaction() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE import_order_rows (
+                        line SERIAL,
+                        name TEXT,
+                        price TEXT,
+                        quantity TEXT,
+                        category TEXT
+                    ) ON COMMIT DROP
+                """)
+                total = self._copy_rows(cur, 'import_order_rows', ['name', 'price', 'quantity', 'category'], rows)
+                cur.execute(r"""
+                    WITH parsed AS (
+                        SELECT line,
+                               btrim(name) AS name,
+                               CASE WHEN n.price ~ '^-?\d{1,10}(\.\d+)?$' THEN n.price::numeric END AS price,
+                               COALESCE(CASE WHEN n.quantity ~ '^-?\d{1,9}(\.\d+)?$'
+                                             THEN trunc(n.quantity::numeric)::integer END, 1) AS quantity,
+                               NULLIF(btrim(category), '') AS category
+                        FROM import_order_rows,
+                             LATERAL (SELECT regexp_replace(replace(price, ',', '.'), '\s', '', 'g') AS price,
+                                             regexp_replace(replace(quantity, ',', '.'), '\s', '', 'g') AS quantity) n
+                    ),
+                    valid AS (
+                        SELECT * FROM parsed
+                        WHERE name <> '' AND price > 0 AND quantity > 0 AND category IS NOT NULL
+                    ),
+                    header AS (
+                        INSERT INTO pending_orders (name, supplier, price, quantity, order_date, status)
+                        SELECT %s, %s, SUM(price * quantity), SUM(quantity), NOW(), %s
+                        FROM valid
+                        HAVING COUNT(*) > 0
+                        RETURNING id
+                    ),
+                    items AS (
+                        INSERT INTO pending_order_items (order_id, name, price, quantity, category)
+                        SELECT header.id, valid.name, valid.price, valid.quantity, valid.category
+                        FROM valid CROSS JOIN header
+                        ORDER BY valid.line
+                        RETURNING 1
+                    )
+                    SELECT (SELECT id FROM header), (SELECT COUNT(*) FROM items)
+                """, (supplier_name, supplier_id, status))
+                order_id, inserted = cur.fetchone()
+            return {"order_id": order_id, "inserted": inserted, "rejected": total - inserted}
+        except Exception as e:
+            print(f"Ошибка при создании заказа поставщику: {e}")
+            return None
+
+    def receive_pending_order(self, order_id: int, username: str) -> Optional[Dict]:
+        """Принимает заказ поставщику на склад одной транзакцией.
+
+        Позиции сопоставляются с товарами по названию или штрихкоду.
+        Найденным товарам количество увеличивается одним UPDATE, ненайденные
+        заводятся новыми товарами (закупочная цена — цена из заказа), а
+        движения по всем товарам записываются одной вставкой. Позиции без
+        названия или с неположительным количеством пропускаются.
+
+        Возвращает словарь inserted (новые товары), updated (пополненные),
+        rejected (пропущенные позиции); None — если заказ не найден, уже
+        принят или произошла ошибка.
+        """
+        order_id = int(order_id)
+        try:
+            with self.transaction() as cur:
+                cur.execute("SELECT status FROM pending_orders WHERE id = %s FOR UPDATE", (order_id,))
+                order = cur.fetchone()
+                if order is None or order[0] == ORDER_RECEIVED_STATUS:
+                    print(f"Заказ #{order_id} не найден или уже принят")
+                    return None
+                params = {
+                    "order_id": order_id,
+                    "username": username,
+                    "default_category": DEFAULT_CATEGORY,
+                    "comment": f"Поступление по заказу #{order_id}",
+                    "first_comment": f"Первое поступление по заказу #{order_id}",
+                }
+                items_sql = """
+                    SELECT id, btrim(name) AS name, price, quantity,
+                           COALESCE(NULLIF(btrim(category), ''), %(default_category)s) AS category
+                    FROM pending_order_items
+                    WHERE order_id = %(order_id)s AND btrim(name) <> '' AND quantity > 0
+                """
+                # Условие barcode <> '' совпадает с условием индекса idx_products_barcode
+                unmatched_sql = """
+                    NOT EXISTS (SELECT 1 FROM products p
+                                WHERE p.name = i.name OR (p.barcode = i.name AND p.barcode <> ''))
+                """
+                # Категории новых товаров должны существовать до их вставки
+                cur.execute(f"""
+                    INSERT INTO categories (name)
+                    SELECT DISTINCT i.category FROM ({items_sql}) i
+                    WHERE {unmatched_sql}
+                    ON CONFLICT (name) DO NOTHING
+                """, params)
+                cur.execute(f"""
+                    WITH items AS ({items_sql}),
+                    matches AS (
+                        SELECT DISTINCT ON (i.id) i.id AS item_id, p.id AS product_id
+                        FROM items i
+                        JOIN products p ON p.name = i.name OR (p.barcode = i.name AND p.barcode <> '')
+                        ORDER BY i.id, p.name = i.name DESC, p.id
+                    ),
+                    received AS (
+                        SELECT m.product_id, SUM(i.quantity)::integer AS quantity
+                        FROM matches m JOIN items i ON i.id = m.item_id
+                        GROUP BY m.product_id
+                    ),
+                    updated AS (
+                        UPDATE products p SET quantity = p.quantity + r.quantity
+                        FROM received r
+                        WHERE p.id = r.product_id
+                        RETURNING p.id, r.quantity, p.quantity AS new_quantity
+                    ),
+                    created AS (
+                        INSERT INTO products (name, price, purchase_price, quantity, category)
+                        SELECT i.name, MAX(i.price), MAX(i.price), SUM(i.quantity)::integer, MIN(i.category)
+                        FROM items i
+                        WHERE {unmatched_sql}
+                        GROUP BY i.name
+                        RETURNING id, quantity
+                    ),
+                    movements AS (
+                        INSERT INTO product_movement
+                            (product_id, movement_type, quantity, previous_quantity, new_quantity,
+                             username, reference_id, reference_type, comment)
+                        SELECT id, 'IN', quantity, new_quantity - quantity, new_quantity,
+                               %(username)s, %(order_id)s, 'Заказ поставщику', %(comment)s
+                        FROM updated
+                        UNION ALL
+                        SELECT id, 'IN', quantity, 0, quantity,
+                               %(username)s, %(order_id)s, 'Заказ поставщику', %(first_comment)s
+                        FROM created
+                    )
+                    SELECT (SELECT COUNT(*) FROM created),
+                           (SELECT COUNT(*) FROM updated),
+                           (SELECT COUNT(*) FROM pending_order_items WHERE order_id = %(order_id)s)
+                           - (SELECT COUNT(*) FROM items)
+                """, params)
+                inserted, updated, rejected = cur.fetchone()
+                cur.execute("UPDATE pending_orders SET status = %s WHERE id = %s", (ORDER_RECEIVED_STATUS, order_id))
+            return {"inserted": inserted, "updated": updated, "rejected": rejected}
+        except Exception as e:
+            print(f"Ошибка при приёмке заказа поставщику: {e}")
+            return None
+
+    def create_sales_rollups(self):
+        """Дневные агрегаты продаж по товарам, продавцам и категориям.
+
+        Агрегаты ведут триггеры уровня оператора на sales_history: вставки
+        прибавляются, удаления вычитаются одним запросом на оператор, так что
+        оформление корзины обновляет каждую таблицу агрегатов один раз.
+        Удаление старых секций по сроку хранения агрегаты не трогает — по ним
+        аналитика видит историю дольше, чем хранятся сами продажи.
+        """
+        with self.transaction() as cur:
+            # Вставки продаж ждут окончания миграции, чтобы ни одна не потерялась при заполнении
+            cur.execute("LOCK TABLE sales_history IN SHARE ROW EXCLUSIVE MODE")
+            # Ключ по названию товара; на product_id агрегаты переводит миграция 14
+            for table, keys in SALES_ROLLUPS_BY_NAME.items():
+                key_columns = ''.join(f"{key} TEXT NOT NULL, " for key in keys)
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        day DATE NOT NULL,
+                        {key_columns}
+                        sales_count INTEGER NOT NULL,
+                        quantity INTEGER NOT NULL,
+                        amount NUMERIC(14,2) NOT NULL,
+                        PRIMARY KEY (day, {', '.join(keys)})
+                    )
+                """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sales_daily_products_username_day
+                ON sales_daily_products (username, day)
+            """)
+            self._create_sales_rollup_triggers(cur, by_name=True)
+            self._rebuild_sales_rollups(cur, by_name=True)
+
+    @staticmethod
+    def _create_sales_rollup_triggers(cur, by_name=False, stored_keys=True):
+        """Функции и триггеры sales_history, которые ведут агрегаты по SALES_ROLLUPS
+        (by_name — по SALES_ROLLUPS_BY_NAME, как в миграции 8; stored_keys — см.
+        _sales_rollup_targets). С ключами из продажи изменение строки продажи
+        (например, обнуление product_id при удалении товара) переносит её из
+        прежних строк агрегатов в новые."""
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION sales_rollup_insert()
+            RETURNS trigger AS $$
+            BEGIN
+                {_sales_rollup_sql('new_sales', by_name=by_name, stored_keys=stored_keys)}
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION sales_rollup_delete()
+            RETURNS trigger AS $$
+            BEGIN
+                IF current_setting('{KEEP_ROLLUPS_SETTING}', true) = 'on' THEN
+                    RETURN NULL;
+                END IF;
+                {_sales_rollup_sql('old_sales', -1, by_name, stored_keys)}
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            DROP TRIGGER IF EXISTS sales_rollup_insert_trigger ON sales_history;
+            CREATE TRIGGER sales_rollup_insert_trigger
+            AFTER INSERT ON sales_history
+            REFERENCING NEW TABLE AS new_sales
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION sales_rollup_insert();
+            DROP TRIGGER IF EXISTS sales_rollup_delete_trigger ON sales_history;
+            CREATE TRIGGER sales_rollup_delete_trigger
+            AFTER DELETE ON sales_history
+            REFERENCING OLD TABLE AS old_sales
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION sales_rollup_delete();
+        """)
+        if by_name or not stored_keys:
+            cur.execute("DROP TRIGGER IF EXISTS sales_rollup_update_trigger ON sales_history")
+            return
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION sales_rollup_update()
+            RETURNS trigger AS $$
+            BEGIN
+                {_sales_rollup_sql('old_sales', -1)}
+                {_sales_rollup_sql('new_sales')}
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            DROP TRIGGER IF EXISTS sales_rollup_update_trigger ON sales_history;
+            CREATE TRIGGER sales_rollup_update_trigger
+            AFTER UPDATE ON sales_history
+            REFERENCING OLD TABLE AS old_sales NEW TABLE AS new_sales
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION sales_rollup_update();
+        """)
+
+    @staticmethod
+    def _rebuild_sales_rollups(cur, by_name=False):
+        """Пересчитывает агрегаты за дни, по которым ещё хранятся продажи"""
+        cur.execute("SELECT MIN(sale_date)::date FROM sales_history")
+        first_day = cur.fetchone()[0]
+        if first_day is None:
+            return
+        for table in SALES_ROLLUPS:
+            cur.execute(f"DELETE FROM {table} WHERE day >= %s", (first_day,))
+        cur.execute(_sales_rollup_sql('sales_history', by_name=by_name))
+
+    def rebuild_sales_rollups(self) -> bool:
+        """Полный пересчёт агрегатов продаж по сохранившейся истории"""
+        try:
+            with self.transaction() as cur:
+                cur.execute("LOCK TABLE sales_history IN SHARE ROW EXCLUSIVE MODE")
+                self._rebuild_sales_rollups(cur)
+            return True
+        except Exception as e:
+            print(f"Ошибка при пересчёте агрегатов продаж: {e}")
+            return False
+
+    def add_user_photo_hash(self):
+        """Вычисляемая колонка users.photo_hash: по ней список пользователей
+        определяет актуальность кэша аватаров, не читая сами фото"""
+        with self.transaction() as cur:
+            cur.execute("""
+                ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS photo_hash TEXT
+                GENERATED ALWAYS AS (md5(photo_data)) STORED
+            """)
+
+    def create_product_search_indexes(self):
+        """GIN-индексы pg_trgm, по которым работает ILIKE '%...%' в search_products.
+
+        Расширение может быть недоступно (нет прав или пакета contrib) —
+        тогда поиск остаётся последовательным, а миграция не блокирует
+        следующие версии схемы.
+        """
+        with self.transaction() as cur:
+            cur.execute("SAVEPOINT pg_trgm")
+            try:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT pg_trgm")
+                print(f"Расширение pg_trgm недоступно, поиск товаров без индекса: {e}")
+                return
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+                ON products USING gin (name gin_trgm_ops)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_products_category_trgm
+                ON products USING gin (category gin_trgm_ops)
+            """)
+
+    def create_catalog_sort_index(self):
+        """Индекс под keyset-пагинацию каталога в порядке «По имени»:
+        страница читается с позиции курсора, без сортировки всей таблицы"""
+        with self.transaction() as cur:
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_products_lower_name_id
+                ON products (LOWER(name), id)
+            """)
+
+    def create_barcode_index(self):
+        """Уникальный частичный индекс по штрихкоду: пустые штрихкоды в него не
+        попадают, а повторно назначить чужой штрихкод больше нельзя.
+
+        Если в базе уже есть повторы, создаётся обычный индекс (поиск всё равно
+        ускоряется), а повторяющиеся штрихкоды выводятся в лог.
+        """
+        with self.transaction() as cur:
+            cur.execute("SAVEPOINT barcode_index")
+            try:
+                cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode
+                    ON products (barcode) WHERE barcode <> ''
+                """)
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT barcode_index")
+                cur.execute("""
+                    SELECT barcode FROM products WHERE barcode <> ''
+                    GROUP BY barcode HAVING COUNT(*) > 1
+                """)
+                duplicates = [row[0] for row in cur.fetchall()]
+                print(f"Штрихкоды повторяются, индекс создан без уникальности: {', '.join(duplicates)} ({e})")
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_products_barcode
+                    ON products (barcode) WHERE barcode <> ''
+                """)
+
+    def convert_product_numbers(self):
+        """Переводит quantity в integer, цены — в numeric(12,2), добавляет
+        CHECK-ограничения и индексы (category, quantity) и (price, id).
+
+        Текст переводится одним ALTER TABLE под исключительной блокировкой.
+        Запятая считается десятичным разделителем; нераспознанная или
+        отрицательная цена становится NULL (у обязательной price — 0),
+        количество округляется вниз, нераспознанное — 0.
+        """
+        alterations = []
+        for column, column_type in PRODUCT_NUMBER_COLUMNS.items():
+            if self._column_type('products', column) in (None, 'integer', 'numeric'):
+                continue
+            number = f"""
+                CASE WHEN replace(btrim({column}::text), ',', '.') ~ '{PRODUCT_NUMBER_PATTERN}'
+                     THEN replace(btrim({column}::text), ',', '.')::numeric END
+            """
+            if column == 'quantity':
+                value = f"COALESCE(CASE WHEN {number} >= 0 THEN trunc({number})::integer END, 0)"
+            elif column == 'price':
+                value = f"COALESCE(CASE WHEN {number} >= 0 THEN round({number}, 2) END, 0)"
+            else:
+                value = f"CASE WHEN {number} >= 0 THEN round({number}, 2) END"
+            alterations.append(f"ALTER COLUMN {column} TYPE {column_type} USING {value}")
+        with self.transaction() as cur:
+            if alterations:
+                cur.execute(f"ALTER TABLE products {', '.join(alterations)}")
+            for column in PRODUCT_NUMBER_COLUMNS:
+                cur.execute(f"""
+                    ALTER TABLE products
+                    DROP CONSTRAINT IF EXISTS products_{column}_check,
+                    ADD CONSTRAINT products_{column}_check CHECK ({column} >= 0)
+                """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_products_category_quantity
+                ON products (category, quantity)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_products_price_id
+                ON products (price, id)
+            """)
+
+    def link_sales_to_products(self):
+        """Продажи ссылаются на товар по id, а не по названию.
+
+        Старым продажам product_id проставляется по названию пачками (каждая —
+        под своим SAVEPOINT), затем добавляется внешний ключ (при удалении
+        товара ссылка обнуляется, название в продаже остаётся) и индекс
+        (product_id, sale_date). Закупочная цена запоминается в продаже; для
+        старых продаж берётся текущая закупочная цена товара. Агрегат
+        sales_daily_products переводится с названия на product_id; строки,
+        название которых не нашлось среди товаров, остаются с product_id NULL
+        и прежним названием — их дни уже не пересчитать по продажам.
+        """
+        with self.transaction() as cur:
+            cur.execute("ALTER TABLE sales_history ADD COLUMN IF NOT EXISTS product_id INTEGER")
+            cur.execute("ALTER TABLE sales_history ADD COLUMN IF NOT EXISTS purchase_price NUMERIC(12,2)")
+            cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM sales_history")
+            first_id, last_id = cur.fetchone()
+
+        for start in range(first_id, last_id + 1, MIGRATION_BATCH_SIZE):
+            batch = (start, start + MIGRATION_BATCH_SIZE)
+            with self.transaction() as cur:
+                # Ссылки на уже удалённые товары обнуляются, иначе внешний ключ не создать
+                cur.execute("""
+                    UPDATE sales_history s SET product_id = NULL
+                    WHERE s.id >= %s AND s.id < %s AND s.product_id IS NOT NULL
+                      AND NOT EXISTS (SELECT 1 FROM products p WHERE p.id = s.product_id)
+                """, batch)
+                cur.execute("""
+                    UPDATE sales_history s SET product_id = p.id
+                    FROM products p
+                    WHERE s.id >= %s AND s.id < %s AND s.product_id IS NULL AND p.name = s.product_name
+                """, batch)
+                cur.execute("""
+                    UPDATE sales_history s SET purchase_price = p.purchase_price
+                    FROM products p
+                    WHERE s.id >= %s AND s.id < %s AND s.purchase_price IS NULL AND p.id = s.product_id
+                """, batch)
+
+        rollup_by_name = self._column_type('sales_daily_products', 'product_id') is None
+        with self.transaction() as cur:
+            cur.execute("SET LOCAL lock_timeout = '5s'")
+            # Агрегаты меняются вместе с триггерами, вставки продаж ждут
+            cur.execute("LOCK TABLE sales_history IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute("""
+                ALTER TABLE sales_history DROP CONSTRAINT IF EXISTS sales_history_product_id_fkey;
+                ALTER TABLE sales_history ADD CONSTRAINT sales_history_product_id_fkey
+                    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE SET NULL;
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sales_history_product_id_sale_date
+                ON sales_history (product_id, sale_date)
+            """)
+            if rollup_by_name:
+                # Дни старше хранимых продаж не пересчитать, поэтому ключ переводится на месте.
+                # Название остаётся у каждой строки; ключ — product_id, а где товар не
+                # нашёлся — название (два частичных уникальных индекса вместо первичного ключа)
+                cur.execute("""
+                    ALTER TABLE sales_daily_products ADD COLUMN product_id INTEGER;
+                    UPDATE sales_daily_products d SET product_id = p.id
+                    FROM products p WHERE p.name = d.product_name;
+                    ALTER TABLE sales_daily_products DROP CONSTRAINT sales_daily_products_pkey;
+                    CREATE UNIQUE INDEX sales_daily_products_product_key
+                    ON sales_daily_products (day, product_id, username) WHERE product_id IS NOT NULL;
+                    CREATE UNIQUE INDEX sales_daily_products_name_key
+                    ON sales_daily_products (day, product_name, username) WHERE product_id IS NULL;
+                """)
+            self._create_sales_rollup_triggers(cur, stored_keys=False)
+
+    def store_sale_rollup_keys(self):
+        """Категория товара запоминается в продаже (sales_history.category).
+
+        Ключи всех дневных агрегатов после этого читаются из самой продажи:
+        удаление продажи вычитается из тех же строк, в которые она была
+        прибавлена, даже если товар с тех пор сменил категорию или удалён.
+        Старым продажам проставляется текущая категория товара, агрегаты за
+        хранимые дни пересчитываются по ней.
+        """
+        with self.transaction() as cur:
+            cur.execute("ALTER TABLE sales_history ADD COLUMN IF NOT EXISTS category TEXT")
+            cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM sales_history")
+            first_id, last_id = cur.fetchone()
+
+        backfill = f"""
+            UPDATE sales_history s
+            SET category = COALESCE((SELECT category FROM products p WHERE p.id = s.product_id), '{DEFAULT_CATEGORY}')
+            WHERE s.category IS NULL
+        """
+        for start in range(first_id, last_id + 1, MIGRATION_BATCH_SIZE):
+            with self.transaction() as cur:
+                cur.execute(backfill + " AND s.id >= %s AND s.id < %s", (start, start + MIGRATION_BATCH_SIZE))
+
+        with self.transaction() as cur:
+            cur.execute("SET LOCAL lock_timeout = '5s'")
+            cur.execute("LOCK TABLE sales_history IN SHARE ROW EXCLUSIVE MODE")
+            # Продажи, записанные во время заполнения прежними версиями приложения
+            cur.execute(backfill)
+            self._create_sales_rollup_triggers(cur)
+            self._rebuild_sales_rollups(cur)
+
+    def maintain_low_stock(self):
+        """Набор low_stock_products: товары с количеством ниже минимального
+        для их категории.
+
+        Набор ведут строковые триггеры на изменение quantity и category
+        товара и на category_min_quantities, поэтому отчёты и подсветка
+        читают готовые строки вместо соединения всего каталога с порогами.
+        Прежняя таблица с ключом по названию заменяется; товары, которые уже
+        в наборе при миграции, считаются известными (notified).
+        """
+        with self.transaction() as cur:
+            cur.execute("SET LOCAL lock_timeout = '5s'")
+            # Остатки и пороги не меняются, пока набор заполняется и ставятся триггеры
+            cur.execute("LOCK TABLE products, category_min_quantities IN SHARE ROW EXCLUSIVE MODE")
+            if self._column_type('low_stock_products', 'product_id') is None:
+                cur.execute("DROP TABLE IF EXISTS low_stock_products")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS low_stock_products (
+                    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+                    min_quantity INTEGER NOT NULL,
+                    notified BOOLEAN NOT NULL DEFAULT FALSE
+                )
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_low_stock_products_pending
+                ON low_stock_products (product_id) WHERE NOT notified
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION products_low_stock()
+                RETURNS trigger AS $$
+                DECLARE
+                    threshold INTEGER;
+                BEGIN
+                    SELECT min_quantity INTO threshold
+                    FROM category_min_quantities WHERE category = NEW.category;
+                    IF NEW.quantity < threshold THEN
+                        INSERT INTO low_stock_products (product_id, min_quantity)
+                        VALUES (NEW.id, threshold)
+                        ON CONFLICT (product_id) DO UPDATE SET min_quantity = EXCLUDED.min_quantity;
+                    ELSIF TG_OP = 'UPDATE' THEN
+                        DELETE FROM low_stock_products WHERE product_id = NEW.id;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS products_low_stock_insert_trigger ON products;
+                CREATE TRIGGER products_low_stock_insert_trigger
+                AFTER INSERT ON products
+                FOR EACH ROW
+                EXECUTE FUNCTION products_low_stock();
+                DROP TRIGGER IF EXISTS products_low_stock_update_trigger ON products;
+                CREATE TRIGGER products_low_stock_update_trigger
+                AFTER UPDATE OF quantity, category ON products
+                FOR EACH ROW
+                WHEN (OLD.quantity IS DISTINCT FROM NEW.quantity OR OLD.category IS DISTINCT FROM NEW.category)
+                EXECUTE FUNCTION products_low_stock();
+            """)
+            # Смена порога затрагивает только товары своей категории (индекс (category, quantity))
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION category_min_quantity_low_stock()
+                RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.category IS DISTINCT FROM NEW.category) THEN
+                        DELETE FROM low_stock_products l
+                        USING products p
+                        WHERE p.id = l.product_id AND p.category = OLD.category;
+                    END IF;
+                    IF TG_OP = 'DELETE' THEN
+                        RETURN NULL;
+                    END IF;
+                    IF TG_OP = 'UPDATE' THEN
+                        DELETE FROM low_stock_products l
+                        USING products p
+                        WHERE p.id = l.product_id AND p.category = NEW.category
+                          AND p.quantity >= NEW.min_quantity;
+                    END IF;
+                    INSERT INTO low_stock_products (product_id, min_quantity)
+                    SELECT id, NEW.min_quantity FROM products
+                    WHERE category = NEW.category AND quantity < NEW.min_quantity
+                    ON CONFLICT (product_id) DO UPDATE SET min_quantity = EXCLUDED.min_quantity;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS category_min_quantities_low_stock_trigger ON category_min_quantities;
+                CREATE TRIGGER category_min_quantities_low_stock_trigger
+                AFTER INSERT OR UPDATE OR DELETE ON category_min_quantities
+                FOR EACH ROW
+                EXECUTE FUNCTION category_min_quantity_low_stock();
+            """)
+            cur.execute("""
+                INSERT INTO low_stock_products (product_id, min_quantity, notified)
+                SELECT p.id, m.min_quantity, TRUE
+                FROM products p
+                JOIN category_min_quantities m ON m.category = p.category
+                WHERE p.quantity < m.min_quantity
+                ON CONFLICT (product_id) DO UPDATE SET min_quantity = EXCLUDED.min_quantity
+            """)
 
     def add_supplier(self, supplier_data):
         try:
-            self.cursor.execute(
-                """INSERT INTO suppliers (name, phone, email, comment) VALUES (%s, %s, %s, %s)""",
-                (
-                    supplier_data['name'],
-                    supplier_data['phone'],
-                    supplier_data['email'],
-                    supplier_data['comment']
+            with self.transaction() as cur:
+                cur.execute(
+                    """INSERT INTO suppliers (name, phone, email, comment) VALUES (%s, %s, %s, %s)""",
+                    (
+                        supplier_data['name'],
+                        supplier_data['phone'],
+                        supplier_data['email'],
+                        supplier_data['comment']
+                    )
                 )
-            )
-            self.connection.commit()
             return True
         except Exception as e:
             print(f"Ошибка при добавлении поставщика: {e}")
-            self.connection.rollback()
             return False
 
     def add_product_movement(self, product_id: int, movement_type: str, quantity: int, username: str, comment: str) -> bool:
         """Добавляет запись о движении товара (без reference_id и reference_type)"""
         try:
-            # Получаем текущее количество товара
-            self.cursor.execute("SELECT quantity FROM products WHERE id = %s", (product_id,))
-            result = self.cursor.fetchone()
-            if not result:
-                return False
-            previous_quantity = int(result[0])
-            new_quantity = previous_quantity + quantity if movement_type == 'IN' else previous_quantity - quantity
-            # Добавляем запись о движении
-            self.cursor.execute("""
-                INSERT INTO product_movement 
-                (product_id, movement_type, quantity, previous_quantity, new_quantity, username, comment)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (product_id, movement_type, quantity, previous_quantity, new_quantity, username, comment))
-            # Обновляем количество товара
-            self.cursor.execute("""
-                UPDATE products SET quantity = %s WHERE id = %s
-            """, (str(new_quantity), product_id))
-            self.connection.commit()
+            with self.transaction() as cur:
+                # Получаем текущее количество товара
+                cur.execute("SELECT quantity FROM products WHERE id = %s FOR UPDATE", (product_id,))
+                result = cur.fetchone()
+                if not result:
+                    return False
+                previous_quantity = result[0]
+                new_quantity = previous_quantity + quantity if movement_type == 'IN' else previous_quantity - quantity
+                # Добавляем запись о движении
+                cur.execute("""
+                    INSERT INTO product_movement 
+                    (product_id, movement_type, quantity, previous_quantity, new_quantity, username, comment)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (product_id, movement_type, quantity, previous_quantity, new_quantity, username, comment))
+                # Обновляем количество товара
+                cur.execute("""
+                    UPDATE products SET quantity = %s WHERE id = %s
+                """, (new_quantity, product_id))
             return True
         except Exception as e:
             print(f"Ошибка при добавлении движения товара: {e}")
-            self.connection.rollback()
             return False
 
     def get_product_movement_history(self, product_id: int = None, 
@@ -1309,8 +2708,9 @@ class DatabaseManager:
             
             query += " ORDER BY pm.movement_date DESC"
             
-            self.cursor.execute(query, params)
-            results = self.cursor.fetchall()
+            with self.transaction() as cur:
+                cur.execute(query, params)
+                results = cur.fetchall()
             
             return [{
                 'id': row[0],
@@ -1332,14 +2732,17 @@ class DatabaseManager:
     def log_initial_product_movement(self, product_id: int, quantity: int, username: str, comment: str = None):
         """Добавляет запись о первоначальном поступлении товара без изменения количества"""
         try:
-            self.cursor.execute(
-                "INSERT INTO product_movement (product_id, movement_type, quantity, previous_quantity, new_quantity, username, reference_type, comment) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
-                (product_id, 'IN', quantity, 0, quantity, username, 'Первичное добавление', comment)
-            )
-            self.connection.commit()
+            with self.transaction() as cur:
+                cur.execute(
+                    "INSERT INTO product_movement (product_id, movement_type, quantity, previous_quantity, new_quantity, username, reference_type, comment) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                    (product_id, 'IN', quantity, 0, quantity, username, 'Первичное добавление', comment)
+                )
             return True
         except Exception as e:
             print(f"Ошибка при логировании первоначального поступления: {e}")
-            self.connection.rollback()
-            return False
\ No newline at end of file
+            return False
+
+
+# Соединения пула закрываются при завершении процесса
+atexit.register(DatabaseManager.close_pool)
@@ -13,6 +13,8 @@ from email.mime.text import MIMEText
 import traceback
 import bcrypt
 from PyQt5.QtCore import QTimer
+from app_code.product_search import ProductSearchIndex, connect_debounced
+from app_code.database import format_price
 
 logging.basicConfig(filename="debug.log", level=logging.DEBUG, filemode="a")
 
@@ -319,19 +321,19 @@ class EditItemDialog(AddItemDialog):
     def load_product_data(self):
         self.name_input.setText(self.product["name"])
         if "retail_price" in self.product:
-            self.price_input.setText(self.product["retail_price"])
+            self.price_input.setText(format_price(self.product["retail_price"]))
         else:
-            self.price_input.setText(self.product["price"])
-        self.quantity_input.setText(self.product["quantity"])
+            self.price_input.setText(format_price(self.product["price"]))
+        self.quantity_input.setText(str(self.product["quantity"]))
         if self.product["category"] != "Без категории":
             self.category_combo.setCurrentText(self.product["category"])
         self.image_path = self.product["image"]
         if "barcode" in self.product:
             self.barcode_input.setText(self.product["barcode"])
         if "purchase_price" in self.product:
-            self.purchase_price_input.setText(self.product["purchase_price"])
+            self.purchase_price_input.setText(format_price(self.product["purchase_price"]))
         if "retail_price" in self.product:
-            self.retail_price_input.setText(self.product["retail_price"])
+            self.retail_price_input.setText(format_price(self.product["retail_price"]))
 
     def get_updated_data(self):
         data = {
@@ -586,11 +588,12 @@ class PasswordResetDialog(BaseDialog):
             return
 
         # Проверяем существование пользователя с таким логином и email
-        self.db.cursor.execute(
-            "SELECT username FROM users WHERE username = %s AND email = %s",
-            (username, email)
-        )
-        user = self.db.cursor.fetchone()
+        with self.db.transaction() as cur:
+            cur.execute(
+                "SELECT username FROM users WHERE username = %s AND email = %s",
+                (username, email)
+            )
+            user = cur.fetchone()
         
         if not user:
             self.status_label.setText("Неверный логин или email")
@@ -602,11 +605,11 @@ class PasswordResetDialog(BaseDialog):
         
         try:
             # Обновляем пароль в базе
-            self.db.cursor.execute(
-                "UPDATE users SET password = %s WHERE username = %s AND email = %s",
-                (hashed_password.decode('utf-8'), username, email)
-            )
-            self.db.connection.commit()
+            with self.db.transaction() as cur:
+                cur.execute(
+                    "UPDATE users SET password = %s WHERE username = %s AND email = %s",
+                    (hashed_password.decode('utf-8'), username, email)
+                )
 
             self.status_label.setText("Пароль успешно изменен")
             self.status_label.setStyleSheet("color: #28a745;")
@@ -617,7 +620,6 @@ class PasswordResetDialog(BaseDialog):
             
         except Exception as e:
             self.status_label.setText(f"Ошибка: {str(e)}")
-            self.db.connection.rollback()
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
@@ -642,13 +644,18 @@ class ProductMovementHistoryDialog(QDialog):
         # Фильтры
         filter_layout = QHBoxLayout()
         
-        # Выбор товара
+        # Выбор товара: поле поиска сужает список в выпадающем меню
+        self.product_search = QLineEdit()
+        self.product_search.setPlaceholderText("Поиск товара...")
+        self.product_search.setFixedWidth(160)
+        connect_debounced(self.product_search, self.filter_product_combo)
         self.product_combo = QComboBox()
         self.product_combo.setMinimumWidth(200)
         self.load_products()
         if self.product_id:
             self.product_combo.setCurrentIndex(self.product_combo.findData(self.product_id))
         filter_layout.addWidget(QLabel("Товар:"))
+        filter_layout.addWidget(self.product_search)
         filter_layout.addWidget(self.product_combo)
 
         # Период
@@ -702,12 +709,25 @@ class ProductMovementHistoryDialog(QDialog):
         layout.addLayout(button_layout)
 
     def load_products(self):
-        self.db.cursor.execute("SELECT id, name FROM products ORDER BY name")
-        products = self.db.cursor.fetchall()
+        with self.db.transaction() as cur:
+            cur.execute("SELECT id, name FROM products ORDER BY name")
+            self.product_names = dict(cur.fetchall())
+        self.search_index = ProductSearchIndex(self.product_names.items())
+        self.fill_product_combo(list(self.product_names))
+
+    def fill_product_combo(self, product_ids):
+        selected = self.product_combo.currentData()
+        self.product_combo.blockSignals(True)
         self.product_combo.clear()
         self.product_combo.addItem("Все товары", None)
-        for product_id, name in products:
-            self.product_combo.addItem(name, product_id)
+        for product_id in product_ids:
+            self.product_combo.addItem(self.product_names[product_id], product_id)
+        index = self.product_combo.findData(selected)
+        self.product_combo.setCurrentIndex(max(index, 0))
+        self.product_combo.blockSignals(False)
+
+    def filter_product_combo(self):
+        self.fill_product_combo(self.search_index.search(self.product_search.text()))
 
     def load_history(self):
         self.refresh_btn.setEnabled(False)
@@ -5,15 +5,16 @@ from PyQt5.QtWidgets import (
     QPushButton, QFrame, QSizePolicy, QLabel, QListWidget, QListWidgetItem, QMessageBox, QHBoxLayout,
     QScrollArea, QComboBox
 )
-from PyQt5.QtCore import Qt, QPoint, QPropertyAnimation, QEasingCurve, QRect, QTimer
+from PyQt5.QtCore import Qt, QPoint, QPropertyAnimation, QEasingCurve, QRect, QTimer, QRunnable, QThreadPool
 from PyQt5.QtGui import QIcon, QPixmap, QPainter, QPainterPath, QColor
-from PIL import Image, ImageQt
 from PyQt5.QtCore import pyqtSignal
 
 from app_code.widgets import SlideMenu, CartDrawer
 from app_code.profile_page import ProfilePage
 from app_code.settings_page import SettingsPage
 from app_code.database import DatabaseManager
+from app_code.avatar_cache import AvatarCache
+from app_code.product_images import ProductImageService
 from app_code.animations import SlideAnimation
 from app_code.catalog_page import StockPage  # Импорт новой страницы
 from app_code.sales_history_page import SalesHistoryPage
@@ -100,14 +101,15 @@ class UserCard(QFrame):
     delete_requested = pyqtSignal(object)
     add_to_cart_requested = pyqtSignal(object)
 
-    def __init__(self, user_data, on_delete, parent=None, on_role_change=None, current_username=None):
+    def __init__(self, user_data, on_delete, parent=None, on_role_change=None, current_username=None, db=None,
+                 avatar_cache=None):
         super().__init__(parent)
         self.user_data = user_data
         self.on_delete = on_delete
         self.on_role_change = on_role_change # Store the callback
         self.current_username = current_username
-        from app_code.database import DatabaseManager
-        self.db = DatabaseManager()
+        self.db = db if db is not None else DatabaseManager()
+        self.avatar_cache = avatar_cache if avatar_cache is not None else AvatarCache(self.db, parent=self)
         self.AVATAR_SIZE = 110  # Было 220
         self.setup_ui()
         
@@ -225,132 +227,17 @@ class UserCard(QFrame):
             self.save_role_btn.setEnabled(False)
         
     def update_avatar(self):
-        from PyQt5.QtGui import QPixmap, QPainter, QPainterPath
-        from PIL import Image, ImageQt
-        import io
-        AVATAR_SIZE = self.AVATAR_SIZE
-        # Используем photo_data из user_data, если есть
-        photo_bytes = self.user_data.get('photo_data')
-        print(f"[UserCard] {self.user_data.get('username')}: photo_data type: {type(photo_bytes)}, length: {len(photo_bytes) if photo_bytes else 0}")
-        if isinstance(photo_bytes, memoryview):
-            photo_bytes = photo_bytes.tobytes()
-        if not photo_bytes and hasattr(self, 'db'):
-            try:
-                photo_bytes = self.db.get_user_photo(self.user_data['username'])
-                if isinstance(photo_bytes, memoryview):
-                    photo_bytes = photo_bytes.tobytes()
-            except Exception:
-                photo_bytes = None
-        if photo_bytes:
-            size = AVATAR_SIZE
-            try:
-                image = Image.open(io.BytesIO(photo_bytes)).convert('RGBA')
-                # Масштабируем с cover
-                w, h = image.size
-                scale = max(size / w, size / h)
-                new_w, new_h = int(w * scale), int(h * scale)
-                image = image.resize((new_w, new_h), Image.LANCZOS)
-                # Обрезаем центральный квадрат
-                left = (new_w - size) // 2
-                top = (new_h - size) // 2
-                image = image.crop((left, top, left + size, top + size))
-                qt_img = ImageQt.ImageQt(image)
-                src = QPixmap.fromImage(qt_img)
-                # Обрезаем QPixmap по кругу
-                final = QPixmap(size, size)
-                final.fill(Qt.transparent)
-                painter = QPainter(final)
-                painter.setRenderHint(QPainter.Antialiasing)
-                path = QPainterPath()
-                path.addEllipse(0, 0, size, size)
-                painter.setClipPath(path)
-                painter.drawPixmap(0, 0, src)
-                painter.end()
-                self.avatar_label.setPixmap(final)
-                self.avatar_label.setText("")
-                return
-            except Exception as e:
-                print(f"[UserCard] Ошибка открытия изображения через Pillow: {e}")
-                # Пробуем открыть напрямую через QPixmap
-                try:
-                    src = QPixmap()
-                    src.loadFromData(photo_bytes)
-                    if not src.isNull():
-                        print(f"[UserCard] Изображение открыто через QPixmap: размер={src.width()}x{src.height()}")
-                    else:
-                        print("[UserCard] QPixmap не смог загрузить изображение")
-                except Exception as qp_e:
-                    print(f"[UserCard] Ошибка открытия через QPixmap: {qp_e}")
-                    src = QPixmap()
-            scaled = src.scaled(size, size, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
-            x = (scaled.width() - size) // 2
-            y = (scaled.height() - size) // 2
-            cropped = scaled.copy(x, y, size, size)
-            mask = QPixmap(size, size)
-            mask.fill(Qt.transparent)
-            painter = QPainter(mask)
-            painter.setRenderHint(QPainter.Antialiasing)
-            path = QPainterPath()
-            path.addEllipse(0, 0, size, size)
-            painter.setClipPath(path)
-            painter.drawPixmap(0, 0, cropped)
-            painter.end()
-            self.avatar_label.setPixmap(mask)
-            self.avatar_label.setText("")
-        elif self.user_data.get('photo_path') and os.path.exists(self.user_data['photo_path']):
-            size = AVATAR_SIZE
-            try:
-                pil_img = Image.open(self.user_data['photo_path']).convert('RGBA')
-                bbox = pil_img.getbbox()
-                if bbox:
-                    pil_img = pil_img.crop(bbox)
-                qt_img = ImageQt.ImageQt(pil_img)
-                src = QPixmap.fromImage(qt_img)
-            except Exception:
-                src = QPixmap(self.user_data['photo_path'])
-            scale_factor = size / min(src.width(), src.height())
-            new_width = int(src.width() * scale_factor)
-            new_height = int(src.height() * scale_factor)
-            scaled = src.scaled(new_width, new_height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            x = (scaled.width() - size) // 2
-            y = (scaled.height() - size) // 2
-            cropped = scaled.copy(x, y, size, size)
-            mask = QPixmap(size, size)
-            mask.fill(Qt.transparent)
-            painter = QPainter(mask)
-            painter.setRenderHint(QPainter.Antialiasing)
-            path = QPainterPath()
-            path.addEllipse(0, 0, size, size)
-            painter.setClipPath(path)
-            painter.drawPixmap(0, 0, cropped)
-            painter.end()
-            self.avatar_label.setPixmap(mask)
-            self.avatar_label.setText("")
-        else:
-            # Рисуем только круг и текст внутри него
-            size = AVATAR_SIZE
-            pixmap = QPixmap(size, size)
-            pixmap.fill(Qt.transparent)
-            painter = QPainter(pixmap)
-            painter.setRenderHint(QPainter.Antialiasing)
-            # Круг
-            pen = painter.pen()
-            pen.setWidth(3)
-            pen.setColor(QColor('#888'))
-            painter.setPen(pen)
-            painter.setBrush(Qt.NoBrush)
-            painter.drawEllipse(0, 0, size-1, size-1)
-            # Текст
-            painter.setPen(QColor('#aaa'))
-            font = painter.font()
-            font.setPointSize(13)
-            painter.setFont(font)
-            text = "Нет фото"
-            rect = pixmap.rect()
-            painter.drawText(rect, Qt.AlignCenter, text)
-            painter.end()
-            self.avatar_label.setPixmap(pixmap)
-            self.avatar_label.setText("")
+        """Аватар из кэша; пока его готовят, показывается заглушка, а картинку
+        подставит set_avatar"""
+        pixmap = self.avatar_cache.get(self.user_data['username'], self.user_data.get('photo_hash'),
+                                       self.AVATAR_SIZE, self.user_data.get('photo_path'))
+        if pixmap is None:
+            pixmap = self.avatar_cache.placeholder(self.AVATAR_SIZE)
+        self.set_avatar(pixmap)
+
+    def set_avatar(self, pixmap):
+        self.avatar_label.setPixmap(pixmap)
+        self.avatar_label.setText("")
 
     def save_role_clicked(self):
         selected_role = self.role_combo.currentText()
@@ -362,6 +249,10 @@ class UserManagePage(QWidget):
         super().__init__(parent)
         self.db = db
         self.current_username = current_username # Store current username
+        # Аватары готовятся в фоне и приходят сигналом по логину
+        self.avatar_cache = AvatarCache(db, parent=self)
+        self.avatar_cache.ready.connect(self.on_avatar_ready)
+        self.cards = {}
         self.init_ui()
         self.load_users()
 
@@ -402,9 +293,9 @@ class UserManagePage(QWidget):
             if item.widget():
                 item.widget().deleteLater()
         
+        self.cards = {}
         users = self.db.get_all_users()
         print(f"Получено пользователей: {len(users)}")  # Отладочная информация
-        print(f"Список пользователей: {users}")  # Отладочная информация
         
         # Добавляем карточки пользователей в сетку
         row = 0
@@ -412,13 +303,20 @@ class UserManagePage(QWidget):
         max_cols = 5  # Было 3, теперь 5 карточек в ряду
         
         for user in users:
-            card = UserCard(user, self.delete_user, on_role_change=self.update_user_role_in_db, current_username=self.current_username)
+            card = UserCard(user, self.delete_user, on_role_change=self.update_user_role_in_db, current_username=self.current_username, db=self.db,
+                            avatar_cache=self.avatar_cache)
+            self.cards[user['username']] = card
             self.grid_layout.addWidget(card, row, col)
             col += 1
             if col >= max_cols:
                 col = 0
                 row += 1
 
+    def on_avatar_ready(self, username, size, pixmap):
+        card = self.cards.get(username)
+        if card is not None and card.AVATAR_SIZE == size:
+            card.set_avatar(pixmap)
+
     def delete_user(self, username):
         reply = QMessageBox.question(
             self,
@@ -440,6 +338,19 @@ class UserManagePage(QWidget):
         else:
             QMessageBox.warning(self, "Ошибка", f"Не удалось обновить роль пользователя {username}")
 
+# Как часто обслуживать секции истории продаж (первый проход — при запуске)
+SALES_MAINTENANCE_INTERVAL_MS = 6 * 60 * 60 * 1000
+
+
+class _SalesMaintenanceTask(QRunnable):
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    def run(self):
+        self.db.maintain_sales_partitions()
+
+
 class MainWindow(QWidget):
     def __init__(self, username: str, role: str):
         super().__init__()
@@ -465,8 +376,24 @@ class MainWindow(QWidget):
         self.slide_menu.list_widget.setCurrentRow(0)
         self.slide_menu.animation.valueChanged.connect(self.on_menu_width_changed)
         self.update_layouts()
+        self.setup_sales_maintenance()
         self.showMaximized()
 
+    def setup_sales_maintenance(self):
+        # Секции истории продаж: создание будущих месяцев и удаление устаревших.
+        # DDL и удаление секций ждут блокировок — поэтому в отдельном потоке
+        self.sales_maintenance_pool = QThreadPool(self)
+        self.sales_maintenance_pool.setMaxThreadCount(1)
+        self.sales_maintenance_timer = QTimer(self)
+        self.sales_maintenance_timer.timeout.connect(self.start_sales_maintenance)
+        self.sales_maintenance_timer.start(SALES_MAINTENANCE_INTERVAL_MS)
+        self.start_sales_maintenance()
+
+    def start_sales_maintenance(self):
+        # Предыдущий проход ещё идёт — новый не ставится в очередь
+        if self.sales_maintenance_pool.activeThreadCount() == 0:
+            self.sales_maintenance_pool.start(_SalesMaintenanceTask(self.db))
+
     def setup_slide_menu(self):
         self.slide_menu = SlideMenu(self, role=self.role)
         self.slide_menu.setParent(self)
@@ -519,7 +446,7 @@ class MainWindow(QWidget):
         # Остальные страницы
         if self.role == "пользователь":
             self.pages.addWidget(self.sales_history_page)
-            self.profile_page = ProfilePage(self.username, self.role)
+            self.profile_page = ProfilePage(self.username, self.role, db=self.db)
             self.pages.addWidget(self.profile_page)
         elif self.role == "администратор":
             self.user_manage_page = UserManagePage(self.db, current_username=self.username)
@@ -596,7 +523,19 @@ class MainWindow(QWidget):
         self.title_bar.title.setText(titles.get(index, ""))
 
     def closeEvent(self, event):
+        if hasattr(self, 'catalog_page'):
+            self.catalog_page.shutdown()
+        if hasattr(self, 'analytics_page'):
+            self.analytics_page.stop_loading()
+        if hasattr(self, 'user_manage_page'):
+            self.user_manage_page.avatar_cache.shutdown()
+        if hasattr(self, 'sales_maintenance_pool'):
+            self.sales_maintenance_timer.stop()
+            self.sales_maintenance_pool.clear()
+            self.sales_maintenance_pool.waitForDone()
+        ProductImageService.instance().shutdown()
         self.db.close()
+        DatabaseManager.close_pool()
         event.accept()
 
     def paintEvent(self, event):
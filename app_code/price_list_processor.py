@@ -1,14 +1,30 @@
 import pandas as pd
 import os
 import shutil
-from datetime import datetime
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, 
                             QTableView, QHeaderView, QMessageBox, QSpinBox, QLabel, QFileDialog, QLineEdit, QComboBox)
 from PyQt5.QtCore import Qt, QAbstractTableModel, QVariant
 import subprocess
 import pprint
 import numpy as np
+from itertools import chain, islice
+from xml.etree import ElementTree
 from openpyxl import load_workbook
+from openpyxl.utils.cell import range_boundaries
+
+# Ключевые слова, по которым узнаётся строка заголовков прайс-листа
+HEADER_KEYWORDS = [
+    'артикул', 'название', 'описание', 'характерист', 'размер', 'цена', 'оптов', 'категор', 'группа', 'photo', 'фото', 'упаков', 'order', 'заказ', 'сумма'
+]
+# Сколько первых строк листа просматривается в поисках заголовка
+HEADER_SCAN_ROWS = 30
+# Размер куска прайс-листа при потоковом чтении
+PRICE_LIST_CHUNK_ROWS = 5000
+# Колонки-ключи для сравнения версий прайс-листа: сначала артикул, затем название
+KEY_COLUMN_HINTS = (
+    ['артикул', 'sku', 'код', 'code'],
+    ['наименование', 'назв', 'name', 'товар'],
+)
 
 class PandasModel(QAbstractTableModel):
     def __init__(self, df, editable_col=None, excel_header_row=None):
@@ -64,58 +80,190 @@ class PandasModel(QAbstractTableModel):
     def get_dataframe(self):
         return self._df.copy()
 
-def load_excel_with_merged_cells(file_path, sheet_name=None, header_row=0):
-    wb = load_workbook(file_path, data_only=True)
-    ws = wb[sheet_name or wb.sheetnames[0]]
-    # Разворачиваем объединённые ячейки
-    for merged_range in ws.merged_cells.ranges:
-        min_row, min_col, max_row, max_col = merged_range.min_row, merged_range.min_col, merged_range.max_row, merged_range.max_col
-        value = ws.cell(row=min_row, column=min_col).value
-        for row in range(min_row, max_row + 1):
-            for col in range(min_col, max_col + 1):
-                ws.cell(row=row, column=col).value = value
-    # Считываем данные в список списков
-    data = []
-    for row in ws.iter_rows(values_only=True):
-        data.append(list(row))
-    # Преобразуем в DataFrame
-    import pandas as pd
-    df = pd.DataFrame(data)
-    # Первая строка после header_row — это заголовки
-    df.columns = df.iloc[header_row]
-    df = df.drop(index=list(range(0, header_row+1)))
-    df = df.reset_index(drop=True)
-    # Сохраняем промежуточный результат для диагностики
-    try:
-        df.to_csv('temp_debug_output.csv', index=False, encoding='utf-8-sig')
-        print('DEBUG CSV SAVED!')
-    except Exception as e:
-        print(f'Ошибка при сохранении debug csv: {e}')
-    return df
+def merged_cell_ranges(ws):
+    """Объединённые ячейки листа книги read_only: (min_row, min_col, max_row, max_col).
+
+    В режиме read_only openpyxl не разбирает mergeCells, поэтому секция
+    читается из XML листа потоково: строки данных сбрасываются сразу после
+    разбора и в памяти не накапливаются.
+    """
+    path = getattr(ws, '_worksheet_path', None)
+    archive = getattr(ws.parent, '_archive', None)
+    if path is None or archive is None:
+        return []
+    ranges = []
+    sheet_data = None
+    with archive.open(path) as source:
+        for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag == 'sheetData':
+                    sheet_data = element
+            elif tag == 'row' and sheet_data is not None:
+                sheet_data.clear()
+            elif tag == 'mergeCell':
+                min_col, min_row, max_col, max_row = range_boundaries(element.get('ref'))
+                ranges.append((min_row, min_col, max_row, max_col))
+    return ranges
+
+def fill_merged_cells(rows, ranges):
+    """Проставляет значение левой верхней ячейки во все ячейки объединённых диапазонов.
+
+    rows — строки листа по порядку начиная с первой. Одновременно хранятся
+    только диапазоны, пересекающие текущую строку.
+    """
+    starts = {}
+    for merged in ranges:
+        starts.setdefault(merged[0], []).append(merged)
+    active = []
+    for row_number, row in enumerate(rows, start=1):
+        row = list(row)
+        for _, min_col, max_row, max_col in starts.pop(row_number, ()):
+            value = row[min_col - 1] if min_col <= len(row) else None
+            active.append((max_row, min_col, max_col, value))
+        if active:
+            width = max(max_col for _, _, max_col, _ in active)
+            if len(row) < width:
+                row.extend([None] * (width - len(row)))
+            for _, min_col, max_col, value in active:
+                row[min_col - 1:max_col] = [value] * (max_col - min_col + 1)
+            active = [merged for merged in active if merged[0] > row_number]
+        yield row
+
+def find_header_index(rows, keywords=HEADER_KEYWORDS):
+    """Номер строки заголовков среди rows или None"""
+    for i, row in enumerate(rows):
+        row_str = ' '.join(str(cell).lower() for cell in row if cell is not None)
+        if sum(kw in row_str for kw in keywords) >= 2:  # если найдено хотя бы 2 ключевых слова
+            return i
+    return None
+
+class PriceListReader:
+    """Потоковое чтение прайс-листа за один проход.
+
+    Книга открывается в режиме read_only, заголовок ищется в первых
+    max_scan_rows строках каждого листа, объединённые ячейки заполняются
+    по карте диапазонов. chunks() отдаёт данные под заголовком кусками
+    DataFrame по chunk_rows строк; после первого куска известны sheet,
+    header_row (номер строки с нуля) и columns.
+    """
+
+    def __init__(self, file_path, max_scan_rows=HEADER_SCAN_ROWS, chunk_rows=PRICE_LIST_CHUNK_ROWS):
+        self.file_path = file_path
+        self.max_scan_rows = max_scan_rows
+        self.chunk_rows = chunk_rows
+        self.sheet = None
+        self.header_row = None
+        self.columns = None
+
+    def chunks(self):
+        wb = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            for ws in wb.worksheets:
+                rows = ws.iter_rows(values_only=True)
+                scanned = list(islice(rows, self.max_scan_rows))
+                header_row = find_header_index(scanned)
+                if header_row is None:
+                    continue
+                print(f"Заголовок найден на строке {header_row} листа '{ws.title}'")
+                rows = fill_merged_cells(chain(scanned, rows), merged_cell_ranges(ws))
+                for _ in range(header_row):
+                    next(rows)
+                self.sheet = ws.title
+                self.header_row = header_row
+                self.columns = next(rows)
+                width = len(self.columns)
+                batch = []
+                for row in rows:
+                    # Ширина строк приводится к ширине заголовка
+                    batch.append(row[:width] + [None] * (width - len(row)))
+                    if len(batch) >= self.chunk_rows:
+                        yield self._frame(batch)
+                        batch = []
+                if batch:
+                    yield self._frame(batch)
+                return
+        finally:
+            wb.close()
+        raise ValueError("Не удалось найти строку с заголовками таблицы. Проверьте структуру файла.")
+
+    def _frame(self, rows):
+        """Кусок прайс-листа: строки обрезаны по краям, пустые стали NaN, типы колонок выведены"""
+        df = pd.DataFrame(rows, columns=self.columns)
+        # По позиции: в прайс-листах встречаются одинаковые заголовки колонок
+        for i in range(df.shape[1]):
+            if df.dtypes.iloc[i] != object:
+                continue
+            values = df.iloc[:, i]
+            is_text = values.map(lambda value: isinstance(value, str))
+            if is_text.any():
+                stripped = values[is_text].str.strip()
+                df.iloc[:, i] = values.where(~is_text, stripped.where(stripped != '', np.nan))
+        return df.dropna(how='all').infer_objects()
+
+def find_key_column(original, edited):
+    """Общая колонка-ключ двух версий прайс-листа: артикул, иначе название; None — если нет"""
+    common = [col for col in original.columns if col in edited.columns]
+    for hints in KEY_COLUMN_HINTS:
+        for col in common:
+            if any(hint in str(col).lower() for hint in hints):
+                return col
+    return None
+
+def _key_values(series):
+    """Значения ключа строками; 123 и 123.0 (колонка стала float из-за пустых) совпадают"""
+    if pd.api.types.is_float_dtype(series):
+        whole = series.notna() & (series % 1 == 0)
+        series = series.astype(object).where(~whole, series[whole].astype('int64'))
+    return series.astype(str).str.strip().where(series.notna(), '')
+
+def _keyed(df, key):
+    """Копия df с индексом (ключ, номер повтора); без ключа строки идут по порядку"""
+    values = pd.Series('', index=df.index) if key is None else _key_values(df[key])
+    occurrence = values.groupby(values).cumcount()
+    return df.set_axis(pd.MultiIndex.from_arrays([values.to_numpy(), occurrence.to_numpy()]), axis=0)
+
+def diff_price_lists(original, edited, key=None):
+    """Сравнивает исходный и изменённый прайс-листы целыми колонками.
+
+    Строки сопоставляются по колонке key (по умолчанию find_key_column,
+    повторы ключа — по порядку), а без ключа — по номеру строки. Значения
+    сравниваются по общим колонкам, два пустых значения равны; заполненная
+    ячейка в колонке, которой нет в исходном файле, тоже считается изменением.
+
+    Возвращает словарь key, added, modified (строки edited) и removed
+    (строки original) — DataFrame в порядке файлов.
+    """
+    if key is None:
+        key = find_key_column(original, edited)
+    orig = _keyed(original, key)
+    new = _keyed(edited, key)
+    in_orig = new.index.isin(orig.index)
+    common = new.index[in_orig]
+    columns = [col for col in new.columns if col in orig.columns]
+    left = orig.loc[common, columns]
+    right = new.loc[common, columns]
+    changed = ~(left.eq(right) | (left.isna() & right.isna()))
+    row_changed = changed.any(axis=1).to_numpy()
+    extra = [col for col in new.columns if col not in orig.columns]
+    if extra:
+        row_changed |= new.loc[common, extra].notna().any(axis=1).to_numpy()
+    return {
+        'key': key,
+        'added': edited.iloc[np.flatnonzero(~in_orig)],
+        'removed': original.iloc[np.flatnonzero(~orig.index.isin(new.index))],
+        'modified': edited.iloc[np.flatnonzero(in_orig)[row_changed]],
+    }
 
 class PriceListProcessor:
-    def __init__(self, db):
+    def __init__(self, db, debug_csv=None):
         self.db = db
+        # Путь для выгрузки обработанного прайс-листа при отладке; по умолчанию не пишется
+        self.debug_csv = debug_csv
         self.price_list_data = None
         self.selected_items = {}
         self.column_mapping = {}
 
-    def find_header_row(self, file_path, max_scan_rows=30):
-        """Автоматически ищет строку с заголовками по ключевым словам."""
-        # Ключевые слова для поиска
-        keywords = [
-            'артикул', 'название', 'описание', 'характерист', 'размер', 'цена', 'оптов', 'категор', 'группа', 'photo', 'фото', 'упаков', 'order', 'заказ', 'сумма'
-        ]
-        xl = pd.ExcelFile(file_path)
-        for sheet in xl.sheet_names:
-            df = xl.parse(sheet, header=None, nrows=max_scan_rows)
-            for i, row in df.iterrows():
-                row_str = ' '.join([str(cell).lower() for cell in row if pd.notnull(cell)])
-                if sum(kw in row_str for kw in keywords) >= 2:  # если найдено хотя бы 2 ключевых слова
-                    print(f"Заголовок найден на строке {i} листа '{sheet}': {row_str}")
-                    return i, sheet
-        raise ValueError("Не удалось найти строку с заголовками таблицы. Проверьте структуру файла.")
-
     def detect_columns(self, df):
         """Определение нужных колонок по их содержимому (улучшено: гибкий поиск, добавлен 'фото и описание')"""
         possible_names = {
@@ -169,19 +317,15 @@ class PriceListProcessor:
         try:
             print(f"\nЗагрузка файла: {file_path}")
             
-            # 1. Определяем строку заголовка
-            header_row, sheet = self.find_header_row(file_path)
-            print(f"Используем строку {header_row} как заголовок на листе '{sheet}'")
-            
-            # 2. Загружаем данные с учетом объединенных ячеек
-            df = load_excel_with_merged_cells(file_path, sheet_name=sheet, header_row=header_row)
+            # 1-2. Один проход по файлу: заголовок, объединённые ячейки, очищенные куски
+            reader = PriceListReader(file_path)
+            chunks = list(reader.chunks())
+            print(f"Используем строку {reader.header_row} как заголовок на листе '{reader.sheet}'")
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=reader.columns)
+            del chunks
             
             # 3. Очистка данных
             df = df.dropna(how='all').dropna(axis=1, how='all')
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    df[col] = df[col].astype(str).str.strip()
-                    df[col] = df[col].replace(r'^\s*$', np.nan, regex=True)
             
             # 4. Определяем важные колонки
             cols = [str(c).lower() for c in df.columns]
@@ -218,8 +362,9 @@ class PriceListProcessor:
                 df = df.drop_duplicates(subset=[art_col])
                 df = df[df[art_col].notna() & (df[art_col] != '')]
             
-            # 8. Сохраняем промежуточный результат для диагностики
-            df.to_csv('temp_debug_output.csv', index=False, encoding='utf-8-sig')
+            # 8. Сохраняем промежуточный результат для диагностики, если это включено
+            if self.debug_csv:
+                df.to_csv(self.debug_csv, index=False, encoding='utf-8-sig')
             print("\nОбработанные данные:")
             print(f"Всего строк: {len(df)}")
             print(f"Колонки: {', '.join(df.columns)}")
@@ -300,39 +445,27 @@ class PriceListProcessor:
             print(f"Ошибка при создании файла заказа: {e}")
             return False
 
-    def add_to_pending_orders(self, selected_items, supplier_id=None):
-        """Добавление выбранных товаров в ожидающие заказы (master-detail)"""
+    def add_to_pending_orders(self, selected_items, supplier_id=None, supplier_name=None):
+        """Добавление выбранных товаров в ожидающие заказы (master-detail)
+
+        selected_items — {название: количество}. Цена и категория берутся из
+        прайс-листа одним сопоставлением по названию, позиции записываются
+        в базу пакетом через COPY.
+        """
         try:
-            # 1. Добавляем заказ (шапку)
-            self.db.cursor.execute("""
-                INSERT INTO pending_orders (supplier, order_date, status)
-                VALUES (%s, %s, %s) RETURNING id
-            """, (supplier_id, datetime.now(), 'Ожидает поступления'))
-            order_id = self.db.cursor.fetchone()[0]
-            # 2. Добавляем товары (позиции)
-            for item_name, quantity in selected_items.items():
-                item_data = self.price_list_data[self.price_list_data['Название'] == item_name].iloc[0]
-                # Проверка на пустые значения
-                if (not item_name or pd.isnull(item_name) or str(item_name).strip() == '' or
-                    pd.isnull(item_data['Цена']) or str(item_data['Цена']).strip() == '' or
-                    pd.isnull(item_data['Категория']) or str(item_data['Категория']).strip() == ''):
-                    print(f"[SKIP] Пустое значение: name={item_name}, price={item_data['Цена']}, category={item_data['Категория']}")
-                    continue
-                self.db.cursor.execute("""
-                    INSERT INTO pending_order_items (order_id, name, price, quantity, category)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    order_id,
-                    item_name,
-                    float(item_data['Цена']),
-                    quantity,
-                    item_data['Категория']
-                ))
-            self.db.connection.commit()
-            return True
+            price_list = self.price_list_data.drop_duplicates('Название').set_index('Название')
+            names = list(selected_items)
+            items = price_list.reindex(names)[['Цена', 'Категория']].astype(object)
+            items = items.where(items.notna(), None)
+            rows = zip(names, items['Цена'], selected_items.values(), items['Категория'])
+            result = self.db.create_pending_order(rows, supplier_id, supplier_name, 'Ожидает поступления')
+            if result is None:
+                return False
+            if result['rejected']:
+                print(f"[SKIP] Пропущено позиций без названия, цены или категории: {result['rejected']}")
+            return result['order_id'] is not None
         except Exception as e:
             print(f"Ошибка при добавлении в ожидающие заказы: {e}")
-            self.db.connection.rollback()
             return False
 
 class ColumnMappingDialog(QDialog):
@@ -561,6 +694,8 @@ class PriceListDialog(QDialog):
         self.setWindowTitle("Обработка прайс-листа")
         self.original_file = None
         self.edit_file = None
+        # Разобранный исходный файл: ((путь, mtime), DataFrame)
+        self._original_cache = None
         self.setup_ui()
 
     def setup_ui(self):
@@ -607,35 +742,20 @@ class PriceListDialog(QDialog):
             QMessageBox.warning(self, "Внимание", "Сначала выберите и откройте прайс-лист!")
             return
         try:
-            orig = pd.read_excel(self.original_file)
+            orig = self.original_frame()
             edited = pd.read_excel(self.edit_file)
-            # Сохраняем изменённый DataFrame для диагностики
-            try:
-                edited.to_csv('debug_edited_price_list.csv', index=False, encoding='utf-8-sig')
-                print('DEBUG CSV (edited price list) SAVED!')
-            except Exception as e:
-                print(f'Ошибка при сохранении debug csv: {e}')
-            min_len = min(len(orig), len(edited))
-            orig = orig.iloc[:min_len]
-            edited = edited.iloc[:min_len]
-            changed_rows = []
-            for idx in range(min_len):
-                row_changed = False
-                for col in orig.columns:
-                    if col in edited.columns:
-                        val_orig = orig.iloc[idx][col]
-                        val_edit = edited.iloc[idx][col]
-                        if pd.isnull(val_orig) and pd.isnull(val_edit):
-                            continue
-                        if str(val_orig) != str(val_edit):
-                            row_changed = True
-                            break
-                if row_changed:
-                    changed_rows.append(edited.iloc[idx])
-            if not changed_rows:
+            # Сохраняем изменённый DataFrame для диагностики, если это включено
+            if self.processor.debug_csv:
+                edited.to_csv(self.processor.debug_csv, index=False, encoding='utf-8-sig')
+            diff = diff_price_lists(orig, edited)
+            changed_df = pd.concat([diff['modified'], diff['added']]).sort_index()
+            summary = (f"Изменено строк: {len(diff['modified'])}, добавлено: {len(diff['added'])}, "
+                       f"удалено: {len(diff['removed'])}")
+            print(f"Сравнение прайс-листов по ключу {diff['key']!r}: {summary}")
+            if changed_df.empty:
                 self.changes_label.setText("Изменений не обнаружено. Проверьте, что вы сохранили файл после редактирования.")
                 return
-            changed_df = pd.DataFrame(changed_rows)
+            self.changes_label.setText(summary)
             # Открываем диалог сопоставления колонок
             mapping_dialog = ColumnMappingDialog(changed_df, self, self.original_file)
             if mapping_dialog.exec_() == QDialog.Accepted:
@@ -650,6 +770,13 @@ class PriceListDialog(QDialog):
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сравнить файлы: {e}")
 
+    def original_frame(self):
+        """Исходный прайс-лист; файл разбирается заново, только если он изменился"""
+        stamp = (self.original_file, os.path.getmtime(self.original_file))
+        if self._original_cache is None or self._original_cache[0] != stamp:
+            self._original_cache = (stamp, pd.read_excel(self.original_file))
+        return self._original_cache[1]
+
     def filter_table(self, text):
         if self.df is not None:
             filtered = self.df[self.df.apply(lambda row: row.astype(str).str.contains(text, case=False).any(), axis=1)]
@@ -735,7 +862,7 @@ class PriceListDialog(QDialog):
         if 'Категория' not in df.columns:
             df['Категория'] = 'Без категории'
         self.processor.price_list_data = df
-        if self.processor.add_to_pending_orders(items_for_order, supplier_id):
+        if self.processor.add_to_pending_orders(items_for_order, supplier_id, supplier_name):
             QMessageBox.information(
                 self,
                 "Успех",
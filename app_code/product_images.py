@@ -0,0 +1,175 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageOps
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from app_code.avatar_cache import CACHE_ROOT, MASK_SUPERSAMPLE
+
+PRODUCT_THUMB_DIR = CACHE_ROOT / 'products'
+# Путь к исходнику -> [mtime_ns, sha1 содержимого]
+THUMB_INDEX_FILE = 'index.json'
+THUMB_MEMORY_LIMIT = 300
+THUMB_THREADS = 2
+# Размеры миниатюр, которые использует интерфейс: (ширина, высота, радиус скругления)
+CARD_THUMB = (200, 130, 8)
+CART_THUMB = (120, 90, 0)
+
+
+def render_thumbnail(image_bytes: bytes, width: int, height: int, radius: int) -> bytes:
+    """Миниатюра, вписанная в width×height, со скруглёнными углами, PNG"""
+    image = Image.open(io.BytesIO(image_bytes)).convert('RGBA')
+    image = ImageOps.contain(image, (width, height), Image.LANCZOS)
+    if radius:
+        w, h = image.size
+        mask = Image.new('L', (w * MASK_SUPERSAMPLE, h * MASK_SUPERSAMPLE), 0)
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0) + mask.size, radius * MASK_SUPERSAMPLE, fill=255)
+        alpha = Image.composite(image.getchannel('A'), Image.new('L', (w, h), 0),
+                                mask.resize((w, h), Image.LANCZOS))
+        image.putalpha(alpha)
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+class _ThumbSignals(QObject):
+    # (путь, mtime_ns, ширина, высота, QImage или None)
+    finished = pyqtSignal(str, object, int, int, object)
+
+
+class _ThumbTask(QRunnable):
+    def __init__(self, service, path, mtime, spec):
+        super().__init__()
+        self.service = service
+        self.path = path
+        self.mtime = mtime
+        self.spec = spec
+
+    def run(self):
+        image = None
+        try:
+            image = self.service.load_image(self.path, self.mtime, *self.spec)
+        except Exception as e:
+            print(f"Ошибка при подготовке миниатюры {self.path}: {e}")
+        width, height, _ = self.spec
+        self.service.signals.finished.emit(self.path, self.mtime, width, height, image)
+
+
+class ProductImageService(QObject):
+    """Миниатюры изображений товаров.
+
+    Готовые миниатюры лежат в LRU в памяти (ключ — путь, mtime и размер) и
+    на диске под именем по SHA-1 содержимого исходника: переименованный или
+    скопированный файл не пересчитывается. Индекс путь -> (mtime, SHA-1)
+    позволяет не читать исходник, пока не изменился его mtime. Промах
+    обрабатывается в пуле потоков, результат — сигнал ready(путь, ширина,
+    высота, QPixmap или None, если изображение не открылось).
+    """
+    ready = pyqtSignal(str, int, int, object)
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        """Общий сервис для всех карточек (создаётся после QApplication)"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, cache_dir=PRODUCT_THUMB_DIR, parent=None):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(THUMB_THREADS)
+        self.signals = _ThumbSignals()
+        self.signals.finished.connect(self._on_finished)
+        self._memory = OrderedDict()
+        self._pending = set()
+        self._index_lock = threading.Lock()
+        self._index = self._read_index()
+
+    def get(self, path, spec):
+        """Готовая миниатюра или None; при промахе ставит подготовку в очередь.
+
+        spec — (ширина, высота, радиус), например CARD_THUMB. Для файла,
+        которого нет, сразу возвращается пустой QPixmap.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return QPixmap()
+        width, height, radius = spec
+        key = (path, mtime, width, height)
+        pixmap = self._memory.get(key)
+        if pixmap is not None:
+            self._memory.move_to_end(key)
+            return pixmap
+        if key not in self._pending:
+            self._pending.add(key)
+            self.pool.start(_ThumbTask(self, path, mtime, spec))
+        return None
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    # --- Рабочий поток ---
+
+    def load_image(self, path, mtime, width, height, radius):
+        with self._index_lock:
+            entry = self._index.get(path)
+        digest = entry[1] if entry and entry[0] == mtime else None
+        source = None
+        if digest is None:
+            with open(path, 'rb') as f:
+                source = f.read()
+            digest = hashlib.sha1(source).hexdigest()
+            with self._index_lock:
+                self._index[path] = [mtime, digest]
+                self._write_index()
+        thumb_path = self.cache_dir / f"{digest}_{width}x{height}_r{radius}.png"
+        if thumb_path.exists():
+            image = QImage(str(thumb_path))
+            if not image.isNull():
+                return image
+        if source is None:
+            with open(path, 'rb') as f:
+                source = f.read()
+        png = render_thumbnail(source, width, height, radius)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            thumb_path.write_bytes(png)
+        except OSError as e:
+            print(f"Ошибка при сохранении миниатюры в кэш: {e}")
+        return QImage.fromData(png, 'PNG')
+
+    def _read_index(self):
+        try:
+            with open(self.cache_dir / THUMB_INDEX_FILE, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / (THUMB_INDEX_FILE + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_dir / THUMB_INDEX_FILE)
+        except OSError as e:
+            print(f"Ошибка при сохранении индекса миниатюр: {e}")
+
+    # --- Главный поток ---
+
+    def _on_finished(self, path, mtime, width, height, image):
+        key = (path, mtime, width, height)
+        self._pending.discard(key)
+        pixmap = QPixmap() if image is None or image.isNull() else QPixmap.fromImage(image)
+        self._memory[key] = pixmap
+        self._memory.move_to_end(key)
+        while len(self._memory) > THUMB_MEMORY_LIMIT:
+            self._memory.popitem(last=False)
+        self.ready.emit(path, width, height, pixmap)
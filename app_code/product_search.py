@@ -0,0 +1,116 @@
+from PyQt5.QtCore import QTimer
+
+# Пауза после последнего нажатия клавиши, после которой запускается поиск, мс
+SEARCH_DEBOUNCE_MS = 250
+NGRAM_SIZE = 3
+
+
+def normalize(text):
+    """Приведение к виду, в котором сравниваются названия"""
+    return str(text).lower().replace('ё', 'е')
+
+
+def ngrams(text):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def match_rank(name, query):
+    """Ранг совпадения: полное, с начала названия, с начала слова, в середине"""
+    if name == query:
+        return 0
+    position = name.find(query)
+    if position == 0:
+        return 1
+    if not name[position - 1].isalnum():
+        return 2
+    return 3
+
+
+class ProductSearchIndex:
+    """Индекс названий товаров для поиска по подстроке.
+
+    Ключ — любой хешируемый идентификатор (ID товара, номер строки).
+    Триграммный индекс строится при первом поиске и дальше обновляется
+    точечно через add/remove; запрос короче триграммы проверяется простым
+    проходом. Кандидаты из пересечения триграмм сверяются по подстроке,
+    так что результат совпадает с прежним «строка содержит запрос».
+    """
+
+    def __init__(self, items=()):
+        self.rebuild(items)
+
+    def rebuild(self, items):
+        """items — пары (ключ, название)"""
+        self.names = {key: normalize(name) for key, name in items}
+        self._postings = None
+
+    def add(self, key, name):
+        """Добавляет товар или обновляет его название"""
+        self.remove(key)
+        name = normalize(name)
+        self.names[key] = name
+        if self._postings is not None:
+            for gram in ngrams(name):
+                self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None or self._postings is None:
+            return
+        for gram in ngrams(name):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def _build_postings(self):
+        postings = {}
+        for key, name in self.names.items():
+            for gram in ngrams(name):
+                postings.setdefault(gram, set()).add(key)
+        self._postings = postings
+
+    def matches(self, query):
+        """Множество ключей, в названии которых встречается query"""
+        query = normalize(query)
+        if not query:
+            return set(self.names)
+        if len(query) < NGRAM_SIZE:
+            return {key for key, name in self.names.items() if query in name}
+        if self._postings is None:
+            self._build_postings()
+        lists = sorted((self._postings.get(gram, ()) for gram in ngrams(query)), key=len)
+        if not lists or not lists[0]:
+            return set()
+        candidates = set(lists[0])
+        for keys in lists[1:]:
+            candidates &= keys
+            if not candidates:
+                return candidates
+        return {key for key in candidates if query in self.names[key]}
+
+    def search(self, query, limit=None):
+        """Ключи подходящих товаров, лучшие совпадения первыми"""
+        normalized = normalize(query)
+        if not normalized:
+            keys = list(self.names)
+            return keys[:limit] if limit else keys
+        found = self.matches(query)
+        ranked = sorted(found, key=lambda key: (
+            match_rank(self.names[key], normalized),
+            self.names[key].find(normalized),
+            len(self.names[key]),
+            self.names[key],
+        ))
+        return ranked[:limit] if limit else ranked
+
+
+def connect_debounced(line_edit, slot, delay_ms=SEARCH_DEBOUNCE_MS):
+    """Вызывает slot, когда текст в поле перестал меняться на delay_ms"""
+    timer = QTimer(line_edit)
+    timer.setSingleShot(True)
+    timer.setInterval(delay_ms)
+    timer.timeout.connect(slot)
+    line_edit.textChanged.connect(lambda _text: timer.start())
+    return timer
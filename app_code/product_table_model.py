@@ -0,0 +1,247 @@
+from array import array
+from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QColor
+from app_code.product_search import ProductSearchIndex
+from app_code.database import format_price
+
+PRODUCT_COLUMNS = ["ID", "Название", "Штрихкод", "Закупочная цена", "Розничная цена", "Количество", "Категория"]
+ID_COLUMN, NAME_COLUMN, BARCODE_COLUMN, PURCHASE_COLUMN, RETAIL_COLUMN, QUANTITY_COLUMN, CATEGORY_COLUMN = range(7)
+LOW_STOCK_COLOR = "#ff6b6b"
+
+
+class ProductStore:
+    """Колоночное хранилище товаров для таблицы склада.
+
+    Вместо кортежа на строку и объекта QTableWidgetItem на ячейку каждая
+    колонка хранится отдельным списком или array, категории — кодами.
+    Строки принимаются в порядке колонок PRODUCT_COLUMNS, цены и количество —
+    числами из базы; отсутствующая цена хранится как NaN.
+    """
+
+    def __init__(self, rows=()):
+        self.load(rows)
+
+    def load(self, rows):
+        self.ids = array('q')
+        self.names = []
+        self.names_lower = []
+        self.barcodes = []
+        self.purchase_prices = array('d')
+        self.retail_prices = array('d')
+        self.quantities = array('q')
+        self.category_codes = array('l')
+        self.categories = []
+        category_index = {}
+        for product_id, name, barcode, purchase, retail, quantity, category in rows:
+            name = str(name)
+            self.ids.append(int(product_id))
+            self.names.append(name)
+            self.names_lower.append(name.lower())
+            self.barcodes.append(barcode or "")
+            self.purchase_prices.append(float('nan') if purchase is None else float(purchase))
+            self.retail_prices.append(float('nan') if retail is None else float(retail))
+            self.quantities.append(quantity)
+            category = category or None
+            code = category_index.get(category)
+            if code is None:
+                code = category_index[category] = len(self.categories)
+                self.categories.append(category)
+            self.category_codes.append(code)
+        self.low_stock = bytearray(len(self.ids))
+        # Ключ индекса — номер строки хранилища
+        self.search_index = ProductSearchIndex(enumerate(self.names))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def category(self, row):
+        return self.categories[self.category_codes[row]]
+
+    @staticmethod
+    def price_text(price):
+        return format_price(None if price != price else price)
+
+    def text(self, row, column):
+        """Текст ячейки — так же, как его показывала QTableWidget"""
+        if column == ID_COLUMN:
+            return str(self.ids[row])
+        if column == NAME_COLUMN:
+            return self.names[row]
+        if column == BARCODE_COLUMN:
+            return self.barcodes[row]
+        if column == PURCHASE_COLUMN:
+            return self.price_text(self.purchase_prices[row])
+        if column == RETAIL_COLUMN:
+            return self.price_text(self.retail_prices[row])
+        if column == QUANTITY_COLUMN:
+            return str(self.quantities[row])
+        return str(self.category(row))
+
+    def row(self, row):
+        """Строка товара кортежем в порядке колонок"""
+        return (self.ids[row], self.names[row], self.barcodes[row], self.price_text(self.purchase_prices[row]),
+                self.price_text(self.retail_prices[row]), self.quantities[row], self.category(row))
+
+    def mark_low_stock(self, low_stock_ids):
+        """Признак низкого остатка по набору ID из low_stock_products"""
+        self.low_stock = bytearray(product_id in low_stock_ids for product_id in self.ids)
+
+    def sort_order(self, column, descending=False):
+        """Порядок строк по колонке. Нечисловые цены считаются нулём, как раньше"""
+        if column == NAME_COLUMN:
+            keys = self.names_lower
+        elif column == QUANTITY_COLUMN:
+            keys = self.quantities
+        elif column == PURCHASE_COLUMN:
+            keys = [price if price == price else 0 for price in self.purchase_prices]
+        elif column == RETAIL_COLUMN:
+            keys = [price if price == price else 0 for price in self.retail_prices]
+        elif column == ID_COLUMN:
+            keys = self.ids
+        elif column == CATEGORY_COLUMN:
+            keys = [str(self.categories[code]) for code in self.category_codes]
+        else:
+            keys = self.barcodes
+        return sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+
+    def filter_mask(self, search_text="", category=None):
+        """Маска строк, подходящих под поиск по названию и категорию"""
+        if category is None:
+            category_ok = None
+        else:
+            category_ok = bytearray((cat or "") == category for cat in self.categories)
+        if not search_text and category_ok is None:
+            return bytearray(b'\x01') * len(self)
+        if not search_text:
+            return bytearray(category_ok[code] for code in self.category_codes)
+        mask = bytearray(len(self))
+        for row in self.search_index.matches(search_text):
+            if category_ok is None or category_ok[self.category_codes[row]]:
+                mask[row] = 1
+        return mask
+
+
+class ProductTableModel(QAbstractTableModel):
+    """Модель таблицы товаров склада.
+
+    Данные живут в ProductStore, ячейки формируются только когда их
+    запрашивает представление, то есть для видимой части таблицы.
+    Сортировка выполняется здесь один раз по ключам колонки, строки
+    представлены перестановкой order.
+    """
+    # Название изменено прямо в таблице: (id товара, новое название)
+    name_edited = pyqtSignal(int, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = ProductStore()
+        self.order = array('l')
+        self.sort_key = (NAME_COLUMN, Qt.AscendingOrder)
+        self._low_stock_brush = QColor(LOW_STOCK_COLOR)
+
+    def set_products(self, rows, low_stock_ids=None, sort_column=NAME_COLUMN, order=Qt.AscendingOrder):
+        self.beginResetModel()
+        self.store.load(rows)
+        if low_stock_ids:
+            self.store.mark_low_stock(low_stock_ids)
+        self.order = array('l', self.store.sort_order(sort_column, order == Qt.DescendingOrder))
+        self.sort_key = (sort_column, order)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(PRODUCT_COLUMNS)
+
+    def source_row(self, row):
+        """Номер строки в хранилище для строки модели"""
+        return self.order[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.order[index.row()]
+        column = index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.store.text(row, column)
+        if role == Qt.ToolTipRole and column == NAME_COLUMN:
+            return self.store.names[row]
+        if role == Qt.BackgroundRole and self.store.low_stock[row]:
+            return self._low_stock_brush
+        if role == Qt.TextAlignmentRole and column == NAME_COLUMN:
+            return int(Qt.AlignLeft | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return PRODUCT_COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() == NAME_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid() or index.column() != NAME_COLUMN:
+            return False
+        name = str(value).strip()
+        row = self.order[index.row()]
+        if not name or name == self.store.names[row]:
+            return False
+        self.store.names[row] = name
+        self.store.names_lower[row] = name.lower()
+        self.store.search_index.add(row, name)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole, Qt.ToolTipRole])
+        self.name_edited.emit(self.store.ids[row], name)
+        return True
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self.order = array('l', self.store.sort_order(column, order == Qt.DescendingOrder))
+        self.sort_key = (column, order)
+        self.layoutChanged.emit()
+
+
+class ProductFilterProxyModel(QSortFilterProxyModel):
+    """Фильтр таблицы товаров по названию и категории.
+
+    Маска считается одним проходом по колонкам хранилища, сам
+    filterAcceptsRow лишь читает её. Порядок строк берётся из модели,
+    поэтому собственная сортировка прокси отключена.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.search_text = ""
+        self.category = None
+        self._mask = bytearray()
+
+    def set_filters(self, search_text="", category=None):
+        self.search_text = search_text.lower()
+        self.category = category
+        self.refresh_mask()
+
+    def refresh_mask(self):
+        self._mask = self.sourceModel().store.filter_mask(self.search_text, self.category)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        row = self.sourceModel().order[source_row]
+        # После перезагрузки модели маска ещё старая, пока не вызван refresh_mask
+        return row < len(self._mask) and bool(self._mask[row])
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+    def store_rows(self):
+        """Номера строк хранилища, прошедших фильтр, в порядке отображения"""
+        mask = self._mask
+        return [row for row in self.sourceModel().order if mask[row]]
+
+    def store_row(self, proxy_index):
+        """Номер строки хранилища для индекса представления"""
+        source_index = self.mapToSource(proxy_index)
+        return self.sourceModel().source_row(source_index.row())
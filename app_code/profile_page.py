@@ -9,11 +9,11 @@ from PIL import Image, ImageQt
 from app_code.database import DatabaseManager
 
 class ProfilePage(QWidget):
-    def __init__(self, username, role, parent=None):
+    def __init__(self, username, role, parent=None, db=None):
         super().__init__(parent)
         self.username = username
         self.role = role
-        self.db = DatabaseManager()
+        self.db = db if db is not None else DatabaseManager()
         self.photo_path = None
         self.init_ui()
         self.load_profile()
@@ -0,0 +1,432 @@
+import math
+from datetime import date, datetime, timedelta
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch, Rectangle
+from matplotlib.transforms import IdentityTransform, blended_transform_factory
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import QFrame, QVBoxLayout, QLabel
+
+BACKGROUND_COLOR = '#3c3f56'
+LINE_COLOR = '#43e97b'
+BAR_WIDTH = 0.35
+# Подписей дней на оси X не больше, чем дней в месяце
+MAX_DAY_TICKS = 31
+# Положение скобок месяцев под осью, в координатах осей (0 — низ, 1 — верх)
+BRACKET_Y = -0.08
+BRACKET_TICK = 0.015
+MONTHS_RU = [
+    'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
+]
+
+
+def month_range(year, month):
+    """Первый и последний день месяца"""
+    first = date(year, month, 1)
+    following = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return first, following - timedelta(days=1)
+
+
+def label_period(label):
+    """Период (date_from, date_to) по подписи точки графика или None.
+
+    Понимает форматы get_sales_data_for_period (ДД.ММ.ГГГГ, ГГГГ-НН, ММ.ГГГГ)
+    и ГГГГ-ММ-ДД из ряда по продавцам.
+    """
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            day = datetime.strptime(label, fmt).date()
+            return day, day
+        except ValueError:
+            pass
+    try:
+        if '-' in label:
+            # Неделя ISO, как её выводит TO_CHAR(..., 'IYYY-IW')
+            year, week = map(int, label.split('-'))
+            start = date.fromisocalendar(year, week, 1)
+            return start, start + timedelta(days=6)
+        month, year = map(int, label.split('.'))
+        return month_range(year, month)
+    except ValueError:
+        return None
+
+
+def period_title(date_from, date_to):
+    """Заголовок вида «Период март 2024»"""
+    months = [m.lower() for m in MONTHS_RU]
+    if date_from == date_to:
+        return f"Период {date_from.day} {months[date_from.month - 1]} {date_from.year}"
+    if date_from.year == date_to.year:
+        if date_from.month == date_to.month:
+            return f"Период {months[date_from.month - 1]} {date_from.year}"
+        return f"Период {months[date_from.month - 1]}–{months[date_to.month - 1]} {date_from.year}"
+    return f"Период {months[date_from.month - 1]} {date_from.year} – {months[date_to.month - 1]} {date_to.year}"
+
+
+class SalesChart(QFrame):
+    """График продаж первой страницы аналитики.
+
+    Фигура, холст и художники создаются один раз: при смене периода или
+    данных линии и столбцы обновляются на месте (set_data, set_height),
+    лишние элементы пулов скрываются. Оформление осей задаётся при создании.
+    Подсказка при наведении рисуется блиттингом поверх сохранённого фона,
+    без полной перерисовки фигуры. Клик по точке, сектору или скобке месяца
+    выдаёт сигнал period_selected(date_from, date_to).
+    """
+    period_selected = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("""
+            QFrame {
+                background-color: #3c3f56;
+                border-radius: 10px;
+                padding: 15px;
+            }
+        """)
+        layout = QVBoxLayout(self)
+        title = QLabel("Аналитика продаж")
+        title.setStyleSheet("font-size: 16px; font-weight: bold;")
+        layout.addWidget(title)
+        self.message = QLabel()
+        self.message.setStyleSheet("""
+            QLabel {
+                color: #aaa;
+                font-size: 16px;
+                padding: 20px;
+            }
+        """)
+        self.message.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.message)
+
+        plt.style.use('dark_background')
+        self.fig = Figure(figsize=(18, 6), dpi=100)
+        self.fig.patch.set_facecolor(BACKGROUND_COLOR)
+        self.fig.subplots_adjust(left=0.05, right=0.98, top=0.86, bottom=0.22)
+        self.canvas = FigureCanvas(self.fig)
+        layout.addWidget(self.canvas)
+        self.canvas.hide()
+
+        self.labels = []
+        self.mode = None
+        self._months = []
+        self._legend_key = None
+        self._hover_index = None
+        self._background = None
+        self._create_artists()
+
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.mpl_connect('motion_notify_event', self._on_motion)
+        self.canvas.mpl_connect('figure_leave_event', self._on_leave)
+        self.canvas.mpl_connect('pick_event', self._on_pick)
+        self.canvas.mpl_connect('button_press_event', self._on_click)
+
+    def _create_artists(self):
+        ax = self.ax = self.fig.add_subplot(111)
+        ax.set_facecolor(BACKGROUND_COLOR)
+        ax.tick_params(colors='white')
+        ax.xaxis.label.set_color('white')
+        ax.yaxis.label.set_color('white')
+        ax.title.set_color('white')
+        ax.set_xlabel('Период')
+        ax.set_autoscalex_on(False)
+        ax.margins(y=0.1)
+        self.suptitle = self.fig.suptitle('', fontsize=12, color='white', y=0.98, fontweight='normal')
+
+        self.total_line, = ax.plot([], [], marker='o', label='Количество', color=LINE_COLOR, linewidth=2)
+        self.bar_handle = Patch(color=LINE_COLOR, label='Количество')
+        self.bars = []
+        self.bar_labels = []
+        self.seller_lines = []
+        self.month_labels = []
+
+        # Скобки месяцев: по три отрезка на месяц (линия и две засечки),
+        # X — в координатах данных, Y — в координатах осей
+        below_axes = blended_transform_factory(ax.transData, ax.transAxes)
+        self.brackets = LineCollection([], colors='white', linewidths=2, transform=below_axes,
+                                       clip_on=False, picker=10)
+        ax.add_collection(self.brackets, autolim=False)
+        self.month_separators = LineCollection([], colors='#888', linestyles=':', linewidths=1,
+                                               alpha=0.35, transform=below_axes, zorder=0)
+        ax.add_collection(self.month_separators, autolim=False)
+        self.month_label_transform = below_axes
+
+        self.pie_ax = self.fig.add_axes([0, 0, 1, 1], frameon=False)
+        self.pie_ax.set_visible(False)
+        self.wedges = []
+
+        # Подсказка и маркер рисуются только блиттингом
+        self.hover_marker, = ax.plot([], [], 'o', markersize=10, color='white', animated=True, visible=False)
+        self.hover_text = self.fig.text(0, 0, '', transform=IdentityTransform(), color='#23243a',
+                                        fontsize=10, animated=True, visible=False, zorder=20,
+                                        bbox=dict(boxstyle='round', fc='white', alpha=0.8, lw=0))
+
+    def has_data(self):
+        return not self.canvas.isHidden() and bool(self.labels)
+
+    def show_message(self, text):
+        """Скрывает график и показывает надпись: загрузка, нет данных или ошибка"""
+        self.message.setText(text)
+        self.message.show()
+        self.canvas.hide()
+
+    def set_totals(self, labels, quantities, graph_type, date_from, date_to):
+        """Общие продажи: линия, столбцы или круговая диаграмма"""
+        quantities = np.asarray(quantities)
+        self.labels = list(labels)
+        if graph_type == "Круговой":
+            self.mode = 'pie'
+            self._show_pie(quantities)
+        else:
+            self.mode = 'line' if graph_type == "Линейный" else 'bar'
+            self._show_axes()
+            self.quantities = quantities[:, np.newaxis]
+            self.seller_names = []
+            x = np.arange(len(self.labels))
+            if self.mode == 'line':
+                self.total_line.set_data(x, quantities)
+                self.total_line.set_visible(True)
+                self._set_bars(np.empty(0))
+            else:
+                self.total_line.set_visible(False)
+                self._set_bars(quantities)
+            self._set_sellers([], np.empty((0, 0)))
+            self.ax.set_ylabel('Значение')
+            self._set_legend(('total', self.mode), lambda: self.ax.legend(
+                handles=[self.total_line if self.mode == 'line' else self.bar_handle]))
+            self._set_x_axis(date_from, date_to)
+        title = period_title(date_from, date_to)
+        self.suptitle.set_text(title)
+        prefix = 'Распределение продаж' if self.mode == 'pie' else 'Аналитика продаж'
+        (self.pie_ax if self.mode == 'pie' else self.ax).set_title(f'{prefix} - {title}', color='white')
+        self._redraw()
+
+    def set_sellers(self, labels, names, matrix, date_from, date_to):
+        """Продажи по продавцам: matrix — (дни × продавцы), по линии на столбец"""
+        matrix = np.asarray(matrix)
+        self.labels = list(labels)
+        self.mode = 'sellers'
+        self._show_axes()
+        self.quantities = matrix
+        self.seller_names = list(names)
+        self.total_line.set_visible(False)
+        self._set_bars(np.empty(0))
+        self._set_sellers(self.seller_names, matrix)
+        self.ax.set_ylabel('Количество')
+        self._set_legend(('sellers', tuple(self.seller_names)), lambda: self.ax.legend(
+            handles=self.seller_lines[:len(self.seller_names)], title='Продавец',
+            fontsize=10, title_fontsize=11))
+        self._set_x_axis(date_from, date_to)
+        title = period_title(date_from, date_to)
+        self.suptitle.set_text(title)
+        self.ax.set_title(f'Аналитика продаж - {title}', color='white')
+        self._redraw()
+
+    # --- Обновление художников на месте ---
+
+    def _show_axes(self):
+        self.ax.set_visible(True)
+        self.pie_ax.set_visible(False)
+
+    def _set_bars(self, heights):
+        while len(self.bars) < len(heights):
+            rect = Rectangle((0, 0), BAR_WIDTH, 0, color=LINE_COLOR)
+            self.ax.add_patch(rect)
+            self.bars.append(rect)
+            self.bar_labels.append(self.ax.text(0, 0, '', ha='center', va='bottom', fontsize=10, color=LINE_COLOR))
+        for i, (rect, text) in enumerate(zip(self.bars, self.bar_labels)):
+            visible = i < len(heights)
+            rect.set_visible(visible)
+            text.set_visible(visible)
+            if visible:
+                rect.set_x(i - BAR_WIDTH / 2)
+                rect.set_height(heights[i])
+                text.set_position((i, heights[i]))
+                text.set_text(f'{heights[i]:g}')
+
+    def _set_sellers(self, names, matrix):
+        cmap = plt.get_cmap('tab10', max(len(names), 1))
+        while len(self.seller_lines) < len(names):
+            line, = self.ax.plot([], [], marker='s', linewidth=2)
+            self.seller_lines.append(line)
+        x = np.arange(matrix.shape[0])
+        for idx, line in enumerate(self.seller_lines):
+            visible = idx < len(names)
+            line.set_visible(visible)
+            if visible:
+                line.set_data(x, matrix[:, idx])
+                line.set_color(cmap(idx))
+                line.set_label(names[idx])
+
+    def _set_legend(self, key, build):
+        # Легенда пересоздаётся, только когда меняется её состав
+        if key == self._legend_key:
+            return
+        legend = build()
+        legend.get_frame().set_facecolor(BACKGROUND_COLOR)
+        if legend.get_title():
+            legend.get_title().set_color('white')
+        self._legend_key = key
+
+    def _set_x_axis(self, date_from, date_to):
+        count = len(self.labels)
+        ax = self.ax
+        ax.set_xlim(-0.5, max(count, 1) - 0.5)
+        ax.relim(visible_only=True)
+        ax.autoscale_view(scalex=False)
+        days_count = (date_to - date_from).days + 1
+        show_days = days_count <= MAX_DAY_TICKS or (date_from.year, date_from.month) == (date_to.year, date_to.month)
+        ax.grid(days_count <= MAX_DAY_TICKS, linestyle='--', alpha=0.3)
+        if show_days:
+            step = max(1, math.ceil(count / MAX_DAY_TICKS))
+            ticks = list(range(0, count, step))
+            ax.set_xticks(ticks)
+            ax.set_xticklabels([self._day_label(self.labels[i]) for i in ticks], rotation=90, fontsize=8, color='white')
+            self._set_months([])
+        else:
+            ax.set_xticks([])
+            self._set_months(self._month_spans())
+
+    @staticmethod
+    def _day_label(label):
+        period = label_period(label)
+        return f"{period[0].day:02d} {period[0].year}" if period else label
+
+    def _month_spans(self):
+        spans = {}
+        for i, label in enumerate(self.labels):
+            period = label_period(label)
+            key = (period[0].year, period[0].month) if period else (2000, 1)
+            start, _ = spans.get(key, (i, i))
+            spans[key] = (start, i)
+        return [(year, month, start, end) for (year, month), (start, end) in spans.items()]
+
+    def _set_months(self, spans):
+        segments = []
+        separators = []
+        for year, month, start, end in spans:
+            segments += [
+                [(start, BRACKET_Y), (end, BRACKET_Y)],
+                [(start, BRACKET_Y), (start, BRACKET_Y - BRACKET_TICK)],
+                [(end, BRACKET_Y), (end, BRACKET_Y - BRACKET_TICK)],
+            ]
+            if start:
+                separators.append([(start - 0.5, 0), (start - 0.5, 1)])
+        self.brackets.set_segments(segments)
+        self.month_separators.set_segments(separators)
+        self._months = [(year, month) for year, month, _, _ in spans]
+        while len(self.month_labels) < len(spans):
+            self.month_labels.append(self.ax.text(
+                0, BRACKET_Y, '', ha='center', va='top', color='white', fontsize=10, fontweight='bold',
+                clip_on=False, zorder=10, transform=self.month_label_transform))
+        for i, text in enumerate(self.month_labels):
+            visible = i < len(spans)
+            text.set_visible(visible)
+            if visible:
+                year, month, start, end = spans[i]
+                text.set_position(((start + end) / 2, BRACKET_Y - 0.02))
+                text.set_text(MONTHS_RU[month - 1])
+
+    def _show_pie(self, quantities):
+        # Число секторов меняется вместе с периодом, поэтому пересоздаются
+        # только они; холст и фигура остаются прежними
+        self.ax.set_visible(False)
+        self.pie_ax.set_visible(True)
+        self.pie_ax.clear()
+        self._set_months([])
+        self.wedges, _, _ = self.pie_ax.pie(
+            quantities, labels=self.labels, autopct='%1.1f%%', startangle=140,
+            colors=plt.cm.viridis(np.linspace(0, 1, len(self.labels))))
+        for wedge in self.wedges:
+            wedge.set_picker(True)
+        self.quantities = quantities[:, np.newaxis]
+        self.seller_names = []
+
+    def _redraw(self):
+        self._hover_index = None
+        self.hover_marker.set_visible(False)
+        self.hover_text.set_visible(False)
+        self.message.hide()
+        self.canvas.show()
+        self.canvas.draw_idle()
+
+    # --- Подсказка при наведении (блиттинг) ---
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._blit_hover()
+
+    def _blit_hover(self):
+        if self._background is None:
+            return
+        self.canvas.restore_region(self._background)
+        self.fig.draw_artist(self.hover_marker)
+        self.fig.draw_artist(self.hover_text)
+        self.canvas.blit(self.fig.bbox)
+
+    def _hovered_index(self, event):
+        if self.mode == 'pie':
+            for i, wedge in enumerate(self.wedges):
+                if wedge.contains(event)[0]:
+                    return i
+            return None
+        if event.inaxes is not self.ax or event.xdata is None:
+            return None
+        index = int(round(event.xdata))
+        return index if 0 <= index < len(self.labels) else None
+
+    def _on_motion(self, event):
+        index = self._hovered_index(event)
+        if index == self._hover_index:
+            if index is not None:
+                self.hover_text.set_position((event.x + 12, event.y + 12))
+                self._blit_hover()
+            return
+        self._hover_index = index
+        if index is None:
+            self.hover_marker.set_visible(False)
+            self.hover_text.set_visible(False)
+        else:
+            values = self.quantities[index]
+            if self.mode == 'sellers':
+                lines = [f"{name}: {value:g}" for name, value in zip(self.seller_names, values)]
+                self.hover_marker.set_visible(False)
+            else:
+                lines = [f"Количество: {values[0]:g}"]
+                self.hover_marker.set_data([index], [values[0]])
+                self.hover_marker.set_visible(self.mode != 'pie')
+            self.hover_text.set_text('\n'.join([self.labels[index]] + lines))
+            self.hover_text.set_position((event.x + 12, event.y + 12))
+            self.hover_text.set_visible(True)
+        self._blit_hover()
+
+    def _on_leave(self, event):
+        if self._hover_index is not None:
+            self._hover_index = None
+            self.hover_marker.set_visible(False)
+            self.hover_text.set_visible(False)
+            self._blit_hover()
+
+    # --- Переход к более детальному периоду ---
+
+    def _on_pick(self, event):
+        if event.artist is self.brackets and len(event.ind):
+            year, month = self._months[event.ind[0] // 3]
+            self.period_selected.emit(*month_range(year, month))
+        elif self.mode == 'pie' and event.artist in self.wedges:
+            self._select_label(self.wedges.index(event.artist))
+
+    def _on_click(self, event):
+        if self.mode != 'pie' and event.inaxes is self.ax:
+            index = self._hovered_index(event)
+            if index is not None:
+                self._select_label(index)
+
+    def _select_label(self, index):
+        period = label_period(self.labels[index])
+        if period:
+            self.period_selected.emit(*period)
@@ -230,22 +230,17 @@ class SalesHistoryPage(QWidget):
         total_qty = 0
         total_price = 0.0
         total_profit = 0.0
-        products = {p['name']: p for p in self.db.get_all_products()}
         missing_purchase = set()
         for sale in history:
             qty = int(sale['quantity'])
             total_qty += qty
             price = float(sale['sale_price']) if sale.get('sale_price') else 0.0
             total_price += price * qty
-            prod = products.get(sale['product_name'])
-            if prod and prod.get('purchase_price') not in (None, '', 'None'):
-                try:
-                    purchase = float(prod['purchase_price'])
-                    total_profit += (price - purchase) * qty
-                except Exception:
-                    missing_purchase.add(sale['product_name'])
-            else:
+            # Закупочная цена — снимок на момент продажи
+            if sale['purchase_missing']:
                 missing_purchase.add(sale['product_name'])
+            else:
+                total_profit += price * qty - float(sale['purchase_total'])
         # --- Блок с итогами ---
         summary_layout = QHBoxLayout()
         summary_lbl = QLabel(f"<b>Всего продано:</b> {total_qty} шт.   <b>На сумму:</b> {total_price:.2f} ₽")
@@ -322,6 +317,6 @@ class SalesHistoryPage(QWidget):
     def clear_history(self):
         reply = QMessageBox.question(self, "Очистить историю", "Вы уверены, что хотите удалить всю историю продаж?", QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            self.db.cursor.execute("DELETE FROM sales_history WHERE username = %s", (self.username,))
-            self.db.connection.commit()
+            with self.db.transaction() as cur:
+                cur.execute("DELETE FROM sales_history WHERE username = %s", (self.username,))
             self.load_history() 
\ No newline at end of file
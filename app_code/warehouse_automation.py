@@ -30,45 +30,48 @@ class WarehouseAutomation(QObject):
         with open('warehouse_automation_settings.json', 'w', encoding='utf-8') as f:
             json.dump(self.settings, f, ensure_ascii=False, indent=2)
 
+    def check_stock_levels(self):
+        """Сообщает о товарах, которые попали в набор с низким остатком после прошлой проверки"""
+        for product in self.db.take_low_stock_notifications():
+            self.low_stock_alert.emit(product['name'], product['quantity'])
+
     def log_order_request(self, product_name, order_quantity, min_quantity):
         """Логирование запроса на заказ"""
         try:
-            self.db.cursor.execute("""
-                INSERT INTO changes_log (action, details, timestamp)
-                VALUES (%s, %s, %s)
-            """, (
-                'order_request',
-                json.dumps({
-                    'product': product_name,
-                    'order_quantity': order_quantity,
-                    'min_quantity': min_quantity
-                }),
-                datetime.now()
-            ))
-            self.db.connection.commit()
+            with self.db.transaction() as cur:
+                cur.execute("""
+                    INSERT INTO changes_log (action, details, timestamp)
+                    VALUES (%s, %s, %s)
+                """, (
+                    'order_request',
+                    json.dumps({
+                        'product': product_name,
+                        'order_quantity': order_quantity,
+                        'min_quantity': min_quantity
+                    }),
+                    datetime.now()
+                ))
         except Exception as e:
             print(f"Ошибка при логировании заказа: {e}")
-            self.db.connection.rollback()
 
     def log_statistics_update(self, stats):
         """Логирование обновления статистики"""
         try:
-            self.db.cursor.execute("""
-                INSERT INTO changes_log (action, details, timestamp)
-                VALUES (%s, %s, %s)
-            """, (
-                'statistics_update',
-                json.dumps({
-                    'total_products': stats[0],
-                    'total_quantity': stats[1],
-                    'low_stock_count': stats[2]
-                }),
-                datetime.now()
-            ))
-            self.db.connection.commit()
+            with self.db.transaction() as cur:
+                cur.execute("""
+                    INSERT INTO changes_log (action, details, timestamp)
+                    VALUES (%s, %s, %s)
+                """, (
+                    'statistics_update',
+                    json.dumps({
+                        'total_products': stats[0],
+                        'total_quantity': stats[1],
+                        'low_stock_count': stats[2]
+                    }),
+                    datetime.now()
+                ))
         except Exception as e:
             print(f"Ошибка при логировании статистики: {e}")
-            self.db.connection.rollback()
 
     # Оставляем только ручные методы, если нужны
     # def manual_check_stock_levels(self): ...
@@ -3,16 +3,31 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QTableWidgetItem, QHeaderView, QMessageBox, QDialog,
                             QLineEdit, QFormLayout, QSpinBox, QComboBox, QCheckBox,
                             QMenu, QAction, QListWidget, QListWidgetItem, QInputDialog,
-                            QSizePolicy)
+                            QSizePolicy, QTableView)
 from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QColor, QFont
+from PyQt5.QtGui import QFont
 import datetime
 from app_code.warehouse_automation import WarehouseAutomation
+from app_code.database import DEFAULT_CATEGORY, parse_price
+from app_code.product_search import connect_debounced
+from app_code.product_table_model import (ProductTableModel, ProductFilterProxyModel, NAME_COLUMN,
+                                          PURCHASE_COLUMN, RETAIL_COLUMN, QUANTITY_COLUMN)
 from app_code.price_list_processor import PriceListDialog, ColumnMappingDialog
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.styles import Font, Alignment, Border, Side
 
+# Высота строки таблицы товаров: две строки названия с отступами
+PRODUCT_ROW_HEIGHT = 64
+
+# Пункт сортировки -> (колонка, направление)
+SORT_OPTIONS = {
+    "По названию": (NAME_COLUMN, Qt.AscendingOrder),
+    "По количеству": (QUANTITY_COLUMN, Qt.DescendingOrder),
+    "По розничной цене": (RETAIL_COLUMN, Qt.DescendingOrder),
+    "По закупочной цене": (PURCHASE_COLUMN, Qt.DescendingOrder),
+}
+
 class AddProductDialog(QDialog):
     def __init__(self, db, parent=None):
         super().__init__(parent)
@@ -108,8 +123,9 @@ class AddProductDialog(QDialog):
         layout.addRow(buttons_layout)
 
     def load_categories(self):
-        self.db.cursor.execute("SELECT name FROM categories")
-        categories = self.db.cursor.fetchall()
+        with self.db.transaction() as cur:
+            cur.execute("SELECT name FROM categories")
+            categories = cur.fetchall()
         self.category_combo.addItems([cat[0] for cat in categories])
 
     def get_product_data(self):
@@ -118,7 +134,7 @@ class AddProductDialog(QDialog):
             'purchase_price': self.purchase_price_input.text(),
             'retail_price': self.retail_price_input.text(),
             'price': self.price_input.text(),
-            'quantity': str(self.quantity_input.value()),
+            'quantity': self.quantity_input.value(),
             'barcode': self.barcode_input.text(),
             'category': self.category_combo.currentText()
         }
@@ -349,8 +365,9 @@ class SupplierSelectDialog(QDialog):
         layout.addLayout(btns)
 
     def load_suppliers(self):
-        self.db.cursor.execute("SELECT id, name FROM suppliers ORDER BY name")
-        self.suppliers = self.db.cursor.fetchall()
+        with self.db.transaction() as cur:
+            cur.execute("SELECT id, name FROM suppliers ORDER BY name")
+            self.suppliers = cur.fetchall()
         for sid, name in self.suppliers:
             self.supplier_combo.addItem(name, sid)
 
@@ -389,7 +406,7 @@ class WarehousePage(QWidget):
                 border: 1.5px solid #3fa996;
                 box-shadow: 0 4px 32px 0 rgba(63,169,150,0.10);
             }
-            QTableWidget {
+            QTableWidget, QTableView {
                 background-color: #23243a;
                 color: #f3f3f3;
                 border-radius: 18px;
@@ -401,18 +418,18 @@ class WarehousePage(QWidget):
                 box-shadow: 0 4px 24px 0 rgba(63,169,150,0.08);
                 font-size: 17px;
             }
-            QTableWidget::item {
+            QTableWidget::item, QTableView::item {
                 padding: 14px 12px;
                 border-radius: 12px;
                 font-size: 17px;
                 transition: background 0.2s;
             }
-            QTableWidget::item:selected {
+            QTableWidget::item:selected, QTableView::item:selected {
                 background-color: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #3fa996, stop:1 #2d7a6a);
                 color: #23243a;
                 font-weight: bold;
             }
-            QTableWidget::item:hover {
+            QTableWidget::item:hover, QTableView::item:hover {
                 background-color: #3c3f56;
                 transition: background 0.2s;
             }
@@ -552,7 +569,7 @@ class WarehousePage(QWidget):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("🔍 Поиск по названию...")
         self.search_input.setFixedWidth(260)
-        self.search_input.textChanged.connect(self.apply_filters)
+        connect_debounced(self.search_input, self.apply_filters)
         filter_layout.addWidget(self.search_input)
         # Сортировка
         self.sort_combo = QComboBox()
@@ -669,12 +686,14 @@ class WarehousePage(QWidget):
         buttons_row2.addStretch()
         layout.addLayout(buttons_row2)
 
-        # Только таблица товаров
-        self.products_table = QTableWidget()
-        self.products_table.setColumnCount(7)
-        self.products_table.setHorizontalHeaderLabels([
-            "ID", "Название", "Штрихкод", "Закупочная цена", "Розничная цена", "Количество", "Категория"
-        ])
+        # Только таблица товаров: модель хранит данные по колонкам,
+        # представление запрашивает только видимые ячейки
+        self.products_model = ProductTableModel(self)
+        self.products_model.name_edited.connect(self.rename_product)
+        self.products_proxy = ProductFilterProxyModel(self)
+        self.products_proxy.setSourceModel(self.products_model)
+        self.products_table = QTableView()
+        self.products_table.setModel(self.products_proxy)
         header = self.products_table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.ResizeToContents)  # ID
         header.setSectionResizeMode(1, QHeaderView.Stretch)           # Название
@@ -683,23 +702,42 @@ class WarehousePage(QWidget):
         header.setSectionResizeMode(4, QHeaderView.ResizeToContents) # Розничная цена
         header.setSectionResizeMode(5, QHeaderView.ResizeToContents) # Количество
         header.setSectionResizeMode(6, QHeaderView.ResizeToContents) # Категория
-        self.products_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.products_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        # Одинаковая высота строк вместо resizeRowsToContents по всей таблице
+        self.products_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.products_table.verticalHeader().setDefaultSectionSize(PRODUCT_ROW_HEIGHT)
+        self.products_table.setWordWrap(True)
+        self.products_table.setSelectionBehavior(QTableView.SelectRows)
+        self.products_table.setEditTriggers(QTableView.NoEditTriggers)
         self.products_table.setAlternatingRowColors(True)
         layout.addWidget(self.products_table)
 
+        # Таблица заказов у поставщика, показывается вместо таблицы товаров
+        self.orders_table = QTableWidget()
+        self.orders_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.orders_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.orders_table.setAlternatingRowColors(True)
+        self.orders_table.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.orders_table.customContextMenuRequested.connect(self.open_order_context_menu)
+        self.orders_table.hide()
+        layout.addWidget(self.orders_table)
+
     def load_products(self):
         try:
-            self.db.cursor.execute("""
-                SELECT id, name, barcode, purchase_price, retail_price, quantity, category 
-                FROM products 
-                ORDER BY name
-            """)
-            products = self.db.cursor.fetchall()
-            self.all_products = products  # Сохраняем все товары для фильтрации
-            # Загружаем категории для фильтра
-            self.db.cursor.execute("SELECT name FROM categories ORDER BY name")
-            categories = [row[0] for row in self.db.cursor.fetchall()]
+            with self.db.transaction() as cur:
+                cur.execute("""
+                    SELECT id, name, barcode, purchase_price, retail_price, quantity, category 
+                    FROM products 
+                    ORDER BY name
+                """)
+                products = cur.fetchall()
+                # Подсветка — по готовому набору товаров с низким остатком
+                cur.execute("SELECT product_id FROM low_stock_products")
+                low_stock_ids = {row[0] for row in cur.fetchall()}
+                # Загружаем категории для фильтра
+                cur.execute("SELECT name FROM categories ORDER BY name")
+                categories = [row[0] for row in cur.fetchall()]
+            sort_column, sort_order = self.current_sort()
+            self.products_model.set_products(products, low_stock_ids, sort_column, sort_order)
             self.category_combo.blockSignals(True)
             self.category_combo.clear()
             self.category_combo.addItem("Все категории")
@@ -707,70 +745,35 @@ class WarehousePage(QWidget):
                 self.category_combo.addItem(cat)
             self.category_combo.blockSignals(False)
             self.apply_filters()
+            self.automation.check_stock_levels()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить товары: {str(e)}")
 
+    def current_sort(self):
+        """Колонка и направление сортировки по выбранному пункту"""
+        return SORT_OPTIONS.get(self.sort_combo.currentText(), (NAME_COLUMN, Qt.AscendingOrder))
+
     def apply_filters(self):
-        # Фильтрация
-        search_text = self.search_input.text().lower()
+        # Фильтрация и сортировка выполняются моделью и прокси без пересоздания ячеек
+        sort = self.current_sort()
+        if sort != self.products_model.sort_key:
+            self.products_proxy.sort(*sort)
         selected_category = self.category_combo.currentText()
-        filtered = []
-        for product in getattr(self, 'all_products', []):
-            name = str(product[1]).lower()
-            category = str(product[6]) if product[6] else ""
-            if search_text and search_text not in name:
-                continue
-            if selected_category != "Все категории" and category != selected_category:
-                continue
-            filtered.append(product)
-        # Сортировка
-        sort_option = self.sort_combo.currentText()
-        if sort_option == "По названию":
-            filtered.sort(key=lambda x: str(x[1]).lower())
-        elif sort_option == "По количеству":
-            filtered.sort(key=lambda x: int(x[5]), reverse=True)
-        elif sort_option == "По розничной цене":
-            def safe_float(val):
-                try: return float(val)
-                except: return 0
-            filtered.sort(key=lambda x: safe_float(x[4]), reverse=True)
-        elif sort_option == "По закупочной цене":
-            def safe_float(val):
-                try: return float(val)
-                except: return 0
-            filtered.sort(key=lambda x: safe_float(x[3]), reverse=True)
-        # Обновляем таблицу
-        self.products_table.setRowCount(len(filtered))
-        for row, product in enumerate(filtered):
-            for col, value in enumerate(product):
-                item = QTableWidgetItem(str(value))
-                if col == 1:
-                    item.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-                    item.setFlags(item.flags() | Qt.ItemIsEditable)
-                    item.setData(Qt.TextWordWrap, True)
-                    item.setToolTip(str(value))
-                self.products_table.setItem(row, col, item)
-            # Проверка на низкий остаток
-            quantity = int(product[5])
-            self.db.cursor.execute("""
-                SELECT min_quantity FROM category_min_quantities 
-                WHERE category = %s
-            """, (product[6],))
-            min_quantity = self.db.cursor.fetchone()
-            if min_quantity and quantity <= min_quantity[0]:
-                for col in range(self.products_table.columnCount()):
-                    self.products_table.item(row, col).setBackground(QColor("#ff6b6b"))
-        self.products_table.resizeRowsToContents()
+        self.products_proxy.set_filters(
+            self.search_input.text(),
+            None if selected_category in ("", "Все категории") else selected_category
+        )
         # --- Новый блок: обновление информации ---
-        self.update_info_block(filtered)
+        self.update_info_block(self.products_proxy.store_rows())
 
     def update_info_block(self, filtered):
         if not filtered:
             self.info_label.setText("Нет товаров по выбранным фильтрам.")
             return
+        store = self.products_model.store
         total_products = len(filtered)
-        total_qty = sum(int(row[5]) for row in filtered)
-        prices = [float(row[4]) for row in filtered if row[4] not in (None, '', 'None')]
+        total_qty = sum(store.quantities[row] for row in filtered)
+        prices = [store.retail_prices[row] for row in filtered if store.retail_prices[row] == store.retail_prices[row]]
         if prices:
             avg_price = sum(prices) / len(prices)
             min_price = min(prices)
@@ -782,96 +785,88 @@ class WarehousePage(QWidget):
             f"Товаров: <b>{total_products}</b> | Всего на складе: <b>{total_qty}</b> | {price_info}"
         )
 
+    def selected_product(self):
+        """Выбранный товар кортежем (id, название, штрихкод, закуп. цена, розн. цена, количество, категория)"""
+        rows = self.products_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.products_model.store.row(self.products_proxy.store_row(rows[0]))
+
+    def rename_product(self, product_id, name):
+        """Сохраняет название, изменённое прямо в таблице"""
+        try:
+            with self.db.transaction() as cur:
+                cur.execute("UPDATE products SET name = %s WHERE id = %s", (name, product_id))
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось переименовать товар: {str(e)}")
+            self.load_products()
+
     def add_product(self):
         dialog = AddProductDialog(self.db, self)
         if dialog.exec_() == QDialog.Accepted:
             product_data = dialog.get_product_data()
-            try:
-                self.db.cursor.execute("""
-                    INSERT INTO products (name, price, quantity, barcode, category, purchase_price, retail_price)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
-                """, (
-                    product_data['name'],
-                    product_data['price'],
-                    product_data['quantity'],
-                    product_data['barcode'],
-                    product_data['category'],
-                    product_data['purchase_price'],
-                    product_data['retail_price']
-                ))
-                product_id = self.db.cursor.fetchone()[0]
-                # Записываем движение товара
-                self.db.add_product_movement(
-                    product_id=product_id,
-                    movement_type='IN',
-                    quantity=int(product_data['quantity']),
-                    username=self.username,
-                    comment=f'Первоначальное поступление товара'
-                )
-                self.db.connection.commit()
+            # Товар и запись о поступлении добавляются одной транзакцией в DatabaseManager
+            if self.db.add_product(product_data, self.username):
                 self.load_products()
                 QMessageBox.information(self, "Успех", "Товар успешно добавлен")
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, "Ошибка", f"Не удалось добавить товар: {str(e)}")
+            else:
+                QMessageBox.critical(self, "Ошибка", "Не удалось добавить товар (возможно, такое название уже есть)")
 
     def edit_product(self):
-        selected_rows = self.products_table.selectedItems()
-        if not selected_rows:
+        product = self.selected_product()
+        if product is None:
             QMessageBox.warning(self, "Предупреждение", "Выберите товар для редактирования")
             return
-        row = selected_rows[0].row()
-        product_id = int(self.products_table.item(row, 0).text())
-        old_quantity = int(self.products_table.item(row, 5).text())
+        product_id = product[0]
+        old_quantity = product[5]
         dialog = AddProductDialog(self.db, self)
-        dialog.name_input.setText(self.products_table.item(row, 1).text())
-        dialog.purchase_price_input.setText(self.products_table.item(row, 3).text())
-        dialog.retail_price_input.setText(self.products_table.item(row, 4).text())
+        dialog.name_input.setText(product[1])
+        dialog.purchase_price_input.setText(product[3])
+        dialog.retail_price_input.setText(product[4])
         dialog.quantity_input.setValue(old_quantity)
-        dialog.category_combo.setCurrentText(self.products_table.item(row, 6).text())
+        dialog.category_combo.setCurrentText(str(product[6]))
         if dialog.exec_() == QDialog.Accepted:
             product_data = dialog.get_product_data()
             try:
-                new_quantity = int(product_data['quantity'])
+                new_quantity = product_data['quantity']
                 quantity_diff = new_quantity - old_quantity
-                self.db.cursor.execute("""
-                    UPDATE products 
-                    SET name = %s, purchase_price = %s, retail_price = %s, quantity = %s, barcode = %s, category = %s
-                    WHERE id = %s
-                """, (
-                    product_data['name'],
-                    product_data['purchase_price'],
-                    product_data['retail_price'],
-                    product_data['quantity'],
-                    product_data['barcode'],
-                    product_data['category'],
-                    product_id
-                ))
-                if quantity_diff != 0:
-                    self.db.add_product_movement(
+                with self.db.transaction() as cur:
+                    cur.execute("""
+                        UPDATE products 
+                        SET name = %s, purchase_price = %s, retail_price = %s, quantity = %s, barcode = %s, category = %s
+                        WHERE id = %s
+                    """, (
+                        product_data['name'],
+                        parse_price(product_data['purchase_price']),
+                        parse_price(product_data['retail_price']),
+                        new_quantity,
+                        product_data['barcode'],
+                        product_data['category'],
+                        product_id
+                    ))
+                    if quantity_diff != 0 and not self.db.add_product_movement(
                         product_id=product_id,
                         movement_type='IN' if quantity_diff > 0 else 'OUT',
                         quantity=abs(quantity_diff),
                         username=self.username,
                         comment=f'Ручное изменение количества с {old_quantity} на {new_quantity}'
-                    )
-                self.db.connection.commit()
+                    ):
+                        # Без записи о движении изменение товара откатывается целиком
+                        raise RuntimeError("не удалось записать движение товара")
                 self.load_products()
                 QMessageBox.information(self, "Успех", "Товар успешно обновлен")
             except Exception as e:
-                self.db.connection.rollback()
                 QMessageBox.critical(self, "Ошибка", f"Не удалось обновить товар: {str(e)}")
 
     def delete_product(self):
-        selected_rows = self.products_table.selectedItems()
-        if not selected_rows:
+        product = self.selected_product()
+        if product is None:
             QMessageBox.warning(self, "Предупреждение", "Выберите товар для удаления")
             return
         
-        row = selected_rows[0].row()
-        product_id = int(self.products_table.item(row, 0).text())
-        product_name = self.products_table.item(row, 1).text()
-        current_quantity = int(self.products_table.item(row, 5).text())
+        product_id = product[0]
+        product_name = product[1]
+        current_quantity = product[5]
         
         reply = QMessageBox.question(
             self, 
@@ -883,21 +878,20 @@ class WarehousePage(QWidget):
         if reply == QMessageBox.Yes:
             try:
                 # Записываем списание всего количества
-                if current_quantity > 0:
-                    self.db.add_product_movement(
-                        product_id=product_id,
-                        movement_type='OUT',
-                        quantity=current_quantity,
-                        username=self.username,
-                        comment='Списание при удалении товара'
-                    )
+                with self.db.transaction() as cur:
+                    if current_quantity > 0:
+                        self.db.add_product_movement(
+                            product_id=product_id,
+                            movement_type='OUT',
+                            quantity=current_quantity,
+                            username=self.username,
+                            comment='Списание при удалении товара'
+                        )
                 
-                self.db.cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
-                self.db.connection.commit()
+                    cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
                 self.load_products()
                 QMessageBox.information(self, "Успех", "Товар успешно удален")
             except Exception as e:
-                self.db.connection.rollback()
                 QMessageBox.critical(self, "Ошибка", f"Не удалось удалить товар: {str(e)}")
 
     def show_automation_settings(self):
@@ -946,30 +940,33 @@ class WarehousePage(QWidget):
         self.add_button.hide()
         self.edit_button.hide()
         self.delete_button.hide()
-        self.products_table.setColumnCount(5)
-        self.products_table.setHorizontalHeaderLabels([
+        self.products_table.hide()
+        self.orders_table.show()
+        self.orders_table.setColumnCount(5)
+        self.orders_table.setHorizontalHeaderLabels([
             "ID заказа", "Поставщик", "Количество", "Сумма заказа", "Статус"
         ])
         # --- Stretch только для колонки 'Поставщик' ---
-        header = self.products_table.horizontalHeader()
+        header = self.orders_table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.ResizeToContents)  # ID заказа
         header.setSectionResizeMode(1, QHeaderView.Stretch)           # Поставщик
         header.setSectionResizeMode(2, QHeaderView.ResizeToContents)  # Количество
         header.setSectionResizeMode(3, QHeaderView.ResizeToContents)  # Сумма заказа
         header.setSectionResizeMode(4, QHeaderView.ResizeToContents)  # Статус
-        self.db.cursor.execute("""
-            SELECT po.id, s.name, 
-                   COALESCE(SUM(poi.quantity), 0) as total_qty, 
-                   COALESCE(SUM(poi.quantity * poi.price), 0) as total_sum,
-                   po.status
-            FROM pending_orders po
-            LEFT JOIN suppliers s ON po.supplier = s.id
-            LEFT JOIN pending_order_items poi ON poi.order_id = po.id
-            GROUP BY po.id, s.name, po.status
-            ORDER BY po.id DESC
-        """)
-        orders = self.db.cursor.fetchall()
-        self.products_table.setRowCount(len(orders))
+        with self.db.transaction() as cur:
+            cur.execute("""
+                SELECT po.id, s.name, 
+                       COALESCE(SUM(poi.quantity), 0) as total_qty, 
+                       COALESCE(SUM(poi.quantity * poi.price), 0) as total_sum,
+                       po.status
+                FROM pending_orders po
+                LEFT JOIN suppliers s ON po.supplier = s.id
+                LEFT JOIN pending_order_items poi ON poi.order_id = po.id
+                GROUP BY po.id, s.name, po.status
+                ORDER BY po.id DESC
+            """)
+            orders = cur.fetchall()
+        self.orders_table.setRowCount(len(orders))
         for row, order in enumerate(orders):
             for col, value in enumerate(order):
                 item = QTableWidgetItem(str(value))
@@ -978,12 +975,9 @@ class WarehousePage(QWidget):
                     item.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
                     item.setData(Qt.TextWordWrap, True)
                     item.setToolTip(str(value))
-                self.products_table.setItem(row, col, item)
+                self.orders_table.setItem(row, col, item)
         # --- Новое: подгоняем высоту строк под содержимое ---
-        self.products_table.resizeRowsToContents()
-        # Подключаем обработчик правой кнопки мыши
-        self.products_table.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.products_table.customContextMenuRequested.connect(self.open_order_context_menu)
+        self.orders_table.resizeRowsToContents()
 
         # Добавляем кнопку "Отметить поступление" под таблицей
         if not hasattr(self, 'mark_received_btn'):
@@ -995,28 +989,29 @@ class WarehousePage(QWidget):
             self.mark_received_btn.show()
 
     def open_order_context_menu(self, position):
-        indexes = self.products_table.selectedIndexes()
+        indexes = self.orders_table.selectedIndexes()
         if not indexes:
             return
-        row = self.products_table.rowAt(position.y())
+        row = self.orders_table.rowAt(position.y())
         if row < 0:
             return
         menu = QMenu()
         info_action = QAction("Просмотреть информацию", self)
         menu.addAction(info_action)
-        action = menu.exec_(self.products_table.viewport().mapToGlobal(position))
+        action = menu.exec_(self.orders_table.viewport().mapToGlobal(position))
         if action == info_action:
-            order_id = self.products_table.item(row, 0).text()
+            order_id = self.orders_table.item(row, 0).text()
             self.show_order_details(order_id)
 
     def show_order_details(self, order_id):
         # Получаем товары по заказу
-        self.db.cursor.execute("""
-            SELECT name, price, quantity
-            FROM pending_order_items
-            WHERE order_id = %s
-        """, (order_id,))
-        items = self.db.cursor.fetchall()
+        with self.db.transaction() as cur:
+            cur.execute("""
+                SELECT name, price, quantity
+                FROM pending_order_items
+                WHERE order_id = %s
+            """, (order_id,))
+            items = cur.fetchall()
         # Формируем текст для отображения
         details = ""
         for item in items:
@@ -1027,10 +1022,8 @@ class WarehousePage(QWidget):
 
     def show_products_table(self):
         # Возвращаем таблицу товаров
-        self.products_table.setColumnCount(7)
-        self.products_table.setHorizontalHeaderLabels([
-            "ID", "Название", "Штрихкод", "Закупочная цена", "Розничная цена", "Количество", "Категория"
-        ])
+        self.orders_table.hide()
+        self.products_table.show()
         # Показываем кнопки управления товарами
         self.add_button.show()
         self.edit_button.show()
@@ -1087,6 +1080,7 @@ class WarehousePage(QWidget):
             name_col = None
             price_col = None
             qty_col = None
+            category_col = None
             for col, mapped in col_map.items():
                 if mapped == "Название":
                     name_col = col
@@ -1094,149 +1088,60 @@ class WarehousePage(QWidget):
                     price_col = col
                 elif mapped == "Количество":
                     qty_col = col
+                elif mapped == "Категория":
+                    category_col = col
             if not name_col or not price_col:
                 QMessageBox.warning(self, "Ошибка", "Не выбраны все обязательные поля (Название, Цена)!")
                 return
-            try:
-                # 3.1. Считаем сумму заказа и общее количество
-                total_sum = 0
-                total_qty = 0
-                print("\n=== ОТЛАДКА ИМПОРТА ЗАКАЗА ===")
-                print("Столбцы DataFrame:", list(dialog.df.columns))
-                print("Сопоставление:", col_map)
-                # Проверяем, что выбранные столбцы существуют
-                if name_col not in dialog.df.columns or price_col not in dialog.df.columns or (qty_col and qty_col not in dialog.df.columns):
-                    print(f"[ОШИБКА] Не найден столбец: name_col={name_col}, price_col={price_col}, qty_col={qty_col}")
-                    QMessageBox.critical(self, "Ошибка", "Проверьте сопоставление колонок! Возможно, выбран пустой или несуществующий столбец.")
-                    return
-                for idx, row in dialog.df.iterrows():
-                    print(f"Строка {idx}: {row.to_dict()}")
-                    try:
-                        name = str(row[name_col])
-                    except Exception:
-                        print(f"[ОШИБКА] Не найден столбец: {name_col} в строке {row.to_dict()}")
-                        QMessageBox.critical(self, "Ошибка", f"Проверьте сопоставление колонок! Не найден столбец: {name_col}")
-                        return
-                    try:
-                        price = float(row[price_col])
-                    except Exception:
-                        price = 0.0
-                    qty = 1
-                    if qty_col:
-                        try:
-                            qty = int(float(row[qty_col]))
-                        except Exception:
-                            qty = 1
-                    if price > 0 and qty > 0:
-                        total_sum += price * qty
-                        total_qty += qty
-                print(f"Итого: total_sum={total_sum}, total_qty={total_qty}")
-                # 3.2. Добавляем заказ (шапку)
-                self.db.cursor.execute("""
-                    INSERT INTO pending_orders (name, supplier, price, quantity, order_date, status)
-                    VALUES (%s, %s, %s, %s, NOW(), %s) RETURNING id
-                """, (supplier_name, supplier_id, total_sum, total_qty, 'В процессе'))
-                order_id = self.db.cursor.fetchone()[0]
-                # 3.3. Добавляем товары (позиции)
-                for idx, row in dialog.df.iterrows():
-                    name = str(row[name_col])
-                    try:
-                        price = float(row[price_col])
-                    except Exception:
-                        price = 0.0
-                    qty = 1
-                    if qty_col:
-                        try:
-                            qty = int(float(row[qty_col]))
-                        except Exception:
-                            qty = 1
-                    if not name or price <= 0 or qty <= 0:
-                        continue
-                    self.db.cursor.execute("""
-                        INSERT INTO pending_order_items (order_id, name, price, quantity, category)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (
-                        order_id,
-                        name,
-                        price,
-                        qty,
-                        row[col_map.get("Категория")] if "Категория" in col_map and col_map["Категория"] in row else "Без категории"
-                    ))
-                self.db.connection.commit()
-                QMessageBox.information(self, "Успех", f"Заказ успешно создан для поставщика: {supplier_name}")
-                self.show_supplier_orders()
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, "Ошибка", f"Не удалось создать заказ: {e}") 
+            df = dialog.df
+            # Проверяем, что выбранные столбцы существуют
+            if any(col and col not in df.columns for col in (name_col, price_col, qty_col, category_col)):
+                QMessageBox.critical(self, "Ошибка", "Проверьте сопоставление колонок! Возможно, выбран пустой или несуществующий столбец.")
+                return
+            # 3. Строки заказа целиком уходят в базу, разбор и проверка — на стороне SQL
+            order_rows = pd.DataFrame({
+                'name': df[name_col],
+                'price': df[price_col],
+                'quantity': df[qty_col] if qty_col else None,
+                'category': df[category_col] if category_col else DEFAULT_CATEGORY,
+            }).astype(object)
+            order_rows = order_rows.where(order_rows.notna(), None)
+            if category_col:
+                order_rows['category'] = order_rows['category'].fillna(DEFAULT_CATEGORY)
+            result = self.db.create_pending_order(
+                order_rows.itertuples(index=False, name=None), supplier_id, supplier_name, 'В процессе'
+            )
+            if result is None:
+                QMessageBox.critical(self, "Ошибка", "Не удалось создать заказ")
+                return
+            if result["order_id"] is None:
+                QMessageBox.warning(self, "Ошибка", "В файле нет строк с названием, ценой и количеством для заказа")
+                return
+            QMessageBox.information(
+                self, "Успех",
+                f"Заказ успешно создан для поставщика: {supplier_name}\n"
+                f"Позиций: {result['inserted']}, пропущено строк: {result['rejected']}"
+            )
+            self.show_supplier_orders()
 
     def mark_order_received(self):
-        selected = self.products_table.selectedItems()
+        selected = self.orders_table.selectedItems()
         if not selected:
             QMessageBox.warning(self, "Внимание", "Выберите заказ для отметки поступления!")
             return
         row = selected[0].row()
-        order_id = self.products_table.item(row, 0).text()
-        try:
-            # Получаем все товары по заказу
-            self.db.cursor.execute("SELECT name, price, quantity, category FROM pending_order_items WHERE order_id = %s", (order_id,))
-            items = self.db.cursor.fetchall()
-            for name, price, qty, category in items:
-                # Проверяем наличие товара по штрихкоду или названию
-                self.db.cursor.execute("SELECT id, quantity FROM products WHERE name = %s OR barcode = %s", (name, name))
-                product = self.db.cursor.fetchone()
-                if product:
-                    # Товар есть, увеличиваем количество
-                    prod_id, old_qty = product
-                    new_qty = int(old_qty) + int(qty)
-                    self.db.cursor.execute("UPDATE products SET quantity = %s WHERE id = %s", (new_qty, prod_id))
-                    
-                    # Записываем движение товара
-                    self.db.add_product_movement(
-                        product_id=prod_id,
-                        movement_type='IN',
-                        quantity=int(qty),
-                        username=self.username,
-                        comment=f'Поступление по заказу #{order_id}'
-                    )
-                else:
-                    # Товара нет — открываем AddProductDialog с автозаполнением
-                    dialog = AddProductDialog(self.db, self)
-                    dialog.name_input.setText(str(name))
-                    dialog.price_input.setText(str(price))
-                    dialog.quantity_input.setValue(int(qty))
-                    dialog.category_combo.setCurrentText(str(category))
-                    # barcode оставляем пустым, пользователь может ввести
-                    if dialog.exec_() == QDialog.Accepted:
-                        product_data = dialog.get_product_data()
-                        self.db.cursor.execute(
-                            """INSERT INTO products (name, price, quantity, barcode, category) 
-                               VALUES (%s, %s, %s, %s, %s) RETURNING id""",
-                            (
-                                product_data['name'],
-                                product_data['price'],
-                                product_data['quantity'],
-                                product_data['barcode'],
-                                product_data['category']
-                            )
-                        )
-                        product_id = self.db.cursor.fetchone()[0]
-                        
-                        # Записываем движение товара
-                        self.db.add_product_movement(
-                            product_id=product_id,
-                            movement_type='IN',
-                            quantity=int(product_data['quantity']),
-                            username=self.username,
-                            comment=f'Первое поступление по заказу #{order_id}'
-                        )
-            # После обработки всех товаров — отмечаем заказ как поступивший
-            self.db.cursor.execute("UPDATE pending_orders SET status = %s WHERE id = %s", ("Поступил", order_id))
-            self.db.connection.commit()
-            self.load_products()
-            QMessageBox.information(self, "Успех", "Заказ успешно отмечен как поступивший")
-        except Exception as e:
-            self.db.connection.rollback()
-            QMessageBox.critical(self, "Ошибка", f"Не удалось обработать поступление заказа: {str(e)}")
+        order_id = self.orders_table.item(row, 0).text()
+        result = self.db.receive_pending_order(order_id, self.username)
+        if result is None:
+            QMessageBox.critical(self, "Ошибка", "Не удалось обработать поступление заказа (возможно, он уже принят)")
+            return
+        self.load_products()
+        QMessageBox.information(
+            self, "Успех",
+            f"Заказ успешно отмечен как поступивший\n"
+            f"Пополнено товаров: {result['updated']}, новых товаров: {result['inserted']}, "
+            f"пропущено позиций: {result['rejected']}"
+        )
 
     def create_low_stock_report(self):
         import pandas as pd
@@ -1285,11 +1190,8 @@ class WarehousePage(QWidget):
             QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить отчёт: {e}") 
 
     def show_movement_history(self):
-        selected_rows = self.products_table.selectedItems()
-        product_id = None
-        if selected_rows:
-            row = selected_rows[0].row()
-            product_id = int(self.products_table.item(row, 0).text())
+        product = self.selected_product()
+        product_id = product[0] if product is not None else None
         
         from app_code.dialogs import ProductMovementHistoryDialog
         dialog = ProductMovementHistoryDialog(self.db, product_id, self)
@@ -1336,8 +1238,9 @@ class WarehousePage(QWidget):
         vbox.addWidget(label)
         category_list = QListWidget()
         category_list.setSelectionMode(QListWidget.MultiSelection)
-        self.db.cursor.execute("SELECT name FROM categories ORDER BY name")
-        categories = [row[0] for row in self.db.cursor.fetchall()]
+        with self.db.transaction() as cur:
+            cur.execute("SELECT name FROM categories ORDER BY name")
+            categories = [row[0] for row in cur.fetchall()]
         for cat in categories:
             item = QListWidgetItem(cat)
             item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
@@ -1365,12 +1268,13 @@ class WarehousePage(QWidget):
         from openpyxl.styles import Font, Alignment, Border, Side
         # Получаем товары выбранных категорий
         placeholders = ','.join(['%s'] * len(selected_categories))
-        self.db.cursor.execute(f"""
-            SELECT name, category, quantity FROM products
-            WHERE category IN ({placeholders})
-            ORDER BY category, name
-        """, tuple(selected_categories))
-        products = self.db.cursor.fetchall()
+        with self.db.transaction() as cur:
+            cur.execute(f"""
+                SELECT name, category, quantity FROM products
+                WHERE category IN ({placeholders})
+                ORDER BY category, name
+            """, tuple(selected_categories))
+            products = cur.fetchall()
         if not products:
             QMessageBox.information(self, "Отчёт", "Нет товаров для выбранных категорий!")
             return
@@ -1424,17 +1328,17 @@ class WarehousePage(QWidget):
         text, ok = QInputDialog.getText(self, "Добавить категорию", "Введите название новой категории:")
         if ok and text.strip():
             try:
-                self.db.cursor.execute("INSERT INTO categories (name) VALUES (%s)", (text.strip(),))
-                self.db.connection.commit()
+                with self.db.transaction() as cur:
+                    cur.execute("INSERT INTO categories (name) VALUES (%s)", (text.strip(),))
                 QMessageBox.information(self, "Успех", f"Категория '{text.strip()}' успешно добавлена!")
                 self.load_products()
             except Exception as e:
-                self.db.connection.rollback()
                 QMessageBox.critical(self, "Ошибка", f"Не удалось добавить категорию: {e}")
 
     def show_delete_category_dialog(self):
-        self.db.cursor.execute("SELECT name FROM categories ORDER BY name")
-        categories = [row[0] for row in self.db.cursor.fetchall()]
+        with self.db.transaction() as cur:
+            cur.execute("SELECT name FROM categories ORDER BY name")
+            categories = [row[0] for row in cur.fetchall()]
         if not categories:
             QMessageBox.information(self, "Удаление категории", "Нет категорий для удаления.")
             return
@@ -1443,13 +1347,13 @@ class WarehousePage(QWidget):
             reply = QMessageBox.question(self, "Подтверждение", f"Удалить категорию '{item}'? Все товары с этой категорией останутся без категории.", QMessageBox.Yes | QMessageBox.No)
             if reply == QMessageBox.Yes:
                 try:
-                    self.db.cursor.execute("UPDATE products SET category=NULL WHERE category=%s", (item,))
-                    self.db.cursor.execute("DELETE FROM categories WHERE name=%s", (item,))
-                    self.db.connection.commit()
+                    with self.db.transaction() as cur:
+                        cur.execute("UPDATE products SET category=NULL WHERE category=%s", (item,))
+                        cur.execute("DELETE FROM categories WHERE name=%s", (item,))
+                    self.db.invalidate_category_min_quantities()
                     QMessageBox.information(self, "Успех", f"Категория '{item}' удалена.")
                     self.load_products()
                 except Exception as e:
-                    self.db.connection.rollback()
                     QMessageBox.critical(self, "Ошибка", f"Не удалось удалить категорию: {e}") 
 
     def show_revenue_report_dialog(self):
@@ -1491,14 +1395,16 @@ class WarehousePage(QWidget):
             QMessageBox.warning(self, "Ошибка", "Неизвестный период!")
             return
         # Получаем продажи за период с закупочной и розничной ценой
-        self.db.cursor.execute("""
-            SELECT sh.sale_date, sh.product_name, sh.quantity, sh.sale_price, p.purchase_price, p.retail_price
-            FROM sales_history sh
-            LEFT JOIN products p ON sh.product_name = p.name
-            WHERE sh.sale_date::date >= %s
-            ORDER BY sh.sale_date
-        """, (str(start),))
-        sales = self.db.cursor.fetchall()
+        with self.db.transaction() as cur:
+            cur.execute("""
+                SELECT sh.sale_date::timestamp, COALESCE(p.name, sh.product_name), sh.quantity, sh.sale_price,
+                       sh.purchase_price, p.retail_price
+                FROM sales_history sh
+                LEFT JOIN products p ON p.id = sh.product_id
+                WHERE sh.sale_date >= %s
+                ORDER BY sh.sale_date
+            """, (start,))
+            sales = cur.fetchall()
         if not sales:
             QMessageBox.information(self, "Отчёт по выручке", "Нет продаж за выбранный период.")
             return
@@ -1553,30 +1459,8 @@ class WarehousePage(QWidget):
         dialog.barcode_input.setFocus()
         if dialog.exec_() == QDialog.Accepted:
             product_data = dialog.get_product_data()
-            try:
-                self.db.cursor.execute("""
-                    INSERT INTO products (name, price, quantity, barcode, category, purchase_price, retail_price)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
-                """, (
-                    product_data['name'],
-                    product_data['price'],
-                    product_data['quantity'],
-                    product_data['barcode'],
-                    product_data['category'],
-                    product_data['purchase_price'],
-                    product_data['retail_price']
-                ))
-                product_id = self.db.cursor.fetchone()[0]
-                self.db.add_product_movement(
-                    product_id=product_id,
-                    movement_type='IN',
-                    quantity=int(product_data['quantity']),
-                    username=self.username,
-                    comment=f'Поступление по штрихкоду'
-                )
-                self.db.connection.commit()
+            if self.db.add_product(product_data, self.username, comment='Поступление по штрихкоду'):
                 self.load_products()
                 QMessageBox.information(self, "Успех", "Товар успешно добавлен по штрихкоду")
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, "Ошибка", f"Не удалось добавить товар: {str(e)}") 
\ No newline at end of file
+            else:
+                QMessageBox.critical(self, "Ошибка", "Не удалось добавить товар (возможно, такое название уже есть)")
\ No newline at end of file
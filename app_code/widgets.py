@@ -5,6 +5,7 @@ from PyQt5.QtCore import (QRect, QPropertyAnimation,
 from PyQt5.QtGui import QPainter, QPainterPath, QPixmap
 from PyQt5.QtCore import pyqtSignal
 from app_code.animations import SlideAnimation, HoverAnimation
+from app_code.product_images import ProductImageService, CARD_THUMB
 
 class SlideMenu(QFrame):
     logout_requested = pyqtSignal()
@@ -176,11 +177,33 @@ class ProductCard(HoverFrame):
     delete_requested = pyqtSignal(object)
     add_to_cart_requested = pyqtSignal(object)
 
-    def __init__(self, product, role, parent=None):
+    def __init__(self, product=None, role=None, parent=None):
         super().__init__(parent)
-        self.product = product
+        self.product = None
         self.role = role
         self.setup_ui()
+        # Подписка одна на всё время жизни карточки: при повторном
+        # использовании меняется только привязанный товар
+        ProductImageService.instance().ready.connect(self.on_thumbnail_ready)
+        if product is not None:
+            self.set_product(product)
+
+    def set_product(self, product):
+        """Привязывает карточку к товару без пересоздания виджетов"""
+        self.product = product
+        self.name_label.setText(product["name"])
+        self.category_label.setText(product["category"])
+        self.purchase_label.setVisible(bool(product.get('purchase_price')))
+        if product.get('purchase_price'):
+            self.purchase_label.setText(f"Закупочная: {product['purchase_price']} ₽")
+        # Всегда приоритетно показываем retail_price, если есть
+        if product.get('retail_price'):
+            self.price_label.setText(f"Розничная: {product['retail_price']} ₽")
+        elif product.get('price'):
+            self.price_label.setText(f"{product['price']} ₽")
+        self.price_label.setVisible(bool(product.get('retail_price') or product.get('price')))
+        self.quantity_label.setText(f"{product['quantity']} шт.")
+        self.update_image()
         
     def setup_ui(self):
         self.setMinimumWidth(270)
@@ -203,52 +226,53 @@ class ProductCard(HoverFrame):
             self.setup_user_button()
     
     def setup_image_container(self, layout):
-        image_frame = QFrame()
-        image_frame.setFixedHeight(150)
-        # По умолчанию фон прозрачный, если есть изображение, иначе — #454862
-        has_image = False
-        if self.product["image"]:
-            pixmap = QPixmap(self.product["image"])
-            if not pixmap.isNull():
-                has_image = True
-        if has_image:
-            image_frame.setStyleSheet("""
-                QFrame {
-                    background-color: transparent;
-                    border-radius: 8px;
-                }
-            """)
-        else:
-            image_frame.setStyleSheet("""
-                QFrame {
-                    background-color: #454862;
-                    border-radius: 8px;
-                }
-            """)
-
-        image_layout = QVBoxLayout(image_frame)
+        self.image_frame = QFrame()
+        self.image_frame.setFixedHeight(150)
+
+        image_layout = QVBoxLayout(self.image_frame)
         image_layout.setContentsMargins(0, 0, 0, 0)
         image_layout.setSpacing(0)
 
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        image_layout.addWidget(self.image_label)
+        layout.addWidget(self.image_frame)
 
-        if has_image:
-            scaled_pixmap = pixmap.scaled(
-                200, 130,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            rounded = self.set_rounded_pixmap(scaled_pixmap, 8)
-            self.image_label.setPixmap(rounded)
-        else:
+    def update_image(self):
+        if not self.product["image"]:
             self.set_no_image_label()
+            return
+        pixmap = ProductImageService.instance().get(self.product["image"], CARD_THUMB)
+        if pixmap is None:
+            # Пока миниатюра готовится, виден фон-заглушка #454862
+            self.set_image_frame_background("#454862")
+            self.image_label.clear()
+        else:
+            self.set_thumbnail(pixmap)
 
-        image_layout.addWidget(self.image_label)
-        layout.addWidget(image_frame)
+    def on_thumbnail_ready(self, path, width, height, pixmap):
+        if self.product is not None and path == self.product["image"] and (width, height) == CARD_THUMB[:2]:
+            self.set_thumbnail(pixmap)
+
+    def set_thumbnail(self, pixmap):
+        if pixmap.isNull():
+            self.set_no_image_label()
+            return
+        self.set_image_frame_background("transparent")
+        self.image_label.setPixmap(pixmap)
+
+    def set_image_frame_background(self, color):
+        self.image_frame.setStyleSheet(f"""
+            QFrame {{
+                background-color: {color};
+                border-radius: 8px;
+            }}
+        """)
 
     def set_no_image_label(self):
+        self.set_image_frame_background("#454862")
+        self.image_label.clear()
         self.image_label.setText("Нет изображения")
         self.image_label.setStyleSheet("""
             QLabel {
@@ -259,8 +283,8 @@ class ProductCard(HoverFrame):
         """)
 
     def setup_product_info(self, layout):
-        name_label = QLabel(self.product["name"])
-        name_label.setStyleSheet("""
+        self.name_label = QLabel()
+        self.name_label.setStyleSheet("""
             QLabel {
                 font-size: 16px;
                 font-weight: bold;
@@ -268,11 +292,11 @@ class ProductCard(HoverFrame):
                 margin-bottom: 5px;
             }
         """)
-        name_label.setWordWrap(True)
-        layout.addWidget(name_label)
+        self.name_label.setWordWrap(True)
+        layout.addWidget(self.name_label)
         
-        category_label = QLabel(self.product["category"])
-        category_label.setStyleSheet("""
+        self.category_label = QLabel()
+        self.category_label.setStyleSheet("""
             QLabel {
                 font-size: 18px;
                 color: #aaa;
@@ -282,31 +306,25 @@ class ProductCard(HoverFrame):
                 margin-bottom: 8px;
             }
         """)
-        category_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(category_label)
+        self.category_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.category_label)
         
         details_frame = QFrame()
         details_layout = QVBoxLayout(details_frame)
         details_layout.setContentsMargins(0, 0, 0, 0)
         details_layout.setSpacing(2)
         # Закупочная цена
-        if self.product.get('purchase_price'):
-            purchase_label = QLabel(f"Закупочная: {self.product['purchase_price']} ₽")
-            purchase_label.setStyleSheet("color: #aaa; font-size: 14px;")
-            details_layout.addWidget(purchase_label)
-        # Всегда приоритетно показываем retail_price, если есть
-        if self.product.get('retail_price'):
-            retail_label = QLabel(f"Розничная: {self.product['retail_price']} ₽")
-            retail_label.setStyleSheet("color: #28a745; font-size: 16px; font-weight: bold;")
-            details_layout.addWidget(retail_label)
-        elif self.product.get('price'):
-            price_label = QLabel(f"{self.product['price']} ₽")
-            price_label.setStyleSheet("color: #28a745; font-size: 16px; font-weight: bold;")
-            details_layout.addWidget(price_label)
+        self.purchase_label = QLabel()
+        self.purchase_label.setStyleSheet("color: #aaa; font-size: 14px;")
+        details_layout.addWidget(self.purchase_label)
+        # Розничная цена, а если её нет — цена товара
+        self.price_label = QLabel()
+        self.price_label.setStyleSheet("color: #28a745; font-size: 16px; font-weight: bold;")
+        details_layout.addWidget(self.price_label)
         # Количество
-        quantity_label = QLabel(f"{self.product['quantity']} шт.")
-        quantity_label.setStyleSheet("font-size: 14px; color: #6c757d;")
-        details_layout.addWidget(quantity_label)
+        self.quantity_label = QLabel()
+        self.quantity_label.setStyleSheet("font-size: 14px; color: #6c757d;")
+        details_layout.addWidget(self.quantity_label)
         layout.addWidget(details_frame)
     
     def setup_admin_buttons(self):
@@ -0,0 +1,159 @@
+"""Замер таблицы товаров склада: старая QTableWidget против модели с прокси.
+
+Запуск из корня проекта:
+    QT_QPA_PLATFORM=offscreen python benchmarks/products_table.py
+    QT_QPA_PLATFORM=offscreen python benchmarks/products_table.py --rows 1000 10000 100000 --legacy-limit 10000
+
+Для каждого размера выводится время загрузки, сортировки, фильтра и
+прокрутки, а также прирост памяти Python (tracemalloc).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QApplication, QTableWidget, QTableWidgetItem, QTableView
+
+from app_code.product_table_model import (ProductTableModel, ProductFilterProxyModel, PRODUCT_COLUMNS,
+                                          NAME_COLUMN, QUANTITY_COLUMN)
+
+CATEGORIES = ["Напитки", "Молочные продукты", "Бакалея", "Заморозка", "Хозтовары", "Кондитерские изделия"]
+MIN_QUANTITIES = {category: 10 for category in CATEGORIES}
+
+
+def make_rows(count, seed=42):
+    """Синтетические строки в формате запроса WarehousePage.load_products"""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        purchase = round(rnd.uniform(10, 5000), 2)
+        rows.append((
+            i + 1,
+            f"Товар {rnd.randint(0, count)} {rnd.choice(CATEGORIES).lower()} упаковка {i}",
+            str(4600000000000 + i),
+            purchase,
+            round(purchase * 1.3, 2) if i % 50 else None,
+            rnd.randint(0, 200),
+            rnd.choice(CATEGORIES),
+        ))
+    return rows
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def scroll(app, view):
+    """Прокрутка до конца и обратно с отрисовкой"""
+    bar = view.verticalScrollBar()
+    for value in (bar.maximum() // 2, bar.maximum(), 0):
+        bar.setValue(value)
+        view.viewport().repaint()
+        app.processEvents()
+
+
+def bench_legacy(app, rows):
+    """Прежний вариант: QTableWidgetItem на каждую ячейку и resizeRowsToContents"""
+    table = QTableWidget()
+    table.setColumnCount(len(PRODUCT_COLUMNS))
+    table.setHorizontalHeaderLabels(PRODUCT_COLUMNS)
+    table.resize(1200, 800)
+    table.show()
+
+    def fill(products):
+        table.setRowCount(len(products))
+        for row, product in enumerate(products):
+            for col, value in enumerate(product):
+                item = QTableWidgetItem(str(value))
+                if col == 1:
+                    item.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+                    item.setFlags(item.flags() | Qt.ItemIsEditable)
+                    item.setData(Qt.TextWordWrap, True)
+                    item.setToolTip(str(value))
+                table.setItem(row, col, item)
+            if int(product[5]) <= MIN_QUANTITIES[product[6]]:
+                for col in range(table.columnCount()):
+                    table.item(row, col).setBackground(QColor("#ff6b6b"))
+        table.resizeRowsToContents()
+        app.processEvents()
+
+    tracemalloc.start()
+    result = {'load': timed(lambda: fill(rows))}
+    result['memory'] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    result['sort'] = timed(lambda: fill(sorted(rows, key=lambda x: int(x[5]), reverse=True)))
+    result['filter'] = timed(lambda: fill([row for row in rows if "упаковка 1" in row[1].lower()]))
+    result['scroll'] = timed(lambda: scroll(app, table))
+    table.close()
+    return result
+
+
+def bench_model(app, rows):
+    """Новый вариант: ProductTableModel + ProductFilterProxyModel + QTableView"""
+    model = ProductTableModel()
+    proxy = ProductFilterProxyModel()
+    proxy.setSourceModel(model)
+    view = QTableView()
+    view.setModel(proxy)
+    view.verticalHeader().setDefaultSectionSize(64)
+    view.resize(1200, 800)
+    view.show()
+
+    # Набор low_stock_products, который в базе ведут триггеры
+    low_stock_ids = {row[0] for row in rows if row[5] < MIN_QUANTITIES[row[6]]}
+
+    def load():
+        model.set_products(rows, low_stock_ids, NAME_COLUMN, Qt.AscendingOrder)
+        proxy.set_filters()
+        app.processEvents()
+
+    def sort():
+        proxy.sort(QUANTITY_COLUMN, Qt.DescendingOrder)
+        app.processEvents()
+
+    def filter_rows():
+        proxy.set_filters("упаковка 1")
+        app.processEvents()
+
+    tracemalloc.start()
+    result = {'load': timed(load)}
+    result['memory'] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    result['sort'] = timed(sort)
+    result['filter'] = timed(filter_rows)
+    result['scroll'] = timed(lambda: scroll(app, view))
+    view.close()
+    return result
+
+
+def print_result(name, count, result):
+    print(f"{name:<8} {count:>8}  загрузка {result['load']:8.3f} с  сортировка {result['sort']:8.3f} с  "
+          f"фильтр {result['filter']:8.3f} с  прокрутка {result['scroll']:8.3f} с  "
+          f"память {result['memory'] / 1024 / 1024:8.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-limit', type=int, default=100000,
+                        help="не замерять QTableWidget на таблицах больше этого размера")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    for count in args.rows:
+        rows = make_rows(count)
+        if count <= args.legacy_limit:
+            print_result("widget", count, bench_legacy(app, rows))
+        print_result("model", count, bench_model(app, rows))
+
+
+if __name__ == '__main__':
+    main()
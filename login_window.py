@@ -37,11 +37,11 @@ def register_user(username, password, role, email, db=None):
         print(f"Сгенерированная соль: {salt}")
         print(f"Хеш пароля: {hashed_password.decode('utf-8')}")
         
-        db.cursor.execute(
-            "INSERT INTO users (username, password, role, email) VALUES (%s, %s, %s, %s)",
-            (username, hashed_password.decode('utf-8'), role.lower(), email)
-        )
-        db.connection.commit()
+        with db.transaction() as cur:
+            cur.execute(
+                "INSERT INTO users (username, password, role, email) VALUES (%s, %s, %s, %s)",
+                (username, hashed_password.decode('utf-8'), role.lower(), email)
+            )
         print("Пользователь успешно зарегистрирован!")
         return True
     except Exception as e:
@@ -63,11 +63,12 @@ def authenticate_user(login_or_email, password, db=None):
         print(f"Логин/Email: {login_or_email}")
         
         # Получаем пользователя по логину или email
-        db.cursor.execute( 
-            "SELECT username, password, role FROM users WHERE username = %s OR email = %s",
-            (login_or_email, login_or_email)
-        )
-        user = db.cursor.fetchone()
+        with db.transaction() as cur:
+            cur.execute(
+                "SELECT username, password, role FROM users WHERE username = %s OR email = %s",
+                (login_or_email, login_or_email)
+            )
+            user = cur.fetchone()
         
         if user:
             print(f"Найден пользователь: {user[0]}")
@@ -148,7 +149,7 @@ class RegisterWindow(QWidget):
         self.setWindowTitle("Регистрация")
         self.setFixedSize(400, 450)
         self.setAttribute(Qt.WA_TranslucentBackground)
-        self.db = DatabaseManager()  # Создаем одно соединение для всего окна
+        self.db = DatabaseManager()  # Соединения берутся из общего пула
         self.setup_ui()
         self.setup_animations()
 
@@ -297,7 +298,7 @@ class LoginWindow(QWidget):
         self.setWindowFlags(Qt.FramelessWindowHint)
         self.setAttribute(Qt.WA_TranslucentBackground)
         self.setFixedSize(600, 500)
-        self.db = DatabaseManager()  # Создаем одно соединение для всего окна
+        self.db = DatabaseManager()  # Соединения берутся из общего пула
         self.setup_ui()
         self.setup_animations()
         self.load_remembered()